@@ -39,6 +39,103 @@ if MISTRAL_API_KEY:
 else:
     print("MISTRAL_API_KEY introuvable dans .env - mode démo activé")
 
+# Limite de débit partagée par tous les processus pour les appels Mistral
+# (requêtes/seconde, rafale, requêtes simultanées ; voir games/rate_limit.py)
+MISTRAL_RATE_LIMIT = {
+    'RATE': float(os.getenv('MISTRAL_RATE_PER_SECOND', '1')),
+    'BURST': 5,
+    'MAX_IN_FLIGHT': int(os.getenv('MISTRAL_MAX_IN_FLIGHT', '8')),
+}
+
+# Disjoncteur partagé par tous les processus : au-delà de ERROR_RATE d'échecs (ou d'appels
+# plus longs que SLOW_CALL secondes), les appels passent au contenu de secours pendant
+# OPEN_DURATION secondes (voir games/circuit_breaker.py)
+MISTRAL_CIRCUIT_BREAKER = {
+    'WINDOW': 60,
+    'MIN_CALLS': 5,
+    'ERROR_RATE': float(os.getenv('MISTRAL_CIRCUIT_ERROR_RATE', '0.5')),
+    # Seuil pour SLOW_CALL_TOKENS jetons demandés, proportionnel au-delà ; délai du premier fragment en streaming
+    'SLOW_CALL': float(os.getenv('MISTRAL_CIRCUIT_SLOW_CALL', '30')),
+    'SLOW_CALL_TOKENS': int(os.getenv('MISTRAL_CIRCUIT_SLOW_CALL_TOKENS', '1000')),
+    'OPEN_DURATION': float(os.getenv('MISTRAL_CIRCUIT_OPEN_DURATION', '30')),
+}
+
+# Requête doublée quand la réponse (ou, en streaming, son premier fragment) tarde
+# au-delà du p95 des durées observées (voir games/hedging.py)
+MISTRAL_HEDGING = {
+    'ENABLED': os.getenv('MISTRAL_HEDGING_ENABLED', '1') == '1',
+    'PERCENTILE': 95,
+}
+
+# Routes (fournisseur:modèle) candidates pour chaque étape de la génération : chaque appel
+# part vers celle qui a le meilleur p95 et le moins d'erreurs récemment (voir games/providers.py).
+# Fournisseurs : 'mistral', et 'local' (contenu de démo déterministe, sans appel réseau)
+TEXT_ROUTING = {
+    'DEFAULT': ['mistral:mistral-small-latest'],
+    'PHASES': {
+        # Étape courte : un modèle plus rapide est mis en concurrence avec le modèle par défaut
+        'title': ['mistral:ministral-8b-latest', 'mistral:mistral-small-latest'],
+    },
+}
+
+# max_tokens de chaque étape déduit des longueurs de réponse observées : p99 avec 25 % de marge,
+# entre la moitié et le double de la valeur par défaut (voir games/budget.py)
+TOKEN_BUDGET = {
+    'ENABLED': os.getenv('TOKEN_BUDGET_ENABLED', '1') == '1',
+    'PERCENTILE': 99,
+    'HEADROOM': 1.25,
+}
+
+# Cache des réponses de l'API de complétion (mémoire puis base ; voir games/completion_cache.py)
+COMPLETION_CACHE = {
+    'ENABLED': os.getenv('COMPLETION_CACHE_ENABLED', '1') == '1',
+    'TTL': int(os.getenv('COMPLETION_CACHE_TTL', str(7 * 24 * 3600))),
+    'TIERS': ['memory', 'database'],
+    'MEMORY_MAX_ENTRIES': 500,
+    'DB_MAX_ENTRIES': 20000,
+    'DB_EVICT_EVERY': 100,
+}
+
+# Regroupement des appels identiques en cours ; CROSS_PROCESS active le verrou en base
+# partagé par tous les processus (voir games/single_flight.py)
+COMPLETION_SINGLE_FLIGHT = {
+    'CROSS_PROCESS': os.getenv('COMPLETION_SINGLE_FLIGHT_CROSS_PROCESS', '1') == '1',
+    'LOCK_TIMEOUT': 180,
+}
+
+# Mode de génération par défaut : 'chained' (un appel par étape) ou 'bundle'
+# (titre, univers, scénario, personnages et lieux en une seule complétion)
+GENERATION_MODE = os.getenv('GENERATION_MODE', 'chained')
+
+# Délai (secondes) sans signe de vie du worker au-delà duquel une tâche 'running' est
+# considérée comme abandonnée et remise en file ; elle reprend à ses points de reprise
+GENERATION_JOB_STALE_AFTER = int(os.getenv('GENERATION_JOB_STALE_AFTER', '900'))
+# Intervalle (secondes) des signes de vie d'une tâche en cours d'exécution
+GENERATION_JOB_HEARTBEAT = int(os.getenv('GENERATION_JOB_HEARTBEAT', '30'))
+
+# Réserve de jeux aléatoires pré-générés (commande fill_random_pool, voir games/pool.py)
+RANDOM_GAME_POOL = {
+    'SIZE': int(os.getenv('RANDOM_GAME_POOL_SIZE', '10')),
+    'OFF_PEAK_HOURS': (int(os.getenv('RANDOM_GAME_POOL_START', '1')), int(os.getenv('RANDOM_GAME_POOL_END', '7'))),
+}
+
+# En-têtes de cache HTTP : pages des jeux publics (ETag, Last-Modified) et
+# visuels générés, jamais réécrits (voir games/http_cache.py). MEDIA_MAX_AGE ne
+# s'applique qu'aux médias servis par Django (DEBUG) : en production, le serveur
+# frontal qui sert MEDIA_ROOT pose les en-têtes immutable sur concept_arts/
+HTTP_CACHE = {
+    'PAGE_MAX_AGE': int(os.getenv('HTTP_CACHE_PAGE_MAX_AGE', '60')),
+    'MEDIA_MAX_AGE': 365 * 24 * 3600,
+}
+
+# Fragments HTML des jeux (cartes, page de détail) mis en cache, invalidés par
+# la version du jeu (voir games/fragments.py) ; CACHE est un alias de CACHES
+FRAGMENT_CACHE = {
+    'ENABLED': os.getenv('FRAGMENT_CACHE_ENABLED', '1') == '1',
+    'CACHE': 'default',
+    'TTL': int(os.getenv('FRAGMENT_CACHE_TTL', str(24 * 3600))),
+}
+
 
 
 # Quick-start development settings - unsuitable for production
@@ -102,6 +199,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Workers et threads de génération écrivent en parallèle (appels API, mesures, cache) :
+        # les transactions prennent le verrou d'écriture dès le début et attendent leur tour,
+        # au lieu d'échouer aussitôt sur « database is locked »
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
+from games.http_cache import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -9,5 +10,10 @@ urlpatterns = [
 ]
 
 # Configuration pour servir les fichiers media en développement
+# (en production, le serveur frontal sert MEDIA_ROOT et ses en-têtes de cache : voir games/http_cache.py)
 if settings.DEBUG:
+    urlpatterns += [
+        # Visuels générés : cache long et immutable
+        re_path(rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>concept_arts/.*)$", serve_media),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Game, Universe, Scenario, Character, Location, ConceptArt, Favorite, GenerationLimit
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from .models import Game, Universe, Scenario, Character, Location, ConceptArt, Favorite, GenerationLimit, GenerationJob, AIAgent, CachedCompletion, APICall
 
 
 @admin.register(Game)
@@ -48,9 +50,72 @@ class FavoriteAdmin(admin.ModelAdmin):
 
 @admin.register(GenerationLimit)
 class GenerationLimitAdmin(admin.ModelAdmin):
-    list_display = ['user', 'generations_today', 'daily_count', 'last_reset'] 
+    list_display = ['user', 'generations_today', 'daily_count', 'regenerations_today', 'daily_regeneration_count',
+                    'daily_token_limit', 'last_reset'] 
     list_filter = ['last_reset']
     search_fields = ['user__username']
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user')
\ No newline at end of file
+        return super().get_queryset(request).select_related('user')
+
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'kind', 'status', 'phase', 'quota_state', 'game', 'worker', 'date_creation', 'finished_at')
+    list_filter = ('status', 'kind', 'quota_state', 'date_creation')
+    search_fields = ('user__username', 'error')
+    raw_id_fields = ('game',)
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user', 'game')
+
+
+
+@admin.register(AIAgent)
+class AIAgentAdmin(admin.ModelAdmin):
+    list_display = ('nom', 'model', 'agent_id', 'date_creation')
+
+
+@admin.register(CachedCompletion)
+class CachedCompletionAdmin(admin.ModelAdmin):
+    list_display = ('key', 'expires_at', 'last_used')
+    search_fields = ('key', 'response')
+
+
+@admin.register(APICall)
+class APICallAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'user', 'game', 'phase', 'model', 'prompt_tokens', 'completion_tokens', 'duration', 'attempts', 'success', 'hedge')
+    list_filter = ('phase', 'model', 'success', 'hedge', 'created_at')
+    search_fields = ('user__username', 'game__titre')
+    raw_id_fields = ('user', 'job', 'game')
+    date_hierarchy = 'created_at'
+    # Totaux quotidiens et étapes les plus coûteuses, sous la liste (voir change_list.html)
+    change_list_template = 'admin/games/apicall/change_list.html'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user', 'game')
+    
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        try:
+            calls = response.context_data['cl'].queryset
+        except (AttributeError, KeyError):
+            # Redirection ou erreur de filtre : pas de totaux
+            return response
+        
+        # Les totaux suivent les filtres de la liste
+        totals = dict(
+            calls=Count('id'),
+            sent=Sum('prompt_tokens'),
+            received=Sum('completion_tokens'),
+            tokens=Sum(F('prompt_tokens') + F('completion_tokens')),
+            seconds=Sum('duration'),
+        )
+        calls = calls.order_by()
+        response.context_data['daily_totals'] = (
+            calls.annotate(day=TruncDate('created_at')).values('day').annotate(**totals).order_by('-day')[:30]
+        )
+        response.context_data['phase_totals'] = (
+            calls.values('phase').annotate(**totals).order_by('-tokens')
+        )
+        return response
@@ -3,15 +3,225 @@ Service d'IA pour générer du contenu de jeu vidéo
 Utilise l'API Mistral AI pour le texte et les images
 """
 
+import asyncio
+import contextvars
+import inspect
 import os
 import json
 import random
-import re
+import threading
 import time
-from typing import Dict, List, Optional
-from mistralai import Mistral
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db import connection
+
+from .budget import TokenBudget, estimate_tokens, truncate_tokens
+from .circuit_breaker import CircuitBreaker, CircuitOpen
+from .completion_cache import CompletionCache
+from .hedging import Hedger
+from .providers import LocalProvider, MistralProvider, ProviderRouter, Route, emit_partial
+from .models import AIAgent, Universe, Character
+from .rate_limit import RateLimiter, RateLimitTimeout, backoff_delay
+from .single_flight import SingleFlight
+from .structured_output import SchemaError, decode as decode_json, partial_strings
+from .usage import add_usage, log_api_call, log_api_call_async
+
+
+# Contexte repris dans les prompts (description de l'univers), en jetons
+CONTEXT_TOKENS = 50
+SHORT_CONTEXT_TOKENS = 40
+COVER_CONTEXT_TOKENS = 60
+
+SYSTEM_PROMPT = "Tu es un créateur de jeux vidéo expert. Réponds de manière concise et créative en français."
+
+# Formes attendues des réponses en mode JSON (voir structured_output.py)
+UNIVERSE_SCHEMA = {
+    'type': 'object',
+    'required': ['description'],
+    'properties': {
+        'description': {'type': 'string'},
+        'style_graphique': {'type': 'string', 'enum': [key for key, label in Universe.STYLE_CHOICES]},
+        'type_monde': {'type': 'string', 'enum': [key for key, label in Universe.TYPE_CHOICES]},
+    },
+}
+
+SCENARIO_SCHEMA = {
+    'type': 'object',
+    'required': ['acte_1', 'acte_2', 'acte_3', 'twist'],
+    'properties': {
+        'acte_1': {'type': 'string'},
+        'acte_2': {'type': 'string'},
+        'acte_3': {'type': 'string'},
+        'twist': {'type': 'string'},
+    },
+}
+
+CHARACTERS_SCHEMA = {
+    'type': 'object',
+    'required': ['personnages'],
+    'properties': {
+        'personnages': {
+            'type': 'array',
+            'minItems': 1,
+            'items': {
+                'type': 'object',
+                'required': ['nom', 'background'],
+                'properties': {
+                    'nom': {'type': 'string'},
+                    'role': {'type': 'string', 'enum': [key for key, label in Character.ROLE_CHOICES]},
+                    'classe': {'type': 'string', 'enum': [key for key, label in Character.CLASSE_CHOICES]},
+                    'background': {'type': 'string'},
+                    'gameplay_description': {'type': 'string'},
+                },
+            },
+        },
+    },
+}
+
+LOCATIONS_SCHEMA = {
+    'type': 'object',
+    'required': ['lieux'],
+    'properties': {
+        'lieux': {
+            'type': 'array',
+            'minItems': 1,
+            'items': {
+                'type': 'object',
+                'required': ['nom', 'description'],
+                'properties': {
+                    'nom': {'type': 'string'},
+                    'description': {'type': 'string'},
+                },
+            },
+        },
+    },
+}
+
+# Titre, univers, scénario, personnages et lieux en une seule complétion (mode 'bundle')
+WORLD_BUNDLE_SCHEMA = {
+    'type': 'object',
+    'required': ['titre', 'univers', 'scenario', 'personnages', 'lieux'],
+    'properties': {
+        'titre': {'type': 'string'},
+        'univers': UNIVERSE_SCHEMA,
+        'scenario': SCENARIO_SCHEMA,
+        'personnages': CHARACTERS_SCHEMA['properties']['personnages'],
+        'lieux': LOCATIONS_SCHEMA['properties']['lieux'],
+    },
+}
+
+# Modes de génération d'un jeu complet (voir generate_full_game)
+GENERATION_MODES = [
+    ('chained', 'Étape par étape'),
+    ('bundle', 'Complétion unique'),
+]
+
+# Étapes produites par la complétion unique du mode 'bundle'
+BUNDLE_PHASES = ['title', 'universe', 'scenario', 'characters', 'locations']
+
+# Texte partiel (streaming) : champs masqués à l'affichage et sections du mode 'bundle'
+PARTIAL_HIDDEN_FIELDS = {'style_graphique', 'type_monde', 'role', 'classe'}
+BUNDLE_SECTIONS = {
+    'titre': 'title',
+    'univers': 'universe',
+    'scenario': 'scenario',
+    'personnages': 'characters',
+    'lieux': 'locations',
+}
+
+# Destination du texte reçu en streaming pour l'étape en cours (voir generate_full_game)
+_partial_sink: contextvars.ContextVar[Optional[Callable[[str], Any]]] = contextvars.ContextVar(
+    'gameforge_partial_sink', default=None
+)
+
+# Contenu de secours autorisé pour l'étape en cours (désactivé par generate_full_game(fallback=False))
+_fallback_allowed: contextvars.ContextVar[bool] = contextvars.ContextVar('gameforge_fallback_allowed', default=True)
+
+# Réponse toujours demandée à l'API, sans lire le cache (régénération d'une section)
+_cache_bypass: contextvars.ContextVar[bool] = contextvars.ContextVar('gameforge_cache_bypass', default=False)
+
+# Étape en cours (title, universe, ...) : choix du fournisseur et du modèle (voir providers.py)
+_current_phase: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('gameforge_current_phase', default=None)
+
+# Sections d'un jeu enregistré qui peuvent être régénérées seules (voir regenerate_section)
+REGENERABLE_SECTIONS = [
+    ('universe', 'Univers'),
+    ('scenario', 'Scénario'),
+    ('characters', 'Personnages'),
+    ('locations', 'Lieux'),
+    ('image', 'Image de couverture'),
+]
+SECTION_METHODS = {
+    'universe': 'generate_universe',
+    'scenario': 'generate_scenario',
+    'characters': 'generate_characters',
+    'locations': 'generate_locations',
+    'image': 'generate_and_save_image',
+}
+
+# Délais maximum (en secondes) accordés à chaque étape de la génération complète
+PHASE_TIMEOUTS = {
+    'bundle': 150,
+    'title': 30,
+    'universe': 60,
+    'scenario': 60,
+    'characters': 90,
+    'locations': 90,
+    'image': 180,
+}
+
+# Agent Mistral utilisé pour la génération d'images
+IMAGE_AGENT_NAME = "Game Image Generator"
+IMAGE_AGENT_MODEL = "mistral-medium-latest"
+IMAGE_AGENT_RETRY_DELAY = 600  # secondes avant de retenter une création échouée
+
+_service_instance = None
+_service_lock = threading.Lock()
+
+
+def get_ai_service() -> 'AIService':
+    """
+    Retourne le service IA du processus, créé au premier appel.
+    Le client Mistral (et son pool de connexions HTTP) est ainsi partagé
+    par toutes les requêtes et tous les threads du processus.
+    """
+    global _service_instance
+    if _service_instance is None:
+        with _service_lock:
+            if _service_instance is None:
+                _service_instance = AIService()
+    return _service_instance
+
+
+class GenerationPhaseError(Exception):
+    """Étapes en échec sans contenu de secours (generate_full_game avec fallback=False)"""
+
+    def __init__(self, errors: Dict[str, str]):
+        self.errors = errors
+        super().__init__("; ".join(f"{phase} : {error}" for phase, error in errors.items()))
+
+
+def readable_partial(phase: str, text: str) -> Dict[str, str]:
+    """
+    Texte lisible, par étape, d'une réponse en cours de streaming.
+    Les réponses JSON (éventuellement incomplètes) sont réduites à leurs valeurs ;
+    en mode 'bundle', chaque section est rattachée à son étape.
+    """
+    if not text.lstrip().startswith('{'):
+        return {phase: text.strip()}
+    
+    sections = {}
+    for path, value in partial_strings(text):
+        field = path[-1] if path else None
+        if field in PARTIAL_HIDDEN_FIELDS:
+            continue
+        target = BUNDLE_SECTIONS.get(path[0]) if phase == 'bundle' and path else phase
+        if target:
+            sections.setdefault(target, []).append(f"• {value}" if field == 'nom' else value)
+    return {key: "\n".join(lines) for key, lines in sections.items()}
 
 
 class AIService:
@@ -27,226 +237,394 @@ class AIService:
         if self.mistral_key:
             self.mistral_key = self.mistral_key.strip().lstrip('=')
         
-        # Initialiser le client Mistral
-        self.client = None
-        self.model = "mistral-small-latest"
-        self.image_agent = None
+        # Fournisseurs de texte : Mistral, et le contenu de démo local
+        self.mistral = MistralProvider(self.mistral_key)
+        self.local = LocalProvider()
+        self.providers = {provider.name: provider for provider in (self.mistral, self.local)}
+        
+        # Agent d'images : créé une seule fois puis réutilisé (voir image_agent_id)
+        self._image_agent_id = None
+        self._image_agent_retry_at = 0.0
+        self._image_agent_lock = threading.Lock()
         
         # Configuration retry pour gérer les erreurs 429
         self.max_retries = 3
         self.retry_delay = 2  # secondes
         
-        if self.mistral_key and len(self.mistral_key) > 10:
-            try:
-                self.client = Mistral(api_key=self.mistral_key)
-                print(f"✅ Client Mistral initialisé avec la clé : {self.mistral_key[:8]}...")
-                
-                # Créer un agent pour la génération d'images
-                try:
-                    self.image_agent = self.client.beta.agents.create(
-                        model="mistral-medium-latest",
-                        name="Game Image Generator",
-                        description="Agent spécialisé dans la génération d'images conceptuelles pour jeux vidéo",
-                        instructions="Tu es un artiste conceptuel expert en jeux vidéo. Génère des images épiques et professionnelles qui capturent l'essence des univers de jeux.",
-                        tools=[{"type": "image_generation"}],
-                        completion_args={
-                            "temperature": 0.7,
-                            "top_p": 0.95,
-                        }
-                    )
-                    print(f"✅ Agent de génération d'images créé: {self.image_agent.id}")
-                except Exception as e:
-                    print(f"⚠️ Impossible de créer l'agent d'images (peut-être pas activé sur votre compte): {e}")
-                    self.image_agent = None
-                    
-            except Exception as e:
-                print(f"❌ Erreur initialisation client Mistral: {e}")
-                self.client = None
-        else:
+        # Débit et concurrence partagés par tous les processus, par clé et par modèle
+        self.rate_limiter = RateLimiter(self.mistral_key)
+        # API en panne : contenu de secours immédiat plutôt que des retries pour chaque étape
+        self.circuit_breaker = CircuitBreaker(self.mistral_key)
+        # Réponse anormalement lente : la requête est envoyée une seconde fois
+        self.hedger = Hedger()
+        # Chaque étape part vers la route (fournisseur:modèle) la plus rapide et la plus fiable
+        self.router = ProviderRouter(self.providers, self.circuit_breaker)
+        # max_tokens de chaque étape ajusté aux longueurs de réponse observées
+        self.token_budget = TokenBudget()
+        
+        # Réponses déjà obtenues pour un même prompt (mémoire puis base)
+        self.completion_cache = CompletionCache()
+        # Un seul appel en cours par prompt identique, les autres attendent son résultat
+        self.single_flight = SingleFlight(self.completion_cache)
+        
+        if not (self.mistral_key and len(self.mistral_key) > 10):
             print("⚠️ MISTRAL_API_KEY invalide ou manquante - mode démo activé")
             print(f"   Clé trouvée: '{self.mistral_key}'")
     
-    def _clean_markdown(self, text: str) -> str:
+    @property
+    def client(self):
+        """Client Mistral synchrone (None en mode démo), aussi utilisé pour les images"""
+        return self.mistral.client
+    
+    @client.setter
+    def client(self, client):
+        self.mistral.client = client
+    
+    @property
+    def image_agent_id(self) -> Optional[str]:
         """
-        Nettoie le markdown pour faciliter le parsing
-        Enlève les astérisques, etc.
+        Identifiant de l'agent Mistral de génération d'images.
+        L'agent est créé au premier besoin puis enregistré en base,
+        pour être réutilisé par tous les processus et après redémarrage.
         """
-        # Enlever les astérisques markdown (gras)
-        text = re.sub(r'\*\*([^*]+)\*\*', r'\1', text)
-        text = re.sub(r'\*([^*]+)\*', r'\1', text)
-        return text
+        if self._image_agent_id or not self.client:
+            return self._image_agent_id
+        
+        with self._image_agent_lock:
+            if self._image_agent_id or time.monotonic() < self._image_agent_retry_at:
+                return self._image_agent_id
+            
+            agent = AIAgent.objects.filter(nom=IMAGE_AGENT_NAME, model=IMAGE_AGENT_MODEL).first()
+            if agent:
+                self._image_agent_id = agent.agent_id
+                return self._image_agent_id
+            
+            # Créer un agent pour la génération d'images
+            try:
+                remote_agent = self.client.beta.agents.create(
+                    model=IMAGE_AGENT_MODEL,
+                    name=IMAGE_AGENT_NAME,
+                    description="Agent spécialisé dans la génération d'images conceptuelles pour jeux vidéo",
+                    instructions="Tu es un artiste conceptuel expert en jeux vidéo. Génère des images épiques et professionnelles qui capturent l'essence des univers de jeux.",
+                    tools=[{"type": "image_generation"}],
+                    completion_args={
+                        "temperature": 0.7,
+                        "top_p": 0.95,
+                    }
+                )
+                print(f"✅ Agent de génération d'images créé: {remote_agent.id}")
+            except Exception as e:
+                print(f"⚠️ Impossible de créer l'agent d'images (peut-être pas activé sur votre compte): {e}")
+                self._image_agent_retry_at = time.monotonic() + IMAGE_AGENT_RETRY_DELAY
+                return None
+            
+            # Si un autre processus a enregistré un agent entre-temps, on garde le sien
+            agent, created = AIAgent.objects.get_or_create(
+                nom=IMAGE_AGENT_NAME,
+                model=IMAGE_AGENT_MODEL,
+                defaults={'agent_id': remote_agent.id}
+            )
+            self._image_agent_id = agent.agent_id
+            return self._image_agent_id
+    
+    def _chat_messages(self, prompt: str) -> List[Dict[str, str]]:
+        return [
+            {
+                "role": "system", 
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
     
-    def _call_api(self, prompt: str, max_tokens: int = 500) -> str:
+    def _completion_params(self, max_tokens: int, json_mode: bool = False) -> Dict:
+        params = {"temperature": 0.8, "max_tokens": max_tokens, "top_p": 0.95}
+        if json_mode:
+            params["response_format"] = {"type": "json_object"}
+        return params
+    
+    def _cache_key(self, prompt: str, max_tokens: int, json_mode: bool = False, model: str = '') -> str:
+        return CompletionCache.make_key(
+            model, SYSTEM_PROMPT, prompt, self._completion_params(max_tokens, json_mode)
+        )
+
+    def _is_rate_limit_error(self, error: Exception) -> bool:
+        error_str = str(error)
+        return "429" in error_str or "capacity exceeded" in error_str.lower()
+    
+    def _call_api(self, prompt: str, max_tokens: int = 500, use_cache: bool = True, json_mode: bool = False,
+                  on_partial: Optional[Callable[[str], None]] = None, route: Optional[Route] = None,
+                  budget: Optional[str] = None, items: int = 1) -> str:
         """
-        Appelle l'API Mistral pour la génération de texte avec retry automatique
+        Appelle l'API pour la génération de texte avec retry automatique
+        use_cache=False force un nouvel appel (la réponse n'est pas mise en cache)
+        json_mode=True demande une réponse JSON (voir _call_api_json)
+        on_partial(texte) active le streaming : appelée avec le texte reçu jusque-là
+        (par défaut, la destination de l'étape en cours de generate_full_game)
+        route : fournisseur et modèle imposés (par défaut, choisis par le routeur pour l'étape)
+        budget : étape dont les longueurs de réponse ajustent max_tokens (voir budget.py),
+        pour `items` éléments demandés ; max_tokens reste la valeur de référence
         """
-        if not self.client:
+        route = route or self.router.choose(_current_phase.get())
+        if not route:
             print("⚠️ Mode démo - génération de contenu mock")
             return self._generate_mock_content(prompt)
         
+        on_partial = on_partial or _partial_sink.get()
+        # La clé de cache garde la valeur de référence : elle ne change pas avec le budget
+        cache_key = (self._cache_key(prompt, max_tokens, json_mode, route.model)
+                     if use_cache and not _cache_bypass.get() else None)
+        limit = self.token_budget.max_tokens(budget, max_tokens, items) if budget else max_tokens
+        if cache_key:
+            cached = self.completion_cache.get(cache_key)
+            if cached is not None:
+                print("💾 Réponse servie depuis le cache")
+                result = cached
+            else:
+                result = self.single_flight.do(
+                    cache_key,
+                    lambda: self._shared_completion(route, prompt, limit, cache_key, json_mode, on_partial, budget,
+                                                    items),
+                    fallback_allowed=_fallback_allowed.get()
+                )
+            # Réponse en cache ou partagée avec un appel identique : transmise d'un bloc
+            if on_partial:
+                on_partial(result)
+            return result
+        
+        return self._request_completion(route, prompt, limit, json_mode=json_mode, on_partial=on_partial,
+                                        budget=budget, items=items)
+
+    def _request_completion(self, route: Route, prompt: str, max_tokens: int, cache_key: Optional[str] = None,
+                            json_mode: bool = False, on_partial: Optional[Callable[[str], None]] = None,
+                            budget: Optional[str] = None, items: int = 1, call: Optional[Dict] = None) -> str:
+        """
+        Appel effectif à l'API, enregistré dans APICall (jetons, durée, tentatives) ;
+        la requête doublée (voir hedging.py) est enregistrée à part, marquée `hedge`.
+        `call`, s'il est fourni, reçoit le suivi de l'appel (call['success'] faux : contenu de secours)
+        """
+        call = call if call is not None else {}
+        call.update(route=route, attempts=0, tokens=(0, 0), success=False, hedged=False, hedge_tokens=None)
+        started = time.monotonic()
+        try:
+            return self._complete_with_retry(call, route, prompt, max_tokens, cache_key, json_mode, on_partial,
+                                             budget, items)
+        finally:
+            # Aucune tentative (circuit ouvert) : rien n'a été envoyé à l'API
+            if call['attempts'] and self.providers[call['route'].provider].remote:
+                duration = time.monotonic() - started
+                log_api_call(call['route'].key, _current_phase.get(), *call['tokens'],
+                             duration, call['attempts'], call['success'])
+                if call['hedge_tokens']:
+                    log_api_call(call['route'].key, _current_phase.get(), *call['hedge_tokens'],
+                                 duration, 1, True, hedge=True)
+
+    def _shared_completion(self, *args) -> tuple:
+        """Appel regroupé par single_flight : retourne (réponse, contenu de secours ?)"""
+        call = {}
+        result = self._request_completion(*args, call=call)
+        return result, not call['success']
+
+    def _complete_with_retry(self, call: Dict, route: Route, prompt: str, max_tokens: int, cache_key: Optional[str],
+                             json_mode: bool, on_partial: Optional[Callable[[str], None]], budget: Optional[str],
+                             items: int) -> str:
+        """Tentatives successives (retry, autres routes) ; la réponse est mise en cache sous `cache_key`"""
+        phase = _current_phase.get()
+        tried = {route.key}
+        request = dict(
+            messages=self._chat_messages(prompt),
+            **self._completion_params(max_tokens, json_mode)
+        )
         # Tentatives avec retry exponentiel
         for attempt in range(self.max_retries):
+            # Circuit ouvert : l'appel n'est pas tenté, pas d'attente
+            if not self.circuit_breaker.allow(route.model):
+                return self._give_up(prompt, CircuitOpen(f"API indisponible ({route.key}), appel non tenté"))
+            
+            call.update(route=route, attempts=attempt + 1)
+            started = time.monotonic()
             try:
-                print(f"📡 Appel Mistral API (tentative {attempt + 1}/{self.max_retries})...")
-                chat_response = self.client.chat.complete(
-                    model=self.model,
-                    messages=[
-                        {
-                            "role": "system", 
-                            "content": "Tu es un créateur de jeux vidéo expert. Réponds de manière concise et créative en français."
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    temperature=0.8,
-                    max_tokens=max_tokens,
-                    top_p=0.95
-                )
+                print(f"📡 Appel {route.key} (tentative {attempt + 1}/{self.max_retries})...")
+                on_duplicate = lambda: call.update(hedged=True)
+                if on_partial:
+                    # Streaming : doublé sur le délai du premier fragment, seul le texte du gagnant est affiché
+                    (result, usage), ttft = self.hedger.run_stream(
+                        route.model, lambda forward: self._send_completion(route, request, forward), on_partial,
+                        on_duplicate
+                    )
+                else:
+                    result, usage = self.hedger.run(
+                        route.model, lambda: self._send_completion(route, request), on_duplicate
+                    )
+                    ttft = None
+                elapsed = time.monotonic() - started
                 
-                result = chat_response.choices[0].message.content
-                print(f"✅ Réponse API reçue : {result[:100]}...")
-                return result.strip()
+            except RateLimitTimeout as e:
+                print(f"⏳ {e}")
+                return self._give_up(prompt, e)
                 
             except Exception as e:
-                error_str = str(e)
+                self.circuit_breaker.record(route.model, False)
+                self.router.record(route, phase, time.monotonic() - started, False)
+                
+                # Autre route possible pour l'étape : nouvelle tentative immédiate
+                alternative = self.router.choose(phase, exclude=tried)
+                if alternative and attempt < self.max_retries - 1:
+                    print(f"❌ Erreur {route.key}: {e}")
+                    print(f"🔀 Nouvelle tentative avec {alternative.key}")
+                    route = alternative
+                    tried.add(route.key)
+                    continue
+                
+                # Circuit ouvert par cet échec (ou un autre processus) : inutile de réessayer
+                if self.circuit_breaker.is_open(route.model):
+                    print(f"❌ Erreur Mistral API: {e}")
+                    return self._give_up(prompt, e)
                 
                 # Détecter erreur 429 (rate limit)
-                if "429" in error_str or "capacity exceeded" in error_str.lower():
+                if self._is_rate_limit_error(e):
                     if attempt < self.max_retries - 1:
-                        wait_time = self.retry_delay * (2 ** attempt)  # Backoff exponentiel
+                        # Backoff exponentiel avec jitter, en respectant Retry-After.
+                        # L'attente est appliquée au seau partagé : tous les workers ralentissent.
+                        wait_time = backoff_delay(attempt, self.retry_delay, e)
                         print(f"⏳ Rate limit atteint (429). Attente de {wait_time}s avant nouvelle tentative...")
-                        time.sleep(wait_time)
+                        self.rate_limiter.penalize(route.model, wait_time)
                         continue
                     else:
                         print(f"❌ Rate limit persistant après {self.max_retries} tentatives")
-                        print("💡 Basculement vers le mode démo")
-                        return self._generate_mock_content(prompt)
+                        return self._give_up(prompt, e)
                 
                 # Autres erreurs
                 print(f"❌ Erreur Mistral API: {e}")
                 if attempt < self.max_retries - 1:
-                    print(f"🔄 Nouvelle tentative dans {self.retry_delay}s...")
-                    time.sleep(self.retry_delay)
+                    wait_time = backoff_delay(attempt, self.retry_delay)
+                    print(f"🔄 Nouvelle tentative dans {wait_time}s...")
+                    time.sleep(wait_time)
                     continue
                 else:
-                    return self._generate_mock_content(prompt)
+                    return self._give_up(prompt, e)
+            
+            else:
+                # Réponse payée : une erreur de mesure ne doit ni relancer l'appel ni la perdre
+                result = result.strip()
+                print(f"✅ Réponse API reçue : {result[:100]}...")
+                call.update(success=True)
+                try:
+                    self._record_success(call, route, phase, request, result, usage, max_tokens, elapsed, ttft,
+                                         budget, items, cache_key)
+                except Exception as e:
+                    print(f"⚠️ Statistiques de l'appel non enregistrées : {e}")
+                return result
         
         return self._generate_mock_content(prompt)
 
-    def _generate_mock_content(self, prompt: str) -> str:
+    def _record_success(self, call: Dict, route: Route, phase: Optional[str], request: Dict, result: str, usage,
+                        max_tokens: int, elapsed: float, ttft: Optional[float], budget: Optional[str], items: int,
+                        cache_key: Optional[str]):
+        """Suivi d'un appel réussi : disjoncteur, routeur, jetons, budget et cache"""
+        # Un long streaming reste sain tant que son premier fragment arrive vite
+        if ttft is not None:
+            self.circuit_breaker.record(route.model, True, ttft)
+        else:
+            self.circuit_breaker.record(route.model, True, elapsed, max_tokens)
+        self.router.record(route, phase, elapsed, True)
+        
+        add_usage(usage)
+        prompt_tokens, completion_tokens = self._log_usage(route, usage, request, result, max_tokens)
+        call.update(tokens=(prompt_tokens, completion_tokens))
+        if call['hedged']:
+            self._count_hedge(call, usage)
+        if budget and self.providers[route.provider].remote:
+            self.token_budget.record(budget, completion_tokens, max_tokens, items)
+        if cache_key:
+            self.completion_cache.set(cache_key, result)
+
+    def _give_up(self, prompt: str, error: Exception) -> str:
         """
-        Génère du contenu de démo sans API - AMÉLIORÉ pour être plus varié
+        Échec définitif d'un appel : contenu mock, ou l'erreur elle-même quand
+        l'étape en cours n'accepte pas de contenu de secours (tâche reprenable)
         """
-        import hashlib
-        
-        # Créer un seed unique basé sur le prompt
-        seed = hashlib.md5(prompt.encode()).hexdigest()
-        hash_val = int(seed, 16)
-        
-        if "titre" in prompt.lower():
-            prefixes = [
-                "Les Chroniques de", "La Légende de", "L'Aventure de", "Les Secrets de",
-                "Le Royaume de", "Les Gardiens de", "L'Éveil de", "La Quête de",
-                "Les Ombres de", "Le Destin de", "Les Héros de", "L'Odyssée de"
-            ]
-            suffixes = [
-                "l'Ombre", "la Lumière", "l'Éternité", "Azura", "Nexus",
-                "Eldoria", "Véridian", "l'Aube", "Midnight", "Atheron",
-                "Zephyria", "Obsidian", "Celestia", "Avalon", "Arcadia"
-            ]
-            prefix = prefixes[hash_val % len(prefixes)]
-            suffix = suffixes[(hash_val // 13) % len(suffixes)]
-            return f"{prefix} {suffix}"
-        
-        elif "personnage" in prompt.lower() or "NOM:" in prompt:
-            # Mock de personnages avec format structuré et variation
-            names = ["Aelric", "Zara", "Theron", "Lyssa", "Kael", "Nyx", "Orin", "Selene"]
-            roles = ["héros", "antagoniste", "allié", "mentor"]
-            classes = ["guerrier", "mage", "archer", "voleur", "paladin", "druide"]
-            
-            # Détecter l'ambiance dans le prompt
-            ambiance_detected = "default"
-            if "sombre" in prompt.lower():
-                ambiance_detected = "sombre"
-            elif "joyeux" in prompt.lower():
-                ambiance_detected = "joyeux"
-            elif "mysterieux" in prompt.lower():
-                ambiance_detected = "mysterieux"
-            
-            backgrounds = {
-                'sombre': "Hanté par un passé tragique, ce personnage cherche la rédemption dans les ombres. Son cœur porte les cicatrices de pertes indicibles.",
-                'joyeux': "Optimiste et plein d'énergie, ce personnage apporte joie et espoir partout où il passe. Son rire est contagieux.",
-                'mysterieux': "Les origines de ce personnage restent énigmatiques. Entouré de secrets, sa véritable nature reste inconnue.",
-                'default': "Un personnage expérimenté dont les compétences sont reconnues. Déterminé à accomplir sa destinée."
-            }
-            
-            name = names[hash_val % len(names)]
-            role = roles[(hash_val // 7) % len(roles)]
-            classe = classes[(hash_val // 11) % len(classes)]
-            background = backgrounds.get(ambiance_detected, backgrounds['default'])
-            
-            return f"""NOM: {name}
-ROLE: {role}
-CLASSE: {classe}
-PERSONNALITE: Courageux, loyal, mystérieux
-BACKGROUND: {background}
-APPARENCE: Allure noble avec une aura de puissance
-COMPETENCES: Maîtrise du combat et des stratégies
-GAMEPLAY: Personnage équilibré avec des capacités variées
-
----"""
-        
-        elif "lieu" in prompt.lower() or "TYPE:" in prompt:
-            # Mock de lieux avec format structuré et variation
-            places = ["Tour", "Cité", "Forêt", "Temple", "Montagne", "Ruines", "Grotte", "Château"]
-            adjectives = ["Sombre", "Ancienne", "Mystérieuse", "Sacrée", "Oubliée", "Éternelle", "Maudite", "Céleste"]
-            
-            # Détecter l'ambiance dans le prompt
-            ambiance_detected = "default"
-            if "sombre" in prompt.lower() or "dark" in prompt.lower():
-                ambiance_detected = "sombre"
-            elif "joyeux" in prompt.lower() or "happy" in prompt.lower():
-                ambiance_detected = "joyeux"
-            elif "mysterieux" in prompt.lower() or "mysterious" in prompt.lower():
-                ambiance_detected = "mysterieux"
-            
-            descriptions = {
-                'sombre': "Un lieu désolé où règne une atmosphère oppressante. Les ombres semblent vivantes et peu osent s'y aventurer.",
-                'joyeux': "Un lieu vibrant de vie et de couleurs éclatantes. L'atmosphère y est chaleureuse et accueillante.",
-                'mysterieux': "Un lieu énigmatique dont les secrets restent bien gardés. Des phénomènes étranges y défient toute explication.",
-                'default': "Un lieu légendaire rempli de mystères et de dangers anciens."
-            }
-            
-            place = places[hash_val % len(places)]
-            adj = adjectives[(hash_val // 7) % len(adjectives)]
-            description = descriptions.get(ambiance_detected, descriptions['default'])
-            
-            return f"""NOM: {place} {adj}
-TYPE: donjon
-DESCRIPTION: {description}
-IMPORTANCE: Point clé de la quête principale
-DANGERS: Créatures hostiles et pièges mortels
-TRESORS: Artefacts puissants et connaissances perdues
+        if not _fallback_allowed.get():
+            raise error
+        print("💡 Basculement vers le mode démo")
+        return self._generate_mock_content(prompt)
 
----"""
-        
-        elif "scénario" in prompt.lower() or "acte" in prompt.lower():
-            return """Le héros découvre son destin dans un monde au bord du chaos.
+    def _count_hedge(self, call: Dict, usage):
+        """
+        Requête doublée : la réponse écartée est facturée elle aussi. Son usage
+        n'est pas connu (annulée ou ignorée) : comptée comme la réponse retenue
+        """
+        print(f"🏇 Requête doublée comptée : {sum(call['tokens'])} jetons")
+        add_usage(usage)
+        call.update(hedge_tokens=call['tokens'])
 
-Les forces obscures se rassemblent et le héros doit former une alliance improbable pour les affronter.
+    def _log_usage(self, route: Route, usage, request: Dict, result: str, max_tokens: int) -> tuple:
+        """Affiche les jetons consommés par un appel ; retourne (jetons envoyés, jetons reçus)"""
+        prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        completion_tokens = getattr(usage, 'completion_tokens', None)
+        # Usage absent (streaming interrompu, fournisseur local) : longueurs estimées
+        if prompt_tokens is None:
+            prompt_tokens = sum(estimate_tokens(message['content']) for message in request['messages'])
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(result)
+        print(f"🔢 {route.key} : {prompt_tokens} jetons envoyés, {completion_tokens}/{max_tokens} jetons reçus")
+        if completion_tokens >= max_tokens:
+            print(f"✂️ Réponse coupée à max_tokens ({max_tokens})")
+        return prompt_tokens, completion_tokens
 
-Dans une bataille épique finale, le héros révèle sa véritable nature et sauve le monde.
+    def _send_completion(self, route: Route, request: Dict, on_partial: Optional[Callable[[str], None]] = None) -> tuple:
+        """Une requête au fournisseur de la route : retourne (texte, usage)"""
+        provider = self.providers[route.provider]
+        if not provider.remote:
+            return provider.complete(route.model, request, on_partial)
+        # Créneau partagé entre tous les processus (débit et requêtes simultanées)
+        with self.rate_limiter.slot(route.model):
+            return provider.complete(route.model, request, on_partial)
 
-Un ancien secret révèle que le véritable ennemi était caché depuis le début."""
+    def _call_api_json(self, prompt: str, schema: Dict, max_tokens: int = 500, budget: Optional[str] = None,
+                       items: int = 1) -> Optional[Dict]:
+        """
+        Appel en mode JSON : la réponse est décodée et validée contre `schema`.
+        Retourne None si l'API est indisponible ou la réponse non conforme,
+        l'appelant utilise alors son contenu de secours.
+        Réponse non conforme avec un budget réduit sous max_tokens : une
+        nouvelle tentative avec max_tokens, plutôt que le contenu de secours.
+        """
+        route = self.router.choose(_current_phase.get())
+        if not route:
+            print("⚠️ Mode démo - contenu de secours")
+            return None
         
-        return "Contenu généré en mode démo (API Mistral indisponible - rate limit atteint)"
-    
+        response = self._call_api(prompt, max_tokens, json_mode=True, route=route, budget=budget, items=items)
+        try:
+            return decode_json(response, schema)
+        except SchemaError as e:
+            print(f"⚠️ Réponse JSON non conforme : {e}")
+            # Ne pas resservir une réponse inutilisable depuis le cache
+            self.completion_cache.delete(self._cache_key(prompt, max_tokens, json_mode=True, model=route.model))
+            if budget and self.token_budget.max_tokens(budget, max_tokens, items) < max_tokens:
+                print(f"🔁 Nouvelle tentative avec max_tokens={max_tokens}")
+                return self._call_api_json(prompt, schema, max_tokens)
+            if not _fallback_allowed.get():
+                raise
+            return None
+
+    def _generate_mock_content(self, prompt: str) -> str:
+        """
+        Génère du contenu de démo sans API (voir LocalProvider)
+        """
+        return self.local.generate(prompt)
+
     def generate_game_title(self, genre: str, ambiance: str, keywords: List[str]) -> str:
         """
         Génère un titre de jeu
         """
+        title = self._call_api(self._title_prompt(genre, ambiance, keywords), max_tokens=50, budget='title')
+        return self._parse_title(title)
+
+    def _title_prompt(self, genre: str, ambiance: str, keywords: List[str]) -> str:
         keywords_str = ", ".join(keywords) if keywords else "aventure"
         
         prompt = f"""Génère UN SEUL titre original et captivant pour un jeu vidéo {genre} avec une ambiance {ambiance}.
@@ -255,8 +633,9 @@ Mots-clés: {keywords_str}
 Réponds UNIQUEMENT avec le titre, sans guillemets, sans explication, sans introduction.
 
 Titre:"""
-        
-        title = self._call_api(prompt, max_tokens=50)
+        return prompt
+
+    def _parse_title(self, title: str) -> str:
         title = title.strip().strip('"').strip("'").strip()
         lines = title.split('\n')
         return lines[0] if lines else title
@@ -265,24 +644,39 @@ Titre:"""
         """
         Génère la description de l'univers du jeu
         """
+        data = self._call_api_json(self._universe_prompt(game_title, genre, ambiance, keywords), UNIVERSE_SCHEMA, max_tokens=400, budget='universe')
+        return self._parse_universe(data, genre, ambiance, keywords)
+
+    def _universe_prompt(self, game_title: str, genre: str, ambiance: str, keywords: str) -> str:
         prompt = f"""Décris l'univers d'un jeu vidéo intitulé "{game_title}".
 Genre: {genre}
 Ambiance: {ambiance}
 Éléments clés: {keywords}
 
-Écris 2-3 paragraphes décrivant l'univers, le contexte, et l'atmosphère du jeu.
-Sois descriptif et immersif.
+Réponds en JSON :
+{{"description": "2-3 paragraphes descriptifs et immersifs sur l'univers, le contexte et l'atmosphère", "style_graphique": "{self._enum_hint(UNIVERSE_SCHEMA, 'style_graphique')}", "type_monde": "{self._enum_hint(UNIVERSE_SCHEMA, 'type_monde')}"}}"""
+        return prompt
 
-Description:"""
-        
-        description = self._call_api(prompt, max_tokens=400)
-        
+    def _parse_universe(self, data: Optional[Dict], genre: str, ambiance: str, keywords: str = '') -> Dict[str, str]:
+        if not data:
+            return {
+                'description': f"Un monde {ambiance} où se mêlent {keywords}.",
+                'style_graphique': self._suggest_art_style(genre, ambiance),
+                'type_monde': self._suggest_world_type(genre)
+            }
         return {
-            'description': description.strip(),
-            'style_graphique': self._suggest_art_style(genre, ambiance),
-            'type_monde': self._suggest_world_type(genre)
+            'description': data['description'],
+            'style_graphique': data.get('style_graphique') or self._suggest_art_style(genre, ambiance),
+            'type_monde': data.get('type_monde') or self._suggest_world_type(genre)
         }
     
+    def _enum_hint(self, schema: Dict, field: str, items_of: str = None) -> str:
+        """Valeurs autorisées d'un champ, pour les consignes du prompt (ex: "a|b|c")"""
+        properties = schema['properties']
+        if items_of:
+            properties = properties[items_of]['items']['properties']
+        return "|".join(properties[field]['enum'])
+
     def _suggest_art_style(self, genre: str, ambiance: str) -> str:
         """Suggère un style artistique basé sur le genre et l'ambiance"""
         mapping = {
@@ -309,52 +703,40 @@ Description:"""
         """
         Génère un scénario en 3 actes
         """
+        data = self._call_api_json(self._scenario_prompt(game_title, universe_description, genre), SCENARIO_SCHEMA, max_tokens=600, budget='scenario')
+        return self._parse_scenario(data)
+
+    def _scenario_prompt(self, game_title: str, universe_description: str, genre: str) -> str:
         prompt = f"""Crée un scénario de jeu vidéo en 3 actes pour "{game_title}".
 Genre: {genre}
-Univers: {universe_description[:200]}
-
-Structure (écris directement chaque acte, sans les labels):
-
-1. ACTE 1 (Introduction): Un paragraphe
-
-2. ACTE 2 (Développement): Un paragraphe
-
-3. ACTE 3 (Climax): Un paragraphe
+Univers: {truncate_tokens(universe_description, CONTEXT_TOKENS)}
 
-4. TWIST: Un retournement de situation inattendu
+Réponds en JSON, un paragraphe par champ :
+{{"acte_1": "introduction", "acte_2": "développement", "acte_3": "climax", "twist": "retournement de situation inattendu"}}"""
+        return prompt
 
-Scénario:"""
-        
-        scenario_text = self._call_api(prompt, max_tokens=600)
-        
-        # Parser le résultat
-        paragraphs = [p.strip() for p in scenario_text.split('\n\n') if p.strip()]
-        
-        # Filtrer les labels si présents
-        clean_paragraphs = []
-        for p in paragraphs:
-            # Enlever les numéros et labels en début
-            p = p.lstrip('1234.- ')
-            if not any(label in p[:30] for label in ['ACTE', 'TWIST', 'Introduction', 'Développement', 'Climax']):
-                clean_paragraphs.append(p)
-            else:
-                # Garder ce qui est après le label
-                for sep in [':', '-', '.']:
-                    if sep in p:
-                        clean_paragraphs.append(p.split(sep, 1)[1].strip())
-                        break
-        
-        return {
-            'acte_1': clean_paragraphs[0] if len(clean_paragraphs) > 0 else "Le héros découvre son destin.",
-            'acte_2': clean_paragraphs[1] if len(clean_paragraphs) > 1 else "Le héros affronte des épreuves.",
-            'acte_3': clean_paragraphs[2] if len(clean_paragraphs) > 2 else "Le héros triomphe du mal.",
-            'twist': clean_paragraphs[3] if len(clean_paragraphs) > 3 else "Un secret est révélé."
-        }
+    def _parse_scenario(self, data: Optional[Dict]) -> Dict[str, str]:
+        """
+        Actes du scénario (valeurs par défaut si la réponse est inutilisable)
+        """
+        if not data:
+            return {
+                'acte_1': "Le héros découvre son destin.",
+                'acte_2': "Le héros affronte des épreuves.",
+                'acte_3': "Le héros triomphe du mal.",
+                'twist': "Un secret est révélé."
+            }
+        return {field: data[field] for field in ('acte_1', 'acte_2', 'acte_3', 'twist')}
 
     def generate_characters(self, game_title: str, genre: str, num_characters: int = 3, ambiance: str = None, mots_cles: str = None, universe_description: str = None) -> List[Dict[str, str]]:
         """
         Génère des personnages détaillés pour le jeu avec cohérence thématique
         """
+        prompt = self._characters_prompt(game_title, genre, num_characters, ambiance, mots_cles, universe_description)
+        data = self._call_api_json(prompt, CHARACTERS_SCHEMA, max_tokens=800, budget='characters', items=num_characters)
+        return self._parse_characters(data, game_title, genre, ambiance, num_characters)
+
+    def _characters_prompt(self, game_title: str, genre: str, num_characters: int = 3, ambiance: str = None, mots_cles: str = None, universe_description: str = None) -> str:
         # Construire un prompt enrichi avec tous les thèmes
         context_parts = [f'Jeu: "{game_title}"', f'Genre: {genre}']
         
@@ -363,7 +745,7 @@ Scénario:"""
         if mots_cles:
             context_parts.append(f'Thèmes clés: {mots_cles}')
         if universe_description:
-            context_parts.append(f'Univers: {universe_description[:150]}')
+            context_parts.append(f'Univers: {truncate_tokens(universe_description, SHORT_CONTEXT_TOKENS)}')
         
         context = '\n'.join(context_parts)
         
@@ -377,83 +759,27 @@ IMPORTANT: Les personnages doivent refléter l'ambiance et les thèmes du jeu. P
 - Thèmes "magie, dragons" → classes et compétences liées à la magie et aux dragons
 - Genre "cyberpunk" → noms futuristes, compétences technologiques, background urbain dystopique
 
-Pour CHAQUE personnage, utilise EXACTEMENT ce format:
-
-NOM: [nom adapté au thème et genre]
-ROLE: [héros/antagoniste/allié/mentor]
-CLASSE: [classe cohérente avec le genre et les thèmes]
-PERSONNALITE: [traits reflétant l'ambiance]
-BACKGROUND: [histoire en 2-3 phrases liée à l'univers]
-APPARENCE: [description physique cohérente avec l'ambiance]
-COMPETENCES: [capacités liées aux thèmes clés]
-GAMEPLAY: [style de jeu adapté au genre]
-
-NOM: [nom du personnage]
-ROLE: [héros/antagoniste/allié/mentor]
-CLASSE: [guerrier/mage/archer/voleur/etc]
-PERSONNALITE: [3-4 traits de caractère]
-BACKGROUND: [histoire en 2-3 phrases]
-APPARENCE: [description physique]
-COMPETENCES: [capacités principales]
-GAMEPLAY: [comment on joue ce personnage]
-
----
-
-Personnages:"""
-
-        characters_text = self._call_api(prompt, max_tokens=800)
-        characters_text = self._clean_markdown(characters_text)
-        print(f"📝 Texte nettoyé : {characters_text[:200]}...")
-        
-        characters = []
-        char_blocks = characters_text.split('---')
-        
-        for block in char_blocks:
-            if 'NOM:' in block:
-                char = {}
-                lines = block.strip().split('\n')
-                
-                current_field = None
-                for line in lines:
-                    line = line.strip()
-                    if line.startswith('NOM:'):
-                        char['nom'] = line.replace('NOM:', '').strip()
-                        current_field = None
-                    elif line.startswith('ROLE:') or line.startswith('RÔLE:'):
-                        char['role'] = line.split(':', 1)[1].strip()
-                        current_field = None
-                    elif line.startswith('CLASSE:'):
-                        char['classe'] = line.split(':', 1)[1].strip()
-                        current_field = None
-                    elif line.startswith('PERSONNALITE:') or line.startswith('PERSONNALITÉ:'):
-                        char['personnalite'] = line.split(':', 1)[1].strip()
-                        current_field = None
-                    elif line.startswith('BACKGROUND:'):
-                        char['background'] = line.split(':', 1)[1].strip()
-                        current_field = 'background'
-                    elif line.startswith('APPARENCE:'):
-                        char['apparence'] = line.split(':', 1)[1].strip()
-                        current_field = None
-                    elif line.startswith('COMPETENCES:') or line.startswith('COMPÉTENCES:'):
-                        char['competences'] = line.split(':', 1)[1].strip()
-                        current_field = None
-                    elif line.startswith('GAMEPLAY:'):
-                        char['gameplay_description'] = line.split(':', 1)[1].strip()
-                        current_field = None
-                    elif current_field and line and not any(x in line for x in ['NOM:', 'ROLE:', 'CLASSE:', 'PERSONNALITE:', 'BACKGROUND:', 'APPARENCE:', 'COMPETENCES:', 'GAMEPLAY:']):
-                        char[current_field] += ' ' + line
-                
-                if 'nom' in char and 'background' in char:
-                    char.setdefault('role', 'allié')
-                    char.setdefault('classe', 'guerrier')
-                    char.setdefault('personnalite', 'Courageux et déterminé')
-                    char.setdefault('apparence', 'Apparence héroïque')
-                    char.setdefault('competences', 'Combat et leadership')
-                    char.setdefault('gameplay_description', 'Personnage équilibré')
-                    characters.append(char)
-                    print(f"✅ Personnage parsé : {char['nom']}")
+Réponds en JSON :
+{{"personnages": [{{"nom": "nom adapté au thème et genre", "role": "{self._enum_hint(CHARACTERS_SCHEMA, 'role', 'personnages')}", "classe": "{self._enum_hint(CHARACTERS_SCHEMA, 'classe', 'personnages')}", "background": "histoire en 2-3 phrases liée à l'univers", "gameplay_description": "style de jeu adapté au genre"}}]}}"""
+        return prompt
+
+    def _parse_characters(self, data: Optional[Dict], game_title: str, genre: str, ambiance: str = None, num_characters: int = 3) -> List[Dict[str, str]]:
+        """
+        Personnages de la réponse JSON, complétés si nécessaire
+        """
+        characters = list(data['personnages']) if data else []
+        for char in characters:
+            print(f"✅ Personnage reçu : {char['nom']}")
         
         # Génération aléatoire UNIQUE en cas d'échec
+        self._fill_characters(characters, game_title, genre, ambiance, num_characters)
+        
+        return characters[:num_characters]
+
+    def _fill_characters(self, characters: List[Dict[str, str]], game_title: str, genre: str, ambiance: str = None, num_characters: int = 3) -> List[Dict[str, str]]:
+        """
+        Complète la liste avec des personnages uniques générés sans appel API
+        """
         if len(characters) < num_characters:
             print(f"⚠️ Seulement {len(characters)}/{num_characters} personnages parsés")
             print("🎲 Génération de personnages uniques...")
@@ -461,7 +787,7 @@ Personnages:"""
             import hashlib
             seed = f"{game_title}_{genre}_{ambiance}_{len(characters)}"
             
-            roles = ['héros', 'antagoniste', 'allié', 'mentor', 'rival']
+            roles = [key for key, label in Character.ROLE_CHOICES]
             classes = ['guerrier', 'mage', 'archer', 'voleur', 'paladin', 'druide', 'assassin', 'clerc']
             traits = ['courageux', 'rusé', 'loyal', 'mystérieux', 'impulsif', 'sage', 'sarcastique', 'noble']
             name_parts = ['Ae', 'Kal', 'Thy', 'Zar', 'Lyn', 'Mor', 'Syl', 'Rae', 'Dor', 'Vel']
@@ -530,8 +856,13 @@ Personnages:"""
         """
         Génère des lieux emblématiques cohérents avec les thèmes
         """
+        prompt = self._locations_prompt(game_title, universe, num_locations, genre, ambiance, mots_cles)
+        data = self._call_api_json(prompt, LOCATIONS_SCHEMA, max_tokens=700, budget='locations', items=num_locations)
+        return self._parse_locations(data, game_title, universe, genre, ambiance, num_locations)
+
+    def _locations_prompt(self, game_title: str, universe: str, num_locations: int = 4, genre: str = None, ambiance: str = None, mots_cles: str = None) -> str:
         # Construire un contexte enrichi
-        context_parts = [f'Jeu: "{game_title}"', f'Univers: {universe[:150]}']
+        context_parts = [f'Jeu: "{game_title}"', f'Univers: {truncate_tokens(universe, SHORT_CONTEXT_TOKENS)}']
         
         if genre:
             context_parts.append(f'Genre: {genre}')
@@ -553,71 +884,27 @@ IMPORTANT: Les lieux doivent refléter l'ambiance et les thèmes:
 - Thèmes "technologie" → laboratoires, usines, bases high-tech
 - Genre "horror" → lieux inquiétants avec atmosphère menaçante
 
-Pour chaque lieu, utilise EXACTEMENT ce format:
-
-NOM: [nom évocateur adapté aux thèmes]
-TYPE: [type cohérent avec le genre et l'ambiance]
-DESCRIPTION: [2-3 phrases reflétant l'ambiance]
-IMPORTANCE: [rôle dans l'histoire lié aux thèmes]
-DANGERS: [dangers cohérents avec le genre]
-TRESORS: [récompenses liées aux thèmes clés]
-
-NOM: [nom du lieu]
-TYPE: [ville/forêt/dongeon/temple/château/ruines/etc]
-DESCRIPTION: [description en 2-3 phrases]
-IMPORTANCE: [importance dans l'histoire]
-DANGERS: [dangers ou énigmes présents]
-TRESORS: [récompenses ou secrets à découvrir]
+Réponds en JSON :
+{{"lieux": [{{"nom": "nom évocateur adapté aux thèmes", "description": "2-3 phrases reflétant l'ambiance et le rôle du lieu dans l'histoire"}}]}}"""
+        return prompt
 
----
-
-Lieux:"""
-
-        locations_text = self._call_api(prompt, max_tokens=700)
-        locations_text = self._clean_markdown(locations_text)
-        print(f"📝 Texte nettoyé : {locations_text[:200]}...")
-        
-        locations = []
-        loc_blocks = locations_text.split('---')
-        
-        for block in loc_blocks:
-            if 'NOM:' in block:
-                loc = {}
-                lines = block.strip().split('\n')
-                
-                current_field = None
-                for line in lines:
-                    line = line.strip()
-                    if line.startswith('NOM:'):
-                        loc['nom'] = line.replace('NOM:', '').strip()
-                        current_field = None
-                    elif line.startswith('TYPE:'):
-                        loc['type'] = line.split(':', 1)[1].strip()
-                        current_field = None
-                    elif line.startswith('DESCRIPTION:'):
-                        loc['description'] = line.split(':', 1)[1].strip()
-                        current_field = 'description'
-                    elif line.startswith('IMPORTANCE:'):
-                        loc['importance'] = line.split(':', 1)[1].strip()
-                        current_field = None
-                    elif line.startswith('DANGERS:'):
-                        loc['dangers'] = line.split(':', 1)[1].strip()
-                        current_field = None
-                    elif line.startswith('TRESORS:') or line.startswith('TRÉSORS:'):
-                        loc['tresors'] = line.split(':', 1)[1].strip()
-                        current_field = None
-                    elif current_field and line and not any(x in line for x in ['NOM:', 'TYPE:', 'DESCRIPTION:', 'IMPORTANCE:', 'DANGERS:', 'TRESORS:']):
-                        loc[current_field] += ' ' + line
-                
-                if 'nom' in loc and 'description' in loc:
-                    loc.setdefault('type', 'zone mystérieuse')
-                    loc.setdefault('importance', 'Lieu clé pour la quête principale')
-                    loc.setdefault('dangers', 'Créatures hostiles et pièges anciens')
-                    loc.setdefault('tresors', 'Artéfacts puissants et connaissances perdues')
-                    locations.append(loc)
-                    print(f"✅ Lieu parsé : {loc['nom']}")
+    def _parse_locations(self, data: Optional[Dict], game_title: str, universe: str, genre: str = None, ambiance: str = None, num_locations: int = 4) -> List[Dict[str, str]]:
+        """
+        Lieux de la réponse JSON, complétés si nécessaire
+        """
+        locations = list(data['lieux']) if data else []
+        for loc in locations:
+            print(f"✅ Lieu reçu : {loc['nom']}")
         
         # Génération aléatoire UNIQUE en cas d'échec
+        self._fill_locations(locations, game_title, universe, genre, ambiance, num_locations)
+        
+        return locations[:num_locations]
+
+    def _fill_locations(self, locations: List[Dict[str, str]], game_title: str, universe: str, genre: str = None, ambiance: str = None, num_locations: int = 4) -> List[Dict[str, str]]:
+        """
+        Complète la liste avec des lieux uniques générés sans appel API
+        """
         if len(locations) < num_locations:
             print(f"⚠️ Seulement {len(locations)}/{num_locations} lieux parsés")
             print("🎲 Génération de lieux uniques...")
@@ -701,15 +988,61 @@ Lieux:"""
         
         return locations[:num_locations]
 
+    def generate_world_bundle(self, genre: str, ambiance: str, mots_cles: str, num_characters: int = 3,
+                              num_locations: int = 4) -> Optional[Dict]:
+        """
+        Génère titre, univers, scénario, personnages et lieux en une seule complétion.
+        Retourne None si la réponse est inutilisable (l'appelant repasse en mode enchaîné).
+        """
+        prompt = self._world_bundle_prompt(genre, ambiance, mots_cles, num_characters, num_locations)
+        data = self._call_api_json(prompt, WORLD_BUNDLE_SCHEMA, max_tokens=2500, budget='bundle')
+        return self._parse_world_bundle(data, genre, ambiance, mots_cles, num_characters, num_locations)
+
+    def _world_bundle_prompt(self, genre: str, ambiance: str, mots_cles: str, num_characters: int = 3,
+                             num_locations: int = 4) -> str:
+        prompt = f"""Conçois un jeu vidéo original.
+Genre: {genre}
+Ambiance: {ambiance}
+Mots-clés: {mots_cles}
+
+Le titre, l'univers, le scénario, les {num_characters} personnages et les {num_locations} lieux doivent être cohérents entre eux et refléter l'ambiance et les thèmes.
+
+Réponds en JSON :
+{{"titre": "titre original et captivant",
+"univers": {{"description": "2-3 paragraphes immersifs sur l'univers, le contexte et l'atmosphère", "style_graphique": "{self._enum_hint(UNIVERSE_SCHEMA, 'style_graphique')}", "type_monde": "{self._enum_hint(UNIVERSE_SCHEMA, 'type_monde')}"}},
+"scenario": {{"acte_1": "introduction", "acte_2": "développement", "acte_3": "climax", "twist": "retournement de situation inattendu"}},
+"personnages": [{{"nom": "nom adapté au thème", "role": "{self._enum_hint(CHARACTERS_SCHEMA, 'role', 'personnages')}", "classe": "{self._enum_hint(CHARACTERS_SCHEMA, 'classe', 'personnages')}", "background": "histoire en 2-3 phrases", "gameplay_description": "style de jeu"}}],
+"lieux": [{{"nom": "nom évocateur", "description": "2-3 phrases"}}]}}"""
+        return prompt
+
+    def _parse_world_bundle(self, data: Optional[Dict], genre: str, ambiance: str, mots_cles: str,
+                            num_characters: int = 3, num_locations: int = 4) -> Optional[Dict]:
+        if not data:
+            return None
+        titre = self._parse_title(data['titre'])
+        universe = self._parse_universe(data['univers'], genre, ambiance, mots_cles)
+        return {
+            'titre': titre,
+            'universe': universe,
+            'scenario': self._parse_scenario(data['scenario']),
+            'characters': self._parse_characters(data, titre, genre, ambiance, num_characters),
+            'locations': self._parse_locations(data, titre, universe['description'], genre, ambiance, num_locations),
+        }
+
     def generate_game_image(self, game_title: str, genre: str, ambiance: str, universe_description: str) -> str:
         """
         Génère une description textuelle pour une image conceptuelle
         """
+        prompt = self._image_description_prompt(game_title, genre, ambiance, universe_description)
+        image_description = self._call_api(prompt, max_tokens=300, budget='image_description')
+        return image_description.strip()
+
+    def _image_description_prompt(self, game_title: str, genre: str, ambiance: str, universe_description: str) -> str:
         prompt = f"""Crée une description détaillée pour une image conceptuelle de jeu vidéo intitulé "{game_title}".
 
 Genre: {genre}
 Ambiance: {ambiance}
-Univers: {universe_description[:200]}
+Univers: {truncate_tokens(universe_description, CONTEXT_TOKENS)}
 
 La description doit être visuelle et détaillée, incluant:
 - Style artistique
@@ -718,15 +1051,14 @@ La description doit être visuelle et détaillée, incluant:
 - Composition de l'image
 
 Description conceptuelle:"""
-
-        image_description = self._call_api(prompt, max_tokens=300)
-        return image_description.strip()
+        return prompt
 
     def generate_and_save_image(self, game_title: str, genre: str, ambiance: str, universe_description: str) -> Dict:
         """
         Génère une vraie image avec Mistral Agents API (FLUX)
         """
-        if not self.client or not self.image_agent:
+        agent_id = self.image_agent_id
+        if not self.client or not agent_id:
             print("⚠️ Mode démo - génération d'image désactivée")
             description = self.generate_game_image(game_title, genre, ambiance, universe_description)
             return {
@@ -735,36 +1067,17 @@ Description conceptuelle:"""
                 'image_url': None
             }
         
-        prompt = f"""Génère une image de cover art professionnelle pour le jeu vidéo "{game_title}".
-
-Style: Cover art AAA, qualité cinématographique
-Genre: {genre}
-Ambiance: {ambiance}
-Univers: {universe_description[:250]}
-
-L'image doit être épique, immersive et capturer visuellement l'essence du jeu."""
+        prompt = self._cover_prompt(game_title, genre, ambiance, universe_description)
         
         try:
             print(f"🎨 Génération d'image pour '{game_title}'...")
             
-            response = self.client.beta.conversations.start(
-                agent_id=self.image_agent.id,
-                inputs=prompt
-            )
-            
-            file_id = None
-            from mistralai.models import ToolFileChunk
-            
-            if hasattr(response, 'outputs') and response.outputs:
-                for output in response.outputs:
-                    if hasattr(output, 'content'):
-                        for chunk in output.content:
-                            if isinstance(chunk, ToolFileChunk):
-                                file_id = chunk.file_id
-                                print(f"✅ Image générée avec file_id: {file_id}")
-                                break
-                        if file_id:
-                            break
+            with self.rate_limiter.slot(IMAGE_AGENT_MODEL):
+                response = self.client.beta.conversations.start(
+                    agent_id=agent_id,
+                    inputs=prompt
+                )
+            file_id = self._find_image_file_id(response)
             
             if file_id:
                 print(f"⬇️ Téléchargement de l'image...")
@@ -794,6 +1107,709 @@ L'image doit être épique, immersive et capturer visuellement l'essence du jeu.
                 'image_url': None
             }
 
+    def _cover_prompt(self, game_title: str, genre: str, ambiance: str, universe_description: str) -> str:
+        prompt = f"""Génère une image de cover art professionnelle pour le jeu vidéo "{game_title}".
+
+Style: Cover art AAA, qualité cinématographique
+Genre: {genre}
+Ambiance: {ambiance}
+Univers: {truncate_tokens(universe_description, COVER_CONTEXT_TOKENS)}
+
+L'image doit être épique, immersive et capturer visuellement l'essence du jeu."""
+        return prompt
+
+    def _find_image_file_id(self, response) -> Optional[str]:
+        """Cherche l'identifiant du fichier image dans la réponse de l'agent"""
+        from mistralai.models import ToolFileChunk
+        
+        if hasattr(response, 'outputs') and response.outputs:
+            for output in response.outputs:
+                if hasattr(output, 'content'):
+                    for chunk in output.content:
+                        if isinstance(chunk, ToolFileChunk):
+                            print(f"✅ Image générée avec file_id: {chunk.file_id}")
+                            return chunk.file_id
+        return None
+
+    def _phase_fallback(self, phase: str, game_title: str, genre: str, ambiance: str, mots_cles: str,
+                        universe_description: str, num_characters: int, num_locations: int):
+        """
+        Contenu de secours (sans appel API) pour une étape en échec ou hors délai
+        """
+        if phase == 'title':
+            return self._generate_mock_content(f"titre {genre} {ambiance} {mots_cles}")
+        if phase == 'universe':
+            return self._parse_universe(None, genre, ambiance, mots_cles)
+        if phase == 'scenario':
+            return self._parse_scenario(None)
+        if phase == 'characters':
+            return self._fill_characters([], game_title, genre, ambiance, num_characters)
+        if phase == 'locations':
+            return self._fill_locations([], game_title, universe_description, genre, ambiance, num_locations)
+        if phase == 'image':
+            return {
+                'description': f"Cover art de {game_title} : univers {genre} à l'ambiance {ambiance}.",
+                'image_data': None,
+                'image_url': None
+            }
+        raise ValueError(f"Étape inconnue : {phase}")
+
+    def _empty_game_result(self) -> Dict:
+        return {
+            'titre': None,
+            'universe': None,
+            'scenario': None,
+            'characters': None,
+            'locations': None,
+            'image': None,
+            'errors': {},
+            'timings': {},
+        }
+
+    def _store_phase_result(self, result: Dict, phase: str, value, started: float, genre: str, ambiance: str,
+                            mots_cles: str, num_characters: int, num_locations: int):
+        """Range le résultat d'une étape (ou son contenu de secours) dans le résultat global"""
+        if value is None:
+            value = self._phase_fallback(
+                phase, result['titre'] or '', genre, ambiance, mots_cles,
+                (result['universe'] or {}).get('description', ''), num_characters, num_locations
+            )
+        result['titre' if phase == 'title' else phase] = value
+        result['timings'][phase] = round(time.monotonic() - started, 2)
+
+    def _store_bundle_result(self, result: Dict, bundle: Dict, started: float, genre: str, ambiance: str,
+                             mots_cles: str, num_characters: int, num_locations: int):
+        """Range les étapes produites par generate_world_bundle (dans l'ordre : le titre d'abord)"""
+        for phase in BUNDLE_PHASES:
+            value = bundle['titre' if phase == 'title' else phase]
+            self._store_phase_result(result, phase, value, started, genre, ambiance, mots_cles, num_characters, num_locations)
+        result['timings']['bundle'] = result['timings']['title']
+
+    def _restore_checkpoint(self, result: Dict, checkpoint: Optional[Dict]):
+        """Reprend dans le résultat les étapes déjà obtenues lors d'une exécution précédente"""
+        for phase, value in (checkpoint or {}).items():
+            result['titre' if phase == 'title' else phase] = value
+            result['timings'][phase] = 0
+
+    def _run_phase_in_context(self, phase: str, on_partial: Optional[Callable[[str, str], None]],
+                              fallback: bool, fn, *args):
+        """Exécute une étape (dans un contexte copié) en dirigeant son streaming vers on_partial"""
+        if on_partial:
+            _partial_sink.set(lambda text: on_partial(phase, text))
+        _fallback_allowed.set(fallback)
+        _current_phase.set(phase)
+        return fn(*args)
+
+    def _run_phase_thread(self, phase: str, on_partial: Optional[Callable[[str, str], None]],
+                          cancelled: threading.Event, fallback: bool, fn, *args):
+        """
+        Étape exécutée dans un thread de generate_full_game. Une fois l'étape
+        abandonnée (hors délai, génération terminée), son streaming n'est plus
+        transmis : elle n'écrit plus de texte partiel sur la tâche.
+        """
+        def forward(phase_name: str, text: str):
+            if not cancelled.is_set():
+                on_partial(phase_name, text)
+
+        try:
+            return self._run_phase_in_context(phase, forward if on_partial else None, fallback, fn, *args)
+        finally:
+            # Connexion propre au thread de l'étape
+            connection.close()
+
+    def generate_full_game(self, genre: str, ambiance: str, mots_cles: str, num_characters: int = 3,
+                           num_locations: int = 4, timeouts: Optional[Dict[str, float]] = None,
+                           on_phase: Optional[Callable[[str, str], None]] = None,
+                           mode: str = 'chained', with_image: bool = True,
+                           on_partial: Optional[Callable[[str, str], None]] = None,
+                           checkpoint: Optional[Dict] = None,
+                           on_checkpoint: Optional[Callable[[str, Any], None]] = None,
+                           fallback: bool = True) -> Dict:
+        """
+        Génère un jeu complet en parallélisant les étapes indépendantes.
+
+        Mode 'chained' : le titre puis l'univers sont générés à la suite ; scénario,
+        personnages, lieux et image ne dépendent que d'eux et sont lancés en même temps.
+        Mode 'bundle' : titre, univers, scénario, personnages et lieux viennent d'une
+        seule complétion (generate_world_bundle), puis l'image ; si la réponse est
+        inutilisable, la génération repasse en mode enchaîné.
+        Une étape en erreur ou hors délai est remplacée par du contenu de secours
+        et signalée dans 'errors'. on_phase(phase, état) est appelé depuis le
+        thread appelant avec l'état 'start' ou 'done'. on_partial(phase, texte),
+        appelé depuis le thread de l'étape, reçoit le texte en cours de streaming
+        ('bundle' pour la complétion unique, voir readable_partial).
+
+        Reprise : `checkpoint` contient les étapes déjà obtenues ({phase: valeur}),
+        qui ne sont pas relancées ; on_checkpoint(phase, valeur) reçoit chaque
+        étape réussie. Avec fallback=False, une étape en échec n'est pas remplacée :
+        les étapes lancées en même temps se terminent, puis GenerationPhaseError est levée.
+        """
+        timeouts = {**PHASE_TIMEOUTS, **(timeouts or {})}
+        notify = on_phase or (lambda phase, state: None)
+        save_checkpoint = on_checkpoint or (lambda phase, value: None)
+        keywords_list = [k.strip() for k in mots_cles.split(',') if k.strip()]
+        result = self._empty_game_result()
+        self._restore_checkpoint(result, checkpoint)
+        failed = []
+        cancel_flags = []
+
+        executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='gameforge-phase')
+        try:
+            def collect(futures: Dict):
+                """Attend les étapes lancées en respectant le délai propre à chacune"""
+                pending = set(futures)
+                while pending:
+                    now = time.monotonic()
+                    deadline = min(futures[f]['deadline'] for f in pending)
+                    done, pending = wait(pending, timeout=max(0, deadline - now), return_when=FIRST_COMPLETED)
+
+                    for future in done:
+                        phase = futures[future]['phase']
+                        try:
+                            value = future.result()
+                        except Exception as e:
+                            print(f"❌ Étape '{phase}' en erreur : {e}")
+                            result['errors'][phase] = str(e)
+                            value = None
+                        finish(phase, value, futures[future]['started'])
+
+                    now = time.monotonic()
+                    for future in [f for f in pending if futures[f]['deadline'] <= now]:
+                        phase = futures[future]['phase']
+                        print(f"⏱️ Étape '{phase}' hors délai ({timeouts[phase]}s)")
+                        future.cancel()
+                        futures[future]['cancelled'].set()
+                        result['errors'][phase] = f"Délai de {timeouts[phase]}s dépassé"
+                        pending.discard(future)
+                        finish(phase, None, futures[future]['started'])
+
+                if failed:
+                    raise GenerationPhaseError({phase: result['errors'][phase] for phase in failed})
+
+            def finish(phase: str, value, started: float):
+                if phase == 'bundle':
+                    # Sans réponse exploitable, les étapes sont relancées en mode enchaîné
+                    if value:
+                        self._store_bundle_result(result, value, started, genre, ambiance, mots_cles, num_characters, num_locations)
+                        for sub_phase in BUNDLE_PHASES:
+                            save_checkpoint(sub_phase, result['titre' if sub_phase == 'title' else sub_phase])
+                            notify(sub_phase, 'done')
+                    return
+                if value is None and not fallback:
+                    failed.append(phase)
+                    return
+                self._store_phase_result(result, phase, value, started, genre, ambiance, mots_cles, num_characters, num_locations)
+                if value is not None:
+                    save_checkpoint(phase, value)
+                notify(phase, 'done')
+
+            def launch(phase: str, fn, *args) -> Dict:
+                for sub_phase in (BUNDLE_PHASES if phase == 'bundle' else [phase]):
+                    notify(sub_phase, 'start')
+                started = time.monotonic()
+                cancelled = threading.Event()
+                cancel_flags.append(cancelled)
+                # Le contexte (mesure d'usage en cours) suit l'étape dans son thread
+                future = executor.submit(
+                    contextvars.copy_context().run, self._run_phase_thread, phase, on_partial, cancelled, fallback,
+                    fn, *args
+                )
+                return {future: {'phase': phase, 'started': started, 'deadline': started + timeouts[phase],
+                                 'cancelled': cancelled}}
+
+            if mode == 'bundle' and not checkpoint:
+                collect(launch('bundle', self.generate_world_bundle, genre, ambiance, mots_cles, num_characters, num_locations))
+
+            # 1. Titre puis univers (dépendances de toutes les autres étapes)
+            if result['titre'] is None:
+                collect(launch('title', self.generate_game_title, genre, ambiance, keywords_list))
+            if result['universe'] is None:
+                collect(launch('universe', self.generate_universe, result['titre'], genre, ambiance, mots_cles))
+            titre = result['titre']
+            universe_description = result['universe']['description']
+
+            # 2. Étapes indépendantes en parallèle (seulement celles qui manquent)
+            futures = {}
+            if result['scenario'] is None:
+                futures.update(launch('scenario', self.generate_scenario, titre, universe_description, genre))
+            if result['characters'] is None:
+                futures.update(launch('characters', self.generate_characters, titre, genre, num_characters, ambiance, mots_cles, universe_description))
+            if result['locations'] is None:
+                futures.update(launch('locations', self.generate_locations, titre, universe_description, num_locations, genre, ambiance, mots_cles))
+            if with_image and result['image'] is None:
+                futures.update(launch('image', self.generate_and_save_image, titre, genre, ambiance, universe_description))
+            collect(futures)
+        finally:
+            # Ne pas attendre les étapes hors délai encore en cours, ni transmettre leur texte
+            for cancelled in cancel_flags:
+                cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        print(f"⏱️ Durées par étape : {result['timings']}")
+        return result
+
+    def _section_args(self, game, section: str, count: Optional[int]) -> tuple:
+        """Arguments de la méthode generate_* d'une section : le titre et l'univers enregistrés servent de contexte"""
+        if section == 'universe':
+            return (game.titre, game.genre, game.ambiance, game.mots_cles)
+        universe_description = game.universe.description
+        if section == 'scenario':
+            return (game.titre, universe_description, game.genre)
+        if section == 'characters':
+            return (game.titre, game.genre, count or 3, game.ambiance, game.mots_cles, universe_description)
+        if section == 'locations':
+            return (game.titre, universe_description, count or 4, game.genre, game.ambiance, game.mots_cles)
+        if section == 'image':
+            return (game.titre, game.genre, game.ambiance, universe_description)
+        raise ValueError(f"Section inconnue : {section}")
+
+    @staticmethod
+    def _check_regenerated(section: str, value):
+        """Une image régénérée sans fichier (mode démo, erreur de l'agent) ne remplace pas la couverture"""
+        if section == 'image' and not (value or {}).get('image_data'):
+            raise GenerationPhaseError({'image': "aucune image générée, la couverture actuelle est conservée"})
+        return value
+
+    def regenerate_section(self, game, section: str, count: Optional[int] = None,
+                           on_partial: Optional[Callable[[str, str], None]] = None):
+        """
+        Régénère une seule section d'un jeu enregistré (un appel à l'API, deux pour
+        l'image) et retourne son contenu, au format de generate_full_game.
+        `count` : nombre de personnages ou de lieux. Le cache de complétion n'est pas lu
+        (même prompt, nouvelle réponse) et un échec lève une erreur au lieu de
+        retourner du contenu de secours.
+        """
+        fn = getattr(self, SECTION_METHODS[section])
+        args = self._section_args(game, section, count)
+        context = contextvars.copy_context()
+        context.run(_cache_bypass.set, True)
+        value = context.run(self._run_phase_in_context, section, on_partial, False, fn, *args)
+        return self._check_regenerated(section, value)
+
+    # ------------------------------------------------------------------
+    # Variantes asynchrones : mêmes prompts et mêmes parsers que les
+    # méthodes synchrones, appels réseau non bloquants (méthodes *_async
+    # du SDK Mistral) et attente via asyncio.sleep.
+    # ------------------------------------------------------------------
+
+    def _get_async_client(self):
+        """Client Mistral asynchrone de la boucle asyncio courante (voir MistralProvider.async_client)"""
+        return self.mistral.async_client()
+
+    async def _call_api_async(self, prompt: str, max_tokens: int = 500, use_cache: bool = True,
+                              json_mode: bool = False, on_partial: Optional[Callable] = None,
+                              route: Optional[Route] = None, budget: Optional[str] = None, items: int = 1) -> str:
+        """
+        Variante asynchrone de _call_api (on_partial peut être une coroutine)
+        """
+        route = route or await self.router.choose_async(_current_phase.get())
+        if not route:
+            print("⚠️ Mode démo - génération de contenu mock")
+            return self._generate_mock_content(prompt)
+        
+        on_partial = on_partial or _partial_sink.get()
+        cache_key = (self._cache_key(prompt, max_tokens, json_mode, route.model)
+                     if use_cache and not _cache_bypass.get() else None)
+        limit = await self.token_budget.max_tokens_async(budget, max_tokens, items) if budget else max_tokens
+        if cache_key:
+            cached = await self.completion_cache.get_async(cache_key)
+            if cached is not None:
+                print("💾 Réponse servie depuis le cache")
+                result = cached
+            else:
+                result = await self.single_flight.do_async(
+                    cache_key,
+                    lambda: self._shared_completion_async(route, prompt, limit, cache_key, json_mode, on_partial,
+                                                          budget, items),
+                    fallback_allowed=_fallback_allowed.get()
+                )
+            await emit_partial(on_partial, result)
+            return result
+        
+        return await self._request_completion_async(route, prompt, limit, json_mode=json_mode, on_partial=on_partial,
+                                                    budget=budget, items=items)
+
+    async def _send_completion_async(self, route: Route, request: Dict, on_partial: Optional[Callable] = None) -> tuple:
+        provider = self.providers[route.provider]
+        if not provider.remote:
+            return await provider.complete_async(route.model, request, on_partial)
+        async with self.rate_limiter.slot_async(route.model):
+            return await provider.complete_async(route.model, request, on_partial)
+
+    async def _request_completion_async(self, route: Route, prompt: str, max_tokens: int,
+                                        cache_key: Optional[str] = None, json_mode: bool = False,
+                                        on_partial: Optional[Callable] = None, budget: Optional[str] = None,
+                                        items: int = 1, call: Optional[Dict] = None) -> str:
+        call = call if call is not None else {}
+        call.update(route=route, attempts=0, tokens=(0, 0), success=False, hedged=False, hedge_tokens=None)
+        started = time.monotonic()
+        try:
+            return await self._complete_with_retry_async(call, route, prompt, max_tokens, cache_key, json_mode,
+                                                         on_partial, budget, items)
+        finally:
+            if call['attempts'] and self.providers[call['route'].provider].remote:
+                duration = time.monotonic() - started
+                await log_api_call_async(call['route'].key, _current_phase.get(), *call['tokens'],
+                                         duration, call['attempts'], call['success'])
+                if call['hedge_tokens']:
+                    await log_api_call_async(call['route'].key, _current_phase.get(), *call['hedge_tokens'],
+                                             duration, 1, True, hedge=True)
+
+    async def _shared_completion_async(self, *args) -> tuple:
+        call = {}
+        result = await self._request_completion_async(*args, call=call)
+        return result, not call['success']
+
+    async def _complete_with_retry_async(self, call: Dict, route: Route, prompt: str, max_tokens: int,
+                                         cache_key: Optional[str], json_mode: bool, on_partial: Optional[Callable],
+                                         budget: Optional[str], items: int) -> str:
+        phase = _current_phase.get()
+        tried = {route.key}
+        request = dict(
+            messages=self._chat_messages(prompt),
+            **self._completion_params(max_tokens, json_mode)
+        )
+        for attempt in range(self.max_retries):
+            if not await self.circuit_breaker.allow_async(route.model):
+                return self._give_up(prompt, CircuitOpen(f"API indisponible ({route.key}), appel non tenté"))
+            
+            call.update(route=route, attempts=attempt + 1)
+            started = time.monotonic()
+            try:
+                print(f"📡 Appel {route.key} async (tentative {attempt + 1}/{self.max_retries})...")
+                on_duplicate = lambda: call.update(hedged=True)
+                if on_partial:
+                    (result, usage), ttft = await self.hedger.run_stream_async(
+                        route.model, lambda forward: self._send_completion_async(route, request, forward), on_partial,
+                        on_duplicate
+                    )
+                else:
+                    result, usage = await self.hedger.run_async(
+                        route.model, lambda: self._send_completion_async(route, request), on_duplicate
+                    )
+                    ttft = None
+                elapsed = time.monotonic() - started
+                
+            except RateLimitTimeout as e:
+                print(f"⏳ {e}")
+                return self._give_up(prompt, e)
+                
+            except Exception as e:
+                await self.circuit_breaker.record_async(route.model, False)
+                await self.router.record_async(route, phase, time.monotonic() - started, False)
+                
+                alternative = await self.router.choose_async(phase, exclude=tried)
+                if alternative and attempt < self.max_retries - 1:
+                    print(f"❌ Erreur {route.key}: {e}")
+                    print(f"🔀 Nouvelle tentative avec {alternative.key}")
+                    route = alternative
+                    tried.add(route.key)
+                    continue
+                
+                if await self.circuit_breaker.is_open_async(route.model):
+                    print(f"❌ Erreur Mistral API: {e}")
+                    return self._give_up(prompt, e)
+                
+                if self._is_rate_limit_error(e):
+                    if attempt < self.max_retries - 1:
+                        wait_time = backoff_delay(attempt, self.retry_delay, e)
+                        print(f"⏳ Rate limit atteint (429). Attente de {wait_time}s avant nouvelle tentative...")
+                        await sync_to_async(self.rate_limiter.penalize)(route.model, wait_time)
+                        continue
+                    else:
+                        print(f"❌ Rate limit persistant après {self.max_retries} tentatives")
+                        return self._give_up(prompt, e)
+                
+                print(f"❌ Erreur Mistral API: {e}")
+                if attempt < self.max_retries - 1:
+                    wait_time = backoff_delay(attempt, self.retry_delay)
+                    print(f"🔄 Nouvelle tentative dans {wait_time}s...")
+                    await asyncio.sleep(wait_time)
+                    continue
+                else:
+                    return self._give_up(prompt, e)
+            
+            else:
+                result = result.strip()
+                print(f"✅ Réponse API reçue : {result[:100]}...")
+                call.update(success=True)
+                try:
+                    await self._record_success_async(call, route, phase, request, result, usage, max_tokens,
+                                                     elapsed, ttft, budget, items, cache_key)
+                except Exception as e:
+                    print(f"⚠️ Statistiques de l'appel non enregistrées : {e}")
+                return result
+        
+        return self._generate_mock_content(prompt)
+
+    async def _record_success_async(self, call: Dict, route: Route, phase: Optional[str], request: Dict,
+                                    result: str, usage, max_tokens: int, elapsed: float, ttft: Optional[float],
+                                    budget: Optional[str], items: int, cache_key: Optional[str]):
+        if ttft is not None:
+            await self.circuit_breaker.record_async(route.model, True, ttft)
+        else:
+            await self.circuit_breaker.record_async(route.model, True, elapsed, max_tokens)
+        await self.router.record_async(route, phase, elapsed, True)
+        
+        add_usage(usage)
+        prompt_tokens, completion_tokens = self._log_usage(route, usage, request, result, max_tokens)
+        call.update(tokens=(prompt_tokens, completion_tokens))
+        if call['hedged']:
+            self._count_hedge(call, usage)
+        if budget and self.providers[route.provider].remote:
+            await self.token_budget.record_async(budget, completion_tokens, max_tokens, items)
+        if cache_key:
+            await self.completion_cache.set_async(cache_key, result)
+
+    async def _call_api_json_async(self, prompt: str, schema: Dict, max_tokens: int = 500,
+                                   budget: Optional[str] = None, items: int = 1) -> Optional[Dict]:
+        """
+        Variante asynchrone de _call_api_json
+        """
+        route = await self.router.choose_async(_current_phase.get())
+        if not route:
+            print("⚠️ Mode démo - contenu de secours")
+            return None
+        
+        response = await self._call_api_async(prompt, max_tokens, json_mode=True, route=route, budget=budget, items=items)
+        try:
+            return decode_json(response, schema)
+        except SchemaError as e:
+            print(f"⚠️ Réponse JSON non conforme : {e}")
+            await self.completion_cache.delete_async(self._cache_key(prompt, max_tokens, json_mode=True, model=route.model))
+            if budget and await self.token_budget.max_tokens_async(budget, max_tokens, items) < max_tokens:
+                print(f"🔁 Nouvelle tentative avec max_tokens={max_tokens}")
+                return await self._call_api_json_async(prompt, schema, max_tokens)
+            if not _fallback_allowed.get():
+                raise
+            return None
+
+    async def generate_game_title_async(self, genre: str, ambiance: str, keywords: List[str]) -> str:
+        title = await self._call_api_async(self._title_prompt(genre, ambiance, keywords), max_tokens=50, budget='title')
+        return self._parse_title(title)
+
+    async def generate_universe_async(self, game_title: str, genre: str, ambiance: str, keywords: str) -> Dict[str, str]:
+        data = await self._call_api_json_async(self._universe_prompt(game_title, genre, ambiance, keywords), UNIVERSE_SCHEMA, max_tokens=400, budget='universe')
+        return self._parse_universe(data, genre, ambiance, keywords)
+
+    async def generate_scenario_async(self, game_title: str, universe_description: str, genre: str) -> Dict[str, str]:
+        data = await self._call_api_json_async(self._scenario_prompt(game_title, universe_description, genre), SCENARIO_SCHEMA, max_tokens=600, budget='scenario')
+        return self._parse_scenario(data)
+
+    async def generate_characters_async(self, game_title: str, genre: str, num_characters: int = 3, ambiance: str = None, mots_cles: str = None, universe_description: str = None) -> List[Dict[str, str]]:
+        prompt = self._characters_prompt(game_title, genre, num_characters, ambiance, mots_cles, universe_description)
+        data = await self._call_api_json_async(prompt, CHARACTERS_SCHEMA, max_tokens=800, budget='characters', items=num_characters)
+        return self._parse_characters(data, game_title, genre, ambiance, num_characters)
+
+    async def generate_locations_async(self, game_title: str, universe: str, num_locations: int = 4, genre: str = None, ambiance: str = None, mots_cles: str = None) -> List[Dict[str, str]]:
+        prompt = self._locations_prompt(game_title, universe, num_locations, genre, ambiance, mots_cles)
+        data = await self._call_api_json_async(prompt, LOCATIONS_SCHEMA, max_tokens=700, budget='locations', items=num_locations)
+        return self._parse_locations(data, game_title, universe, genre, ambiance, num_locations)
+
+    async def generate_world_bundle_async(self, genre: str, ambiance: str, mots_cles: str, num_characters: int = 3,
+                                          num_locations: int = 4) -> Optional[Dict]:
+        prompt = self._world_bundle_prompt(genre, ambiance, mots_cles, num_characters, num_locations)
+        data = await self._call_api_json_async(prompt, WORLD_BUNDLE_SCHEMA, max_tokens=2500, budget='bundle')
+        return self._parse_world_bundle(data, genre, ambiance, mots_cles, num_characters, num_locations)
+
+    async def generate_game_image_async(self, game_title: str, genre: str, ambiance: str, universe_description: str) -> str:
+        prompt = self._image_description_prompt(game_title, genre, ambiance, universe_description)
+        image_description = await self._call_api_async(prompt, max_tokens=300, budget='image_description')
+        return image_description.strip()
+
+    async def generate_and_save_image_async(self, game_title: str, genre: str, ambiance: str, universe_description: str) -> Dict:
+        """
+        Variante asynchrone de generate_and_save_image
+        """
+        client = self._get_async_client()
+        # La recherche / création de l'agent passe par la base : hors de la boucle
+        agent_id = await sync_to_async(lambda: self.image_agent_id)()
+        
+        if not client or not agent_id:
+            print("⚠️ Mode démo - génération d'image désactivée")
+            description = await self.generate_game_image_async(game_title, genre, ambiance, universe_description)
+            return {
+                'description': description,
+                'image_data': None,
+                'image_url': None
+            }
+        
+        prompt = self._cover_prompt(game_title, genre, ambiance, universe_description)
+        
+        try:
+            print(f"🎨 Génération d'image pour '{game_title}'...")
+            async with self.rate_limiter.slot_async(IMAGE_AGENT_MODEL):
+                response = await client.beta.conversations.start_async(
+                    agent_id=agent_id,
+                    inputs=prompt
+                )
+            file_id = self._find_image_file_id(response)
+            
+            if file_id:
+                print(f"⬇️ Téléchargement de l'image...")
+                download = await client.files.download_async(file_id=file_id)
+                file_bytes = await download.aread()
+                print(f"✅ Image téléchargée ({len(file_bytes)} bytes)")
+                return {
+                    'description': prompt,
+                    'image_data': ContentFile(file_bytes),
+                    'image_url': None
+                }
+            
+            print("⚠️ Aucune image générée dans la réponse")
+        except Exception as e:
+            print(f"❌ Erreur lors de la génération d'image: {e}")
+        
+        description = await self.generate_game_image_async(game_title, genre, ambiance, universe_description)
+        return {
+            'description': description,
+            'image_data': None,
+            'image_url': None
+        }
+
+    async def generate_full_game_async(self, genre: str, ambiance: str, mots_cles: str, num_characters: int = 3,
+                                       num_locations: int = 4, timeouts: Optional[Dict[str, float]] = None,
+                                       on_phase: Optional[Callable] = None,
+                                       mode: str = 'chained', with_image: bool = True,
+                                       on_partial: Optional[Callable] = None,
+                                       checkpoint: Optional[Dict] = None,
+                                       on_checkpoint: Optional[Callable] = None,
+                                       fallback: bool = True) -> Dict:
+        """
+        Variante asynchrone de generate_full_game.
+        on_phase, on_partial et on_checkpoint peuvent être des fonctions ou des coroutines.
+        """
+        timeouts = {**PHASE_TIMEOUTS, **(timeouts or {})}
+        keywords_list = [k.strip() for k in mots_cles.split(',') if k.strip()]
+        result = self._empty_game_result()
+        self._restore_checkpoint(result, checkpoint)
+        failed = []
+
+        async def notify(phase: str, state: str):
+            if on_phase:
+                outcome = on_phase(phase, state)
+                if inspect.isawaitable(outcome):
+                    await outcome
+
+        async def save_checkpoint(phase: str, value):
+            if on_checkpoint:
+                outcome = on_checkpoint(phase, value)
+                if inspect.isawaitable(outcome):
+                    await outcome
+
+        def check_failures():
+            if failed:
+                raise GenerationPhaseError({phase: result['errors'][phase] for phase in failed})
+
+        def enter_phase(phase: str) -> Callable[[], None]:
+            # wait_for exécute l'étape dans une tâche qui hérite du contexte courant
+            sink = _partial_sink.set((lambda text: on_partial(phase, text)) if on_partial else None)
+            allowed = _fallback_allowed.set(fallback)
+            current = _current_phase.set(phase)
+
+            def leave():
+                _current_phase.reset(current)
+                _fallback_allowed.reset(allowed)
+                _partial_sink.reset(sink)
+            return leave
+
+        async def run_phase(phase: str, coro):
+            await notify(phase, 'start')
+            started = time.monotonic()
+            value = None
+            leave_phase = enter_phase(phase)
+            try:
+                value = await asyncio.wait_for(coro, timeout=timeouts[phase])
+            except asyncio.TimeoutError:
+                print(f"⏱️ Étape '{phase}' hors délai ({timeouts[phase]}s)")
+                result['errors'][phase] = f"Délai de {timeouts[phase]}s dépassé"
+            except Exception as e:
+                print(f"❌ Étape '{phase}' en erreur : {e}")
+                result['errors'][phase] = str(e)
+            finally:
+                leave_phase()
+            if value is None and not fallback:
+                failed.append(phase)
+                return
+            self._store_phase_result(result, phase, value, started, genre, ambiance, mots_cles, num_characters, num_locations)
+            if value is not None:
+                await save_checkpoint(phase, value)
+            await notify(phase, 'done')
+
+        async def run_bundle():
+            for phase in BUNDLE_PHASES:
+                await notify(phase, 'start')
+            started = time.monotonic()
+            bundle = None
+            leave_phase = enter_phase('bundle')
+            try:
+                bundle = await asyncio.wait_for(
+                    self.generate_world_bundle_async(genre, ambiance, mots_cles, num_characters, num_locations),
+                    timeout=timeouts['bundle']
+                )
+            except asyncio.TimeoutError:
+                print(f"⏱️ Étape 'bundle' hors délai ({timeouts['bundle']}s)")
+                result['errors']['bundle'] = f"Délai de {timeouts['bundle']}s dépassé"
+            except Exception as e:
+                print(f"❌ Étape 'bundle' en erreur : {e}")
+                result['errors']['bundle'] = str(e)
+            finally:
+                leave_phase()
+            # Sans réponse exploitable, les étapes sont relancées en mode enchaîné
+            if bundle:
+                self._store_bundle_result(result, bundle, started, genre, ambiance, mots_cles, num_characters, num_locations)
+                for phase in BUNDLE_PHASES:
+                    await save_checkpoint(phase, result['titre' if phase == 'title' else phase])
+                    await notify(phase, 'done')
+
+        if mode == 'bundle' and not checkpoint:
+            await run_bundle()
+
+        # 1. Titre puis univers
+        if result['titre'] is None:
+            await run_phase('title', self.generate_game_title_async(genre, ambiance, keywords_list))
+            check_failures()
+        if result['universe'] is None:
+            await run_phase('universe', self.generate_universe_async(result['titre'], genre, ambiance, mots_cles))
+            check_failures()
+        titre = result['titre']
+        universe_description = result['universe']['description']
+
+        # 2. Étapes indépendantes en parallèle (seulement celles qui manquent)
+        phases = []
+        if result['scenario'] is None:
+            phases.append(run_phase('scenario', self.generate_scenario_async(titre, universe_description, genre)))
+        if result['characters'] is None:
+            phases.append(run_phase('characters', self.generate_characters_async(titre, genre, num_characters, ambiance, mots_cles, universe_description)))
+        if result['locations'] is None:
+            phases.append(run_phase('locations', self.generate_locations_async(titre, universe_description, num_locations, genre, ambiance, mots_cles)))
+        if with_image and result['image'] is None:
+            phases.append(run_phase('image', self.generate_and_save_image_async(titre, genre, ambiance, universe_description)))
+        await asyncio.gather(*phases)
+        check_failures()
+
+        print(f"⏱️ Durées par étape : {result['timings']}")
+        return result
+
+    async def regenerate_section_async(self, game, section: str, count: Optional[int] = None,
+                                       on_partial: Optional[Callable] = None):
+        """
+        Variante asynchrone de regenerate_section (game.universe doit être déjà chargé)
+        """
+        fn = getattr(self, f"{SECTION_METHODS[section]}_async")
+        args = self._section_args(game, section, count)
+        sink = _partial_sink.set((lambda text: on_partial(section, text)) if on_partial else None)
+        allowed = _fallback_allowed.set(False)
+        bypass = _cache_bypass.set(True)
+        current = _current_phase.set(section)
+        try:
+            return self._check_regenerated(section, await fn(*args))
+        finally:
+            _current_phase.reset(current)
+            _cache_bypass.reset(bypass)
+            _fallback_allowed.reset(allowed)
+            _partial_sink.reset(sink)
+
     def generate_random_game_params(self) -> Dict[str, str]:
         """
         Génère des paramètres aléatoires pour un jeu
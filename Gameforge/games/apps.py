@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class GamesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'games'
+
+    def ready(self):
+        # Index de recherche tenu à jour par les signaux des modèles
+        from . import search  # noqa: F401
+        # Fragments HTML en cache invalidés par les signaux des modèles
+        from . import fragments  # noqa: F401
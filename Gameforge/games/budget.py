@@ -0,0 +1,150 @@
+"""
+Budget de jetons par étape
+max_tokens de chaque appel est déduit des longueurs de réponse observées pour
+son étape : un percentile élevé (PERCENTILE) avec une marge (HEADROOM), borné
+autour de la valeur par défaut de l'appel. Les générations anormalement
+longues sont coupées plus tôt sans tronquer les réponses habituelles ; une
+réponse coupée à la limite fait remonter le budget suivant.
+Le contexte repris dans les prompts (description de l'univers, ...) est
+limité en jetons plutôt qu'en caractères, et coupé en fin de phrase ou de mot.
+Les longueurs sont stockées en base pour être partagées par tous les processus.
+"""
+
+import math
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .hedging import percentile
+from .models import CompletionLengthStats
+
+
+DEFAULT_TOKEN_BUDGET = {
+    'ENABLED': True,
+    'PERCENTILE': 99,     # longueur observée retenue
+    'HEADROOM': 1.25,     # marge au-dessus de cette longueur
+    'MIN_SAMPLES': 20,    # réponses mesurées avant d'ajuster max_tokens
+    'WINDOW': 200,        # dernières réponses retenues par étape
+    'MIN_RATIO': 0.5,     # max_tokens jamais sous la moitié de la valeur par défaut
+    'MAX_RATIO': 2.0,     # ni au-delà du double
+    'REFRESH': 30,        # secondes de validité d'un budget calculé dans le processus
+}
+
+# Mots (un mot long compte pour plusieurs jetons) et signes de ponctuation
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def _piece_tokens(piece: str) -> int:
+    return 1 + len(piece) // 6
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Nombre de jetons approché d'un texte (sans tokenizer : environ 4 caractères par jeton en français)"""
+    return sum(_piece_tokens(piece) for piece in _TOKEN_PATTERN.findall(text or ''))
+
+
+def truncate_tokens(text: Optional[str], budget: int) -> str:
+    """Coupe `text` à environ `budget` jetons, en fin de phrase si possible, sinon en fin de mot"""
+    text = text or ''
+    used = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        used += _piece_tokens(match.group())
+        if used > budget:
+            cut = text[:match.start()].rstrip()
+            sentence_end = max(cut.rfind('.'), cut.rfind('!'), cut.rfind('?'))
+            # Fin de phrase assez proche de la limite : le contexte reste lisible
+            if sentence_end >= len(cut) * 0.6:
+                return cut[:sentence_end + 1]
+            return cut.rstrip(',;:') + '…'
+    return text
+
+
+class TokenBudget:
+    def __init__(self, config: Optional[dict] = None):
+        config = {**DEFAULT_TOKEN_BUDGET, **(config or getattr(settings, 'TOKEN_BUDGET', {}))}
+        self.enabled = bool(config['ENABLED'])
+        self.percentile = float(config['PERCENTILE'])
+        self.headroom = float(config['HEADROOM'])
+        self.min_samples = int(config['MIN_SAMPLES'])
+        self.window = int(config['WINDOW'])
+        self.min_ratio = float(config['MIN_RATIO'])
+        self.max_ratio = float(config['MAX_RATIO'])
+        self.refresh = float(config['REFRESH'])
+        # Longueur retenue par étape : {étape: (expiration, jetons par élément ou None)}
+        self._observed = {}
+        self._lock = threading.Lock()
+
+    def _observed_length(self, phase: str) -> Optional[float]:
+        """Percentile des jetons par élément des dernières réponses de l'étape (None : pas assez de mesures)"""
+        with self._lock:
+            expires, length = self._observed.get(phase, (0, None))
+        if time.monotonic() < expires:
+            return length
+        # Lecture en base hors du verrou : au pire deux threads la font en même temps
+        stats = CompletionLengthStats.objects.filter(phase=phase).first()
+        samples = stats.samples if stats else []
+        length = percentile(samples, self.percentile) if len(samples) >= self.min_samples else None
+        with self._lock:
+            self._observed[phase] = (time.monotonic() + self.refresh, length)
+        return length
+
+    def max_tokens(self, phase: str, default: int, items: int = 1) -> int:
+        """
+        max_tokens d'un appel de l'étape `phase` produisant `items` éléments
+        (personnages, lieux) ; `default` tant que l'étape n'est pas assez mesurée
+        """
+        if not self.enabled:
+            return default
+        length = self._observed_length(phase)
+        if length is None:
+            return default
+        budget = math.ceil(length * items * self.headroom)
+        return max(int(default * self.min_ratio), min(int(default * self.max_ratio), budget))
+
+    def record(self, phase: str, completion_tokens: int, max_tokens: int, items: int = 1) -> bool:
+        """
+        Enregistre la longueur d'une réponse ; retourne True si elle a été coupée
+        à max_tokens (sa longueur, sous-estimée, fait alors remonter le budget)
+        """
+        truncated = completion_tokens >= max_tokens
+        for _ in range(5):
+            try:
+                stats, created = CompletionLengthStats.objects.get_or_create(phase=phase)
+            except IntegrityError:
+                continue
+            samples = (stats.samples + [round(completion_tokens / max(items, 1), 1)])[-self.window:]
+            updated = CompletionLengthStats.objects.filter(id=stats.id, version=stats.version).update(
+                samples=samples, updated_at=timezone.now(), version=F('version') + 1
+            )
+            if updated:
+                break
+        if truncated:
+            # Budget recalculé dès l'appel suivant, sans attendre REFRESH
+            with self._lock:
+                self._observed.pop(phase, None)
+        return truncated
+
+    def stats(self) -> List[Dict]:
+        """Nombre de réponses et longueurs observées (jetons par élément) de chaque étape"""
+        return [
+            {
+                'phase': stats.phase,
+                'samples': len(stats.samples),
+                'p50': percentile(stats.samples, 50),
+                'p99': percentile(stats.samples, 99),
+            }
+            for stats in CompletionLengthStats.objects.order_by('phase')
+        ]
+
+    async def max_tokens_async(self, phase: str, default: int, items: int = 1) -> int:
+        return await sync_to_async(self.max_tokens)(phase, default, items)
+
+    async def record_async(self, phase: str, completion_tokens: int, max_tokens: int, items: int = 1) -> bool:
+        return await sync_to_async(self.record)(phase, completion_tokens, max_tokens, items)
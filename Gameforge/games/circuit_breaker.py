@@ -0,0 +1,159 @@
+"""
+Disjoncteur (circuit breaker) des appels à l'API Mistral
+Quand trop d'appels échouent ou sont trop lents dans la fenêtre d'observation,
+le circuit s'ouvre : les appels suivants ne sont plus tentés et passent
+directement au contenu de secours, sans retry ni attente. Après OPEN_DURATION
+secondes, un seul appel de sonde est autorisé (semi-ouvert) : s'il réussit le
+circuit se referme, sinon il reste ouvert pour une nouvelle période.
+L'état est stocké en base pour être partagé par tous les processus.
+"""
+
+import hashlib
+import time
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+
+from .models import CircuitBreakerState
+
+
+DEFAULT_CIRCUIT_BREAKER = {
+    'WINDOW': 60,          # secondes d'observation des appels
+    'MIN_CALLS': 5,        # appels minimum dans la fenêtre avant de pouvoir ouvrir le circuit
+    'ERROR_RATE': 0.5,     # proportion d'échecs qui ouvre le circuit
+    'SLOW_CALL': 30,       # secondes : un appel plus long compte comme un échec
+    'SLOW_CALL_TOKENS': 1000,  # jetons demandés couverts par SLOW_CALL ; au-delà, le seuil croît en proportion
+    'OPEN_DURATION': 30,   # secondes avant l'appel de sonde
+}
+
+
+class CircuitOpen(Exception):
+    """Circuit ouvert : l'API est considérée indisponible, l'appel n'est pas tenté"""
+
+
+class CircuitBreaker:
+    def __init__(self, api_key: Optional[str], config: Optional[dict] = None):
+        config = {**DEFAULT_CIRCUIT_BREAKER, **(config or getattr(settings, 'MISTRAL_CIRCUIT_BREAKER', {}))}
+        self.window = float(config['WINDOW'])
+        self.min_calls = int(config['MIN_CALLS'])
+        self.error_rate = float(config['ERROR_RATE'])
+        self.slow_call = float(config['SLOW_CALL'])
+        self.slow_call_tokens = int(config['SLOW_CALL_TOKENS'])
+        self.open_duration = float(config['OPEN_DURATION'])
+        # Même empreinte de clé que le limiteur de débit
+        self.key_prefix = hashlib.sha256((api_key or 'demo').encode()).hexdigest()[:16]
+
+    def breaker_key(self, model: str) -> str:
+        return f"{self.key_prefix}:{model}"
+
+    def _state(self, key: str) -> CircuitBreakerState:
+        try:
+            breaker, created = CircuitBreakerState.objects.get_or_create(
+                key=key, defaults={'window_start': time.time()}
+            )
+        except IntegrityError:
+            breaker = CircuitBreakerState.objects.get(key=key)
+        return breaker
+
+    def is_open(self, model: str) -> bool:
+        """Circuit ouvert ou sonde en cours (lecture seule, sans prendre la sonde)"""
+        return CircuitBreakerState.objects.filter(key=self.breaker_key(model)).exclude(state='closed').exists()
+
+    def open_models(self, models) -> set:
+        """Modèles dont le circuit est ouvert ou en sonde, parmi `models` (une requête)"""
+        keys = {self.breaker_key(model): model for model in models}
+        return {
+            keys[key] for key in
+            CircuitBreakerState.objects.filter(key__in=keys).exclude(state='closed').values_list('key', flat=True)
+        }
+
+    def allow(self, model: str) -> bool:
+        """
+        Indique si un appel peut être tenté. Circuit ouvert depuis OPEN_DURATION
+        secondes : un seul processus obtient l'appel de sonde.
+        """
+        key = self.breaker_key(model)
+        breaker = self._state(key)
+        if breaker.state == 'closed':
+            return True
+        now = time.time()
+        if now < breaker.retry_at:
+            return False
+        # La sonde a une échéance : si son processus s'arrête, une autre sera lancée
+        probing = CircuitBreakerState.objects.filter(key=key, version=breaker.version).update(
+            state='half_open',
+            retry_at=now + self.open_duration,
+            version=F('version') + 1,
+        )
+        if probing:
+            print(f"🔌 Circuit semi-ouvert pour {model} : appel de sonde")
+        return bool(probing)
+
+    def _after_call(self, breaker: CircuitBreakerState, success: bool, now: float) -> Optional[dict]:
+        """Nouvel état du disjoncteur après un appel (None : rien à changer)"""
+        if breaker.state == 'open':
+            # Appel lancé avant l'ouverture du circuit
+            return None
+        if breaker.state == 'half_open':
+            if success:
+                return {'state': 'closed', 'calls': 0, 'failures': 0, 'window_start': now, 'retry_at': 0}
+            return {'state': 'open', 'retry_at': now + self.open_duration}
+
+        calls, failures, window_start = breaker.calls, breaker.failures, breaker.window_start
+        if now - window_start > self.window:
+            calls, failures, window_start = 0, 0, now
+        calls += 1
+        failures += 0 if success else 1
+        changes = {'calls': calls, 'failures': failures, 'window_start': window_start}
+        if calls >= self.min_calls and failures >= calls * self.error_rate:
+            changes.update(state='open', retry_at=now + self.open_duration)
+        return changes
+
+    def slow_threshold(self, max_tokens: Optional[int] = None) -> float:
+        """Durée au-delà de laquelle un appel est lent, proportionnelle aux jetons demandés"""
+        if not max_tokens or self.slow_call_tokens <= 0:
+            return self.slow_call
+        return self.slow_call * max(1.0, max_tokens / self.slow_call_tokens)
+
+    def record(self, model: str, success: bool, duration: float = 0.0, max_tokens: Optional[int] = None):
+        """
+        Enregistre le résultat d'un appel ; un appel trop lent compte comme un échec.
+        `duration` : durée complète de l'appel, dont le seuil dépend de max_tokens
+        (sans max_tokens, par exemple le délai du premier fragment d'un streaming : SLOW_CALL)
+        """
+        threshold = self.slow_threshold(max_tokens)
+        if success and duration > threshold:
+            print(f"🐢 Appel lent ({duration:.1f}s > {threshold:.0f}s) compté comme un échec")
+            success = False
+        key = self.breaker_key(model)
+        for _ in range(5):
+            breaker = self._state(key)
+            changes = self._after_call(breaker, success, time.time())
+            if changes is None:
+                return
+            updated = CircuitBreakerState.objects.filter(key=key, version=breaker.version).update(
+                version=F('version') + 1, **changes
+            )
+            if not updated:
+                # Un autre processus a modifié l'état entre-temps : on réessaie
+                continue
+            state = changes.get('state', breaker.state)
+            if state == 'open' and breaker.state != 'open':
+                print(f"🔌 Circuit ouvert pour {model} ({changes.get('failures', 1)}/{changes.get('calls', 1)} échecs) : "
+                      f"appels suspendus {self.open_duration:.0f}s")
+            elif state == 'closed' and breaker.state == 'half_open':
+                print(f"✅ Circuit refermé pour {model}")
+            return
+
+    async def is_open_async(self, model: str) -> bool:
+        return await sync_to_async(self.is_open)(model)
+
+    async def allow_async(self, model: str) -> bool:
+        return await sync_to_async(self.allow)(model)
+
+    async def record_async(self, model: str, success: bool, duration: float = 0.0,
+                           max_tokens: Optional[int] = None):
+        await sync_to_async(self.record)(model, success, duration, max_tokens)
@@ -0,0 +1,179 @@
+"""
+Cache des réponses de l'API de complétion
+Deux niveaux par défaut : mémoire du processus (LRU) puis base de données,
+avec expiration (TTL) et nombre d'entrées borné. Clé = modèle, prompt
+système, prompt utilisateur et paramètres d'échantillonnage.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import CachedCompletion
+
+
+DEFAULT_COMPLETION_CACHE = {
+    'ENABLED': True,
+    'TTL': 7 * 24 * 3600,        # secondes
+    'TIERS': ['memory', 'database'],
+    'MEMORY_MAX_ENTRIES': 500,
+    'DB_MAX_ENTRIES': 20000,
+    'DB_EVICT_EVERY': 100,       # écritures entre deux purges du niveau base
+}
+
+
+class MemoryCacheTier:
+    """Niveau mémoire : LRU borné, propre au processus"""
+    name = 'memory'
+
+    def __init__(self, config: dict):
+        self.max_entries = config['MEMORY_MAX_ENTRIES']
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class DatabaseCacheTier:
+    """Niveau persistant : partagé entre processus et conservé après redémarrage"""
+    name = 'database'
+
+    def __init__(self, config: dict):
+        self.max_entries = config['DB_MAX_ENTRIES']
+        self.evict_every = max(1, config['DB_EVICT_EVERY'])
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        now = timezone.now()
+        entry = CachedCompletion.objects.filter(key=key, expires_at__gt=now).only('response').first()
+        if entry is None:
+            return None
+        CachedCompletion.objects.filter(key=key).update(last_used=now)
+        return entry.response
+
+    def set(self, key: str, value: str, ttl: float):
+        now = timezone.now()
+        CachedCompletion.objects.update_or_create(
+            key=key,
+            defaults={'response': value, 'expires_at': now + timedelta(seconds=ttl), 'last_used': now}
+        )
+        # Purge (COUNT + DELETE) toutes les `evict_every` écritures seulement : la table
+        # peut dépasser DB_MAX_ENTRIES d'au plus autant d'entrées par processus
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.evict_every == 0
+        if evict:
+            self._evict(now)
+
+    def delete(self, key: str):
+        CachedCompletion.objects.filter(key=key).delete()
+
+    def _evict(self, now):
+        CachedCompletion.objects.filter(expires_at__lte=now).delete()
+        excess = CachedCompletion.objects.count() - self.max_entries
+        if excess > 0:
+            oldest = list(CachedCompletion.objects.order_by('last_used').values_list('id', flat=True)[:excess])
+            CachedCompletion.objects.filter(id__in=oldest).delete()
+
+
+TIER_CLASSES = {
+    'memory': MemoryCacheTier,
+    'database': DatabaseCacheTier,
+}
+
+
+class CompletionCache:
+    def __init__(self, config: Optional[dict] = None):
+        config = {**DEFAULT_COMPLETION_CACHE, **(config or getattr(settings, 'COMPLETION_CACHE', {}))}
+        self.enabled = config['ENABLED']
+        self.ttl = config['TTL']
+        # Un niveau est soit un nom connu, soit le chemin d'une classe (ex: 'monapp.cache.RedisTier')
+        self.tiers = [
+            (TIER_CLASSES.get(tier) or import_string(tier))(config)
+            for tier in config['TIERS']
+        ]
+        self._counters = {'hits': 0, 'misses': 0, **{f"{tier.name}_hits": 0 for tier in self.tiers}}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, prompt: str, params: Dict) -> str:
+        payload = json.dumps([model, system_prompt, prompt, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        for index, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                # Remonter l'entrée dans les niveaux plus rapides
+                for upper in self.tiers[:index]:
+                    upper.set(key, value, self.ttl)
+                self._count('hits')
+                self._count(f"{tier.name}_hits")
+                return value
+        self._count('misses')
+        return None
+
+    def set(self, key: str, value: str):
+        if not self.enabled:
+            return
+        for tier in self.tiers:
+            tier.set(key, value, self.ttl)
+
+    def delete(self, key: str):
+        """Retire une réponse de tous les niveaux (ex: réponse inutilisable)"""
+        for tier in self.tiers:
+            tier.delete(key)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        return await sync_to_async(self.get)(key)
+
+    async def set_async(self, key: str, value: str):
+        await sync_to_async(self.set)(key, value)
+
+    async def delete_async(self, key: str):
+        await sync_to_async(self.delete)(key)
+
+    def stats(self) -> Dict[str, float]:
+        """Compteurs de hits/misses du processus"""
+        with self._lock:
+            stats = dict(self._counters)
+        total = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / total, 3) if total else 0.0
+        return stats
@@ -0,0 +1,102 @@
+"""
+Fil des jeux publics de la page d'accueil, paginé par curseur (keyset)
+Les jeux sont triés du plus récent au plus ancien sur (date_creation, id) ;
+le curseur est la position du dernier jeu affiché. Chaque page est lue par
+l'index (est_public, date_creation, id) sans OFFSET : son coût ne dépend pas
+du nombre de jeux en base ni de la profondeur de la page.
+Une recherche suit l'ordre de pertinence de l'index plein texte (search.py),
+paginé de la même façon sur (rang, id).
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from django.db.models import Q
+
+from .models import Game
+from . import search
+
+
+FEED_PAGE_SIZE = 24
+
+# Champs affichés sur une carte de jeu (voir _game_cards.html)
+CARD_FIELDS = ('titre', 'genre', 'ambiance', 'mots_cles', 'date_creation', 'likes_count', 'version', 'createur__username')
+
+
+def encode_cursor(position: List) -> str:
+    """Position du dernier jeu affiché, opaque pour le client"""
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[List]:
+    """Position d'un curseur, None s'il est absent ou invalide (première page)"""
+    if not cursor:
+        return None
+    try:
+        position = json.loads(base64.urlsafe_b64decode((cursor + '=' * (-len(cursor) % 4)).encode()))
+    except ValueError:
+        return None
+    return position if isinstance(position, list) and len(position) == 2 else None
+
+
+def public_games(query: Optional[str] = None):
+    """Jeux publics, éventuellement filtrés par une recherche (sans index plein texte), dans l'ordre du fil"""
+    games = Game.objects.filter(est_public=True)
+    if query:
+        games = games.filter(
+            Q(titre__icontains=query) |
+            Q(genre__icontains=query) |
+            Q(mots_cles__icontains=query)
+        )
+    return games.select_related('createur').only(*CARD_FIELDS).order_by('-date_creation', '-id')
+
+
+def _search_page(query: str, position: Optional[List], size: int) -> Dict:
+    """Page de résultats d'une recherche, par pertinence"""
+    after = None
+    if position:
+        try:
+            after = (float(position[0]), int(position[1]))
+        except (TypeError, ValueError):
+            pass
+    # Un résultat de plus que la page : indique s'il reste une page suivante
+    ranked = search.search_page(query, after, size + 1)
+    has_more = len(ranked) > size
+    ranked = ranked[:size]
+    games = Game.objects.select_related('createur').only(*CARD_FIELDS).in_bulk([game_id for game_id, rank in ranked])
+    return {
+        # Jeu supprimé entre les deux requêtes : ignoré
+        'games': [games[game_id] for game_id, rank in ranked if game_id in games],
+        'next_cursor': encode_cursor([ranked[-1][1], ranked[-1][0]]) if has_more else None,
+    }
+
+
+def feed_page(query: Optional[str] = None, cursor: Optional[str] = None, size: int = FEED_PAGE_SIZE) -> Dict:
+    """
+    Une page du fil après `cursor` : {'games': [...], 'next_cursor': curseur
+    de la page suivante ou None s'il n'y en a plus}
+    """
+    position = decode_cursor(cursor)
+    if query and search.is_available():
+        return _search_page(query, position, size)
+
+    games = public_games(query)
+    if position:
+        try:
+            date_creation, game_id = datetime.fromisoformat(position[0]), int(position[1])
+        except (TypeError, ValueError):
+            pass
+        else:
+            games = games.filter(
+                Q(date_creation__lt=date_creation) | Q(date_creation=date_creation, id__lt=game_id)
+            )
+    # Un jeu de plus que la page : indique s'il reste une page suivante
+    page = list(games[:size + 1])
+    has_more = len(page) > size
+    page = page[:size]
+    return {
+        'games': page,
+        'next_cursor': encode_cursor([page[-1].date_creation.isoformat(), page[-1].id]) if has_more else None,
+    }
@@ -1,5 +1,9 @@
+import uuid
+
 from django import forms
+from django.conf import settings
 from .models import Game
+from .ai_service import GENERATION_MODES
 
 
 class GameCreationForm(forms.Form):
@@ -39,4 +43,25 @@ class GameCreationForm(forms.Form):
         initial=True,
         widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         label="Rendre le jeu public"
-    )
\ No newline at end of file
+    )
+    
+    mode = forms.ChoiceField(
+        choices=GENERATION_MODES,
+        required=False,
+        initial=lambda: settings.GENERATION_MODE,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        label="Mode de génération",
+        help_text="La complétion unique génère tout le contenu texte en un seul appel (plus rapide, moins de jetons)"
+    )
+    
+    # Jeton propre à chaque affichage du formulaire : un double envoi ou un renvoi
+    # du navigateur retrouve la génération déjà lancée (voir enqueue_generation)
+    idempotency_key = forms.CharField(
+        max_length=64,
+        required=False,
+        initial=lambda: uuid.uuid4().hex,
+        widget=forms.HiddenInput()
+    )
+    
+    def clean_mode(self):
+        return self.cleaned_data['mode'] or settings.GENERATION_MODE
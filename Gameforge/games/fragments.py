@@ -0,0 +1,103 @@
+"""
+Cache des fragments HTML rendus des jeux
+Un jeu ne change presque plus après sa génération : l'en-tête et le corps de
+sa page de détail, et sa carte (accueil, favoris), sont rendus une fois puis
+lus dans le cache. La clé contient l'id du jeu et sa version (Game.version),
+incrémentée par les signaux à chaque modification du jeu, de son univers, de
+son scénario, de ses personnages, lieux ou visuels : un fragment périmé n'est
+plus jamais lu et expire de lui-même. Game.updated_at est mis à jour en même
+temps (en-têtes HTTP, voir http_cache.py). La version étant en base,
+l'invalidation vaut pour tous les processus, même avec un cache propre à
+chaque processus.
+Ce qui dépend du visiteur (favori, actions du créateur) et le nombre de likes
+sont rendus hors des fragments.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from .models import Character, ConceptArt, Game, Location, Scenario, Universe
+
+
+DEFAULT_FRAGMENT_CACHE = {
+    'ENABLED': True,
+    'CACHE': 'default',   # alias du cache Django (settings.CACHES)
+    'TTL': 24 * 3600,     # secondes ; les fragments d'une version dépassée ne sont plus lus
+}
+
+# Gabarit de chaque fragment, rendu avec le jeu seul dans le contexte
+FRAGMENT_TEMPLATES = {
+    'card': 'games/_game_card.html',
+    'detail_header': 'games/_game_detail_header.html',
+    'detail_body': 'games/_game_detail_body.html',
+}
+
+
+def _config() -> dict:
+    return {**DEFAULT_FRAGMENT_CACHE, **getattr(settings, 'FRAGMENT_CACHE', {})}
+
+
+def fragment_key(name: str, game: Game) -> str:
+    return f"gameforge:fragment:{name}:{game.id}:{game.version}"
+
+
+def game_fragments(names: Iterable[str], games: List[Game],
+                   prepare: Optional[Callable[[List[Game]], None]] = None) -> Dict[Tuple[str, int], str]:
+    """
+    Fragments `names` de chaque jeu, {(nom, id du jeu): html}, lus dans le cache
+    en une fois ; les manquants sont rendus après un seul appel à prepare(jeux),
+    qui charge les données des jeux à rendre (personnages, lieux, ...)
+    """
+    config = _config()
+    wanted = {fragment_key(name, game): (name, game) for game in games for name in names}
+    cache = caches[config['CACHE']] if config['ENABLED'] else None
+    found = cache.get_many(list(wanted)) if cache is not None else {}
+
+    missing = {key: item for key, item in wanted.items() if key not in found}
+    if missing:
+        to_render = list({game.id: game for name, game in missing.values()}.values())
+        if prepare is not None:
+            prepare(to_render)
+        rendered = {
+            key: render_to_string(FRAGMENT_TEMPLATES[name], {'game': game})
+            for key, (name, game) in missing.items()
+        }
+        if cache is not None:
+            cache.set_many(rendered, config['TTL'])
+        found.update(rendered)
+
+    return {(name, game.id): mark_safe(found[key]) for key, (name, game) in wanted.items()}
+
+
+def bump_version(game_id: int):
+    """Nouvelle version du jeu : ses fragments en cache ne seront plus lus"""
+    Game.objects.filter(id=game_id).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Game)
+def _game_saved(sender, instance, created, **kwargs):
+    # Un jeu qui vient d'être créé n'a encore aucun fragment en cache
+    if not created:
+        bump_version(instance.id)
+
+
+@receiver(post_save, sender=Universe)
+@receiver(post_save, sender=Scenario)
+@receiver(post_save, sender=Character)
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=ConceptArt)
+@receiver(post_delete, sender=Universe)
+@receiver(post_delete, sender=Scenario)
+@receiver(post_delete, sender=Character)
+@receiver(post_delete, sender=Location)
+@receiver(post_delete, sender=ConceptArt)
+def _game_content_changed(sender, instance, **kwargs):
+    bump_version(instance.game_id)
@@ -0,0 +1,317 @@
+"""
+Requêtes doublées (hedged requests) pour les appels à l'API
+Quand une réponse tarde au-delà du percentile PERCENTILE des durées observées,
+la même requête est envoyée une seconde fois : la première réponse reçue est
+retenue. Les rares appels bloqués sur un serveur lent ne retardent plus toute
+la génération, pour un surcoût limité à environ 5 % des appels.
+Les réponses en streaming (générations suivies par l'utilisateur) sont
+doublées sur le délai du premier fragment (time to first token) : le premier
+appel à émettre du texte est retenu et seul son texte est transmis, l'autre
+est interrompu à son fragment suivant.
+Les durées sont mesurées dans chaque processus, par modèle.
+"""
+
+import asyncio
+import contextvars
+import inspect
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+
+from .rate_limit import DEFAULT_RATE_LIMIT
+
+
+DEFAULT_HEDGING = {
+    'ENABLED': True,
+    'PERCENTILE': 95,     # durée observée au-delà de laquelle la requête est doublée
+    'MIN_SAMPLES': 20,    # durées nécessaires avant de doubler des requêtes
+    'MIN_DELAY': 1.0,     # secondes minimum avant de doubler
+    'HISTORY': 200,       # durées conservées par modèle
+    'MAX_WORKERS': None,  # threads pour les appels synchrones (défaut : 2 × MAX_IN_FLIGHT du limiteur)
+}
+
+
+def percentile(values, pct: float) -> Optional[float]:
+    """Percentile `pct` (0-100) d'une liste de valeurs, None si elle est vide"""
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class HedgeLost(Exception):
+    """Requête doublée devancée par l'autre : son streaming est interrompu"""
+
+
+class _Race:
+    """Premier des appels doublés à répondre (le seul dont le résultat est retenu)"""
+
+    def __init__(self):
+        self.winner = None
+        self._lock = threading.Lock()
+
+    def claim(self, index: int) -> bool:
+        with self._lock:
+            if self.winner is None:
+                self.winner = index
+            return self.winner == index
+
+
+def _ttft_key(key: str) -> str:
+    return f"{key}:ttft"
+
+
+class LatencyTracker:
+    """Durées des derniers appels réussis, par clé"""
+
+    def __init__(self, history: int = 200):
+        self.history = history
+        self._durations: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, duration: float):
+        with self._lock:
+            self._durations.setdefault(key, deque(maxlen=self.history)).append(duration)
+
+    def count(self, key: str) -> int:
+        with self._lock:
+            return len(self._durations.get(key, ()))
+
+    def percentile(self, key: str, pct: float, min_samples: int = 1) -> Optional[float]:
+        """Percentile `pct` des durées observées (None s'il y en a moins de `min_samples`)"""
+        with self._lock:
+            durations = list(self._durations.get(key, ()))
+        if len(durations) < min_samples:
+            return None
+        return percentile(durations, pct)
+
+
+class Hedger:
+    def __init__(self, config: Optional[dict] = None):
+        config = {**DEFAULT_HEDGING, **(config or getattr(settings, 'MISTRAL_HEDGING', {}))}
+        self.enabled = bool(config['ENABLED'])
+        self.percentile = float(config['PERCENTILE'])
+        self.min_samples = int(config['MIN_SAMPLES'])
+        self.min_delay = float(config['MIN_DELAY'])
+        self.latencies = LatencyTracker(int(config['HISTORY']))
+        workers = config['MAX_WORKERS']
+        if workers is None:
+            # Un appel et son doublon pour chaque requête simultanée autorisée par le limiteur
+            rate_limit = {**DEFAULT_RATE_LIMIT, **getattr(settings, 'MISTRAL_RATE_LIMIT', {})}
+            workers = 2 * int(rate_limit['MAX_IN_FLIGHT'])
+        self._executor = ThreadPoolExecutor(max_workers=int(workers), thread_name_prefix='hedge')
+
+    def delay(self, key: str) -> Optional[float]:
+        """Attente avant de doubler une requête (None : pas encore assez de mesures)"""
+        if not self.enabled:
+            return None
+        observed = self.latencies.percentile(key, self.percentile, self.min_samples)
+        return None if observed is None else max(observed, self.min_delay)
+
+    def _timed(self, key: str, fn: Callable):
+        started = time.monotonic()
+        result = fn()
+        self.latencies.add(key, time.monotonic() - started)
+        return result
+
+    def _submit(self, key: str, fn: Callable, started: Optional[threading.Event] = None):
+        context = contextvars.copy_context()
+
+        def task():
+            if started:
+                started.set()
+            return context.run(self._timed, key, fn)
+
+        return self._executor.submit(task)
+
+    def run(self, key: str, fn: Callable, on_duplicate: Optional[Callable[[], None]] = None):
+        """
+        Exécute `fn` ; si elle n'a pas répondu après delay(), la lance une seconde fois
+        et appelle on_duplicate() (la requête doublée est facturée elle aussi)
+        """
+        delay = self.delay(key)
+        if delay is None:
+            return self._timed(key, fn)
+
+        started = threading.Event()
+        primary = self._submit(key, fn, started)
+        # Le délai court depuis le début effectif de l'appel, pas depuis sa mise en file
+        started.wait()
+        done, pending = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        print(f"🏇 Pas de réponse après {delay:.1f}s, requête doublée")
+        if on_duplicate:
+            on_duplicate()
+        pending = {primary, self._submit(key, fn)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # L'appel restant se termine en arrière-plan, sa réponse est ignorée
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    async def _timed_async(self, key: str, factory: Callable[[], Awaitable]):
+        started = time.monotonic()
+        result = await factory()
+        self.latencies.add(key, time.monotonic() - started)
+        return result
+
+    async def run_async(self, key: str, factory: Callable[[], Awaitable],
+                        on_duplicate: Optional[Callable[[], None]] = None):
+        """Variante asynchrone de run() : l'appel perdant est annulé"""
+        delay = self.delay(key)
+        if delay is None:
+            return await self._timed_async(key, factory)
+
+        tasks = {asyncio.ensure_future(self._timed_async(key, factory))}
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                print(f"🏇 Pas de réponse après {delay:.1f}s, requête doublée")
+                if on_duplicate:
+                    on_duplicate()
+                tasks.add(asyncio.ensure_future(self._timed_async(key, factory)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def run_stream(self, key: str, fn: Callable[[Callable[[str], None]], object],
+                   on_partial: Callable[[str], None],
+                   on_duplicate: Optional[Callable[[], None]] = None) -> Tuple[object, float]:
+        """
+        Variante de run() pour un appel en streaming fn(on_partial) : doublé si le
+        premier fragment tarde au-delà du percentile des délais observés.
+        Retourne (résultat, délai du premier fragment du gagnant)
+        """
+        race, ttft = _Race(), {}
+        started, settled = threading.Event(), threading.Event()
+
+        def attempt(index: int):
+            started.set()
+            began = time.monotonic()
+
+            def first_text():
+                ttft[index] = time.monotonic() - began
+                if race.claim(index):
+                    self.latencies.add(_ttft_key(key), ttft[index])
+
+            def forward(text: str):
+                if index not in ttft:
+                    first_text()
+                    settled.set()
+                if race.winner != index:
+                    raise HedgeLost()
+                on_partial(text)
+
+            try:
+                result = fn(forward)
+            finally:
+                # Premier fragment, fin ou échec : la requête n'est plus en attente
+                settled.set()
+            if index not in ttft:
+                # Réponse sans aucun fragment
+                first_text()
+            if race.winner != index:
+                raise HedgeLost()
+            return result
+
+        delay = self.delay(_ttft_key(key))
+        if delay is None:
+            return attempt(0), ttft[0]
+
+        futures = [self._executor.submit(contextvars.copy_context().run, attempt, 0)]
+        started.wait()
+        if not settled.wait(timeout=delay):
+            print(f"🏇 Pas de premier fragment après {delay:.1f}s, requête doublée")
+            if on_duplicate:
+                on_duplicate()
+            futures.append(self._executor.submit(contextvars.copy_context().run, attempt, 1))
+        error = None
+        for future in as_completed(futures):
+            try:
+                # Le perdant s'arrête de lui-même à son fragment suivant
+                return future.result(), ttft[race.winner]
+            except HedgeLost:
+                continue
+            except Exception as e:
+                error = error or e
+        raise error
+
+    async def run_stream_async(self, key: str, factory: Callable[[Callable], Awaitable],
+                               on_partial: Callable,
+                               on_duplicate: Optional[Callable[[], None]] = None) -> Tuple[object, float]:
+        """Variante asynchrone de run_stream() : l'appel perdant est annulé (on_partial peut être une coroutine)"""
+        race, ttft = _Race(), {}
+        settled = asyncio.Event()
+
+        async def attempt(index: int):
+            started = time.monotonic()
+
+            def first_text():
+                ttft[index] = time.monotonic() - started
+                if race.claim(index):
+                    self.latencies.add(_ttft_key(key), ttft[index])
+
+            async def forward(text: str):
+                if index not in ttft:
+                    first_text()
+                    settled.set()
+                if race.winner != index:
+                    raise HedgeLost()
+                outcome = on_partial(text)
+                if inspect.isawaitable(outcome):
+                    await outcome
+
+            try:
+                result = await factory(forward)
+            finally:
+                settled.set()
+            if index not in ttft:
+                first_text()
+            if race.winner != index:
+                raise HedgeLost()
+            return result
+
+        delay = self.delay(_ttft_key(key))
+        if delay is None:
+            return await attempt(0), ttft[0]
+
+        tasks = [asyncio.ensure_future(attempt(0))]
+        try:
+            try:
+                await asyncio.wait_for(settled.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                print(f"🏇 Pas de premier fragment après {delay:.1f}s, requête doublée")
+                if on_duplicate:
+                    on_duplicate()
+                tasks.append(asyncio.ensure_future(attempt(1)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), ttft[race.winner]
+                    if not isinstance(task.exception(), HedgeLost):
+                        error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,89 @@
+"""
+En-têtes de cache HTTP des pages publiques et des visuels générés
+La page d'un jeu public vue par un visiteur anonyme est la même pour tous :
+elle porte un ETag (id, version du contenu, likes) et un Last-Modified
+(Game.updated_at), et une nouvelle visite avec If-None-Match ou
+If-Modified-Since reçoit un 304 sans rendu. Un proxy inverse peut la garder
+PAGE_MAX_AGE secondes.
+Les visuels sous concept_arts/ ne sont jamais réécrits : chaque image reçoit
+un nom unique (unique_media_name). Ils sont servis avec un cache long et
+« immutable » : ni le navigateur ni un proxy ne les redemandent.
+serve_media() ne sert les médias qu'en développement (DEBUG). En production,
+MEDIA_ROOT est servi par le serveur frontal, qui doit poser lui-même ces
+en-têtes sur concept_arts/ (ETag et Last-Modified étant ceux du fichier), par
+exemple avec nginx :
+    location /media/concept_arts/ {
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+"""
+
+import os
+import uuid
+from typing import Optional
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.static import serve
+
+from .models import Game
+
+
+DEFAULT_HTTP_CACHE = {
+    'PAGE_MAX_AGE': 60,              # secondes de réutilisation d'une page publique sans revalidation
+    'MEDIA_MAX_AGE': 365 * 24 * 3600,
+}
+
+# Dossiers de MEDIA_ROOT dont les fichiers ne changent jamais une fois écrits
+IMMUTABLE_MEDIA_DIRS = ('concept_arts/',)
+
+
+def _config() -> dict:
+    return {**DEFAULT_HTTP_CACHE, **getattr(settings, 'HTTP_CACHE', {})}
+
+
+def unique_media_name(name: str) -> str:
+    """Nom de fichier jamais réutilisé ('1_cover.png' -> '1_cover_<jeton>.png')"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}_{uuid.uuid4().hex[:12]}{ext}"
+
+
+def is_shared_page(request, game: Game) -> bool:
+    """Page identique pour tous : jeu public vu par un visiteur anonyme"""
+    return game.est_public and not request.user.is_authenticated
+
+
+def _validators(game: Game) -> dict:
+    return {
+        'etag': f'"{game.id}-{game.version}-{game.likes_count}"',
+        'last_modified': int(game.updated_at.timestamp()),
+    }
+
+
+def patch_game_response(request, response, game: Game):
+    """Validateurs et Cache-Control de la page d'un jeu (réponse 200 ou 304)"""
+    if is_shared_page(request, game):
+        validators = _validators(game)
+        response['ETag'] = validators['etag']
+        response['Last-Modified'] = http_date(validators['last_modified'])
+        patch_cache_control(response, public=True, max_age=_config()['PAGE_MAX_AGE'])
+    else:
+        # Favori, actions du créateur : la page ne doit pas être gardée par un proxy
+        patch_cache_control(response, private=True)
+    return response
+
+
+def not_modified_response(request, game: Game) -> Optional[object]:
+    """304 si le visiteur a déjà la version courante de la page du jeu, sinon None"""
+    if not is_shared_page(request, game):
+        return None
+    response = get_conditional_response(request, **_validators(game))
+    return patch_game_response(request, response, game) if response is not None else None
+
+
+def serve_media(request, path: str):
+    """Fichier de MEDIA_ROOT (développement) ; cache long et immutable pour les visuels générés"""
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if path.startswith(IMMUTABLE_MEDIA_DIRS):
+        patch_cache_control(response, public=True, max_age=_config()['MEDIA_MAX_AGE'], immutable=True)
+    return response
@@ -0,0 +1,579 @@
+"""
+File d'attente des générations de jeux
+Les vues mettent une tâche en file et rendent la main immédiatement,
+les workers (commande run_generation_workers) exécutent le pipeline IA.
+"""
+
+import asyncio
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .ai_service import get_ai_service, readable_partial
+from .http_cache import unique_media_name
+from .models import APICall, Game, ConceptArt, GenerationJob
+from .persistence import replace_section, save_generated_game
+from .quota import (
+    QuotaExceeded, commit_reservation, counter_for, give_back_generation, give_back_generation_async,
+    release_reservation, reserve_generation, reserve_generation_async,
+)
+from .usage import attribute_calls
+
+
+def _active_duplicate(jobs, kind: str, params: dict) -> Optional[GenerationJob]:
+    # Comparaison en Python : l'égalité sur un JSONField dépend de la base
+    for job in jobs:
+        if job.kind == kind and job.params == params:
+            return job
+    return None
+
+
+def _active_jobs(user):
+    return GenerationJob.objects.filter(user=user, status__in=['pending', 'running']).order_by('date_creation')
+
+
+def find_idempotent_job(user, idempotency_key: str) -> Optional[GenerationJob]:
+    """Tâche déjà lancée (en cours ou terminée) avec ce jeton de formulaire"""
+    if not idempotency_key:
+        return None
+    return GenerationJob.objects.filter(user=user, idempotency_key=idempotency_key).first()
+
+
+async def find_idempotent_job_async(user, idempotency_key: str) -> Optional[GenerationJob]:
+    if not idempotency_key:
+        return None
+    return await GenerationJob.objects.filter(user=user, idempotency_key=idempotency_key).afirst()
+
+
+def enqueue_generation(user, kind: str, params: Optional[dict] = None, game: Optional[Game] = None,
+                       idempotency_key: str = '', reserve_quota: bool = False) -> GenerationJob:
+    """
+    Met une génération en file d'attente et retourne la tâche créée.
+    Une demande identique déjà en cours pour le même utilisateur (double clic,
+    formulaire renvoyé) est réutilisée au lieu de lancer une seconde génération ;
+    avec `idempotency_key`, la tâche du même jeton est retournée quel que soit son état.
+    `game` : jeu existant concerné (régénération d'une section)
+    reserve_quota=True réserve une génération du jour, ou une régénération pour
+    kind='regenerate' (QuotaExceeded si la limite est atteinte)
+    """
+    params = params or {}
+    existing = find_idempotent_job(user, idempotency_key)
+    if existing:
+        print(f"🔑 Jeton déjà utilisé par la tâche #{existing.id}, réutilisation")
+        return existing
+    duplicate = _active_duplicate(_active_jobs(user), kind, params)
+    if duplicate:
+        print(f"🔗 Demande identique à la tâche #{duplicate.id} en cours, réutilisation")
+        return duplicate
+    
+    quota = {}
+    if reserve_quota:
+        reserved_on = reserve_generation(user, counter_for(kind))
+        if reserved_on is None:
+            raise QuotaExceeded()
+        quota = {'quota_state': 'reserved', 'quota_date': reserved_on}
+    try:
+        return GenerationJob.objects.create(user=user, kind=kind, params=params, game=game,
+                                            idempotency_key=idempotency_key, **quota)
+    except IntegrityError:
+        # Envoi simultané avec le même jeton : la contrainte d'unicité départage
+        if quota:
+            give_back_generation(user, quota['quota_date'], counter_for(kind))
+        return GenerationJob.objects.get(user=user, idempotency_key=idempotency_key)
+
+
+async def enqueue_generation_async(user, kind: str, params: Optional[dict] = None,
+                                   game: Optional[Game] = None, idempotency_key: str = '',
+                                   reserve_quota: bool = False) -> GenerationJob:
+    params = params or {}
+    existing = await find_idempotent_job_async(user, idempotency_key)
+    if existing:
+        print(f"🔑 Jeton déjà utilisé par la tâche #{existing.id}, réutilisation")
+        return existing
+    duplicate = _active_duplicate([job async for job in _active_jobs(user)], kind, params)
+    if duplicate:
+        print(f"🔗 Demande identique à la tâche #{duplicate.id} en cours, réutilisation")
+        return duplicate
+    
+    quota = {}
+    if reserve_quota:
+        reserved_on = await reserve_generation_async(user, counter_for(kind))
+        if reserved_on is None:
+            raise QuotaExceeded()
+        quota = {'quota_state': 'reserved', 'quota_date': reserved_on}
+    try:
+        return await GenerationJob.objects.acreate(user=user, kind=kind, params=params, game=game,
+                                                   idempotency_key=idempotency_key, **quota)
+    except IntegrityError:
+        if quota:
+            await give_back_generation_async(user, quota['quota_date'], counter_for(kind))
+        return await GenerationJob.objects.aget(user=user, idempotency_key=idempotency_key)
+
+
+def resume_generation(job: GenerationJob) -> bool:
+    """
+    Remet en file une tâche échouée. Les étapes déjà réussies (points de reprise)
+    ne sont pas relancées : seules les étapes manquantes consomment des appels.
+    Une génération (ou régénération) du jour est de nouveau réservée
+    (QuotaExceeded si la limite est atteinte).
+    """
+    reserved_on = reserve_generation(job.user, counter_for(job.kind))
+    if reserved_on is None:
+        raise QuotaExceeded()
+    quota = {'quota_state': 'reserved', 'quota_date': reserved_on}
+    
+    phases = [key for key, label in GenerationJob.PHASE_CHOICES if key in job.checkpoints]
+    resumed = GenerationJob.objects.filter(id=job.id, status='failed').update(
+        **quota,
+        status='pending',
+        error='',
+        phase='',
+        phases_started=phases,
+        phases_done=phases,
+        worker='',
+        started_at=None,
+        finished_at=None,
+    )
+    if resumed:
+        print(f"🔁 Tâche #{job.id} remise en file (étapes conservées : {phases})")
+    else:
+        # Tâche déjà relancée entre-temps
+        give_back_generation(job.user, quota['quota_date'], counter_for(job.kind))
+    return bool(resumed)
+
+
+def requeue_stale_jobs(stale_after: Optional[float] = None) -> int:
+    """
+    Remet en file les tâches 'running' dont le worker ne donne plus signe de vie
+    (heartbeat_at, voir _Heartbeat) depuis `stale_after` secondes : worker arrêté
+    en cours de génération. Elles reprennent à leurs points de reprise ; une
+    génération longue mais vivante n'est pas touchée
+    """
+    stale_after = stale_after or settings.GENERATION_JOB_STALE_AFTER
+    threshold = timezone.now() - timedelta(seconds=stale_after)
+    stale = GenerationJob.objects.filter(
+        Q(heartbeat_at__lt=threshold) | Q(heartbeat_at__isnull=True, started_at__lt=threshold),
+        status='running',
+    ).only('id', 'started_at', 'heartbeat_at', 'checkpoints')
+    requeued = 0
+    for job in stale:
+        phases = [key for key, label in GenerationJob.PHASE_CHOICES if key in job.checkpoints]
+        # Conditions sur started_at et heartbeat_at : la tâche n'a pas été reprise, ni n'a donné signe de vie
+        requeued += GenerationJob.objects.filter(
+            id=job.id, status='running', started_at=job.started_at, heartbeat_at=job.heartbeat_at
+        ).update(
+            status='pending', phase='', phases_started=phases, phases_done=phases, worker='', started_at=None,
+            heartbeat_at=None
+        )
+    if requeued:
+        print(f"🔁 {requeued} tâche(s) abandonnée(s) remise(s) en file")
+    return requeued
+
+
+def default_worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_next_job(worker_name: str) -> Optional[GenerationJob]:
+    """
+    Réserve la plus ancienne tâche en attente.
+    La mise à jour conditionnelle sur le statut garantit qu'une tâche
+    n'est prise que par un seul worker, même avec plusieurs processus.
+    """
+    candidates = (
+        GenerationJob.objects.filter(status='pending')
+        .order_by('date_creation')
+        .values_list('id', flat=True)[:10]
+    )
+    for job_id in candidates:
+        now = timezone.now()
+        claimed = GenerationJob.objects.filter(id=job_id, status='pending').update(
+            status='running',
+            worker=worker_name,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if claimed:
+            return GenerationJob.objects.select_related('user').get(id=job_id)
+    return None
+
+
+def _start_phase(job: GenerationJob, phase: str):
+    job.phase = phase
+    job.phases_started = job.phases_started + [phase]
+    job.save(update_fields=['phase', 'phases_started'])
+
+
+def _finish_phase(job: GenerationJob, phase: str):
+    job.phases_done = job.phases_done + [phase]
+    job.save(update_fields=['phases_done'])
+
+
+def _track_phase(job: GenerationJob, phase: str, state: str):
+    """Callback de progression de AIService.generate_full_game"""
+    if state == 'start':
+        _start_phase(job, phase)
+    else:
+        _finish_phase(job, phase)
+
+
+def _save_checkpoint(job: GenerationJob, phase: str, value):
+    """Conserve le résultat d'une étape réussie, pour reprendre la tâche en cas d'échec"""
+    if phase == 'image' and value.get('image_data'):
+        # L'image est écrite tout de suite ; le point de reprise n'en garde que le nom
+        storage = ConceptArt._meta.get_field('image').storage
+        name = storage.save(unique_media_name(f"concept_arts/job_{job.id}_cover.png"), value['image_data'])
+        value = {**value, 'image_data': None, 'image_name': name}
+    job.checkpoints = {**job.checkpoints, phase: value}
+    GenerationJob.objects.filter(id=job.id).update(checkpoints=job.checkpoints)
+
+
+class _Heartbeat:
+    """
+    Signe de vie de la tâche en cours : heartbeat_at est mis à jour toutes les
+    `interval` secondes tant qu'elle s'exécute, même pendant une étape longue
+    (réponse lente, attente du limiteur de débit). Un thread pour run_job
+    (with), une tâche asyncio pour run_job_async (async with)
+    """
+
+    def __init__(self, job: GenerationJob, interval: Optional[float] = None):
+        self.job_id = job.id
+        self.interval = interval or settings.GENERATION_JOB_HEARTBEAT
+        self._stop = threading.Event()
+        self._thread = None
+        self._task = None
+
+    def beat(self):
+        GenerationJob.objects.filter(id=self.job_id, status='running').update(heartbeat_at=timezone.now())
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                self.beat()
+        finally:
+            # Connexion propre au thread
+            connection.close()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name=f'heartbeat-{self.job_id}', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    async def _run_async(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await sync_to_async(self.beat)()
+
+    async def __aenter__(self):
+        self._task = asyncio.ensure_future(self._run_async())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        # Tâche attendue jusqu'à son arrêt : plus aucun signe de vie après la sortie
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class _PartialWriter:
+    """
+    Enregistre le texte reçu en streaming dans job.partial_output, au plus
+    une fois par `interval` secondes (les étapes arrivent de plusieurs threads)
+    """
+
+    def __init__(self, job: GenerationJob, interval: float = 0.5):
+        self.job_id = job.id
+        self.interval = interval
+        # Une tâche reprise garde le texte des étapes déjà réussies
+        self.output = dict(job.partial_output)
+        self.dirty = False
+        self.last_write = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, phase: str, text: str) -> bool:
+        """Retient le texte de l'étape ; retourne True si une écriture est due"""
+        with self._lock:
+            self.output.update(readable_partial(phase, text))
+            self.dirty = True
+            return time.monotonic() - self.last_write >= self.interval
+
+    def flush(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            GenerationJob.objects.filter(id=self.job_id).update(partial_output=dict(self.output))
+            self.dirty = False
+            self.last_write = time.monotonic()
+
+    def __call__(self, phase: str, text: str):
+        if self.update(phase, text):
+            self.flush()
+
+
+def _prepare_params(job: GenerationJob, ai_service) -> dict:
+    """Paramètres de génération de la tâche (tirés au sort pour un jeu aléatoire)"""
+    if job.kind != 'random' or job.params.get('genre'):
+        return job.params
+
+    random_params = ai_service.generate_random_game_params()
+    job.params = {
+        'genre': random_params['genre'],
+        'ambiance': random_params['ambiance'],
+        'mots_cles': random_params['keywords'],
+        'references': '',
+        'est_public': True,
+        'mode': settings.GENERATION_MODE,
+    }
+    job.save(update_fields=['params'])
+    return job.params
+
+
+def _save_game(job: GenerationJob, params: dict, content: dict) -> Game:
+    """Enregistre le jeu généré et clôture la tâche"""
+    _start_phase(job, 'save')
+    # Jeu, quota et statut de la tâche sont validés ensemble
+    with transaction.atomic():
+        game = save_generated_game(job.user, params, content)
+        commit_reservation(job)
+        # Appels de la génération rattachés au jeu créé
+        APICall.objects.filter(job=job, game__isnull=True).update(game=game)
+        
+        job.game = game
+        job.status = 'done'
+        job.phase = ''
+        job.phases_done = job.phases_done + ['save']
+        job.finished_at = timezone.now()
+        job.save(update_fields=['game', 'status', 'phase', 'phases_done', 'finished_at'])
+    print(f"✅ Tâche #{job.id} terminée : jeu '{game.titre}' (#{game.id})")
+    return game
+
+
+def _load_regeneration_target(job: GenerationJob):
+    """Jeu à modifier et nombre actuel de personnages ou de lieux (conservé)"""
+    game = Game.objects.select_related('universe').get(id=job.game_id)
+    section = job.params['section']
+    count = None
+    if section == 'characters':
+        count = game.characters.count() or None
+    elif section == 'locations':
+        count = game.locations.count() or None
+    return game, count
+
+
+def _save_regeneration(job: GenerationJob, game: Game, section: str, value):
+    """Remplace la section régénérée et clôture la tâche (régénération du jour confirmée)"""
+    _start_phase(job, 'save')
+    with transaction.atomic():
+        replace_section(game, section, value)
+        commit_reservation(job)
+        
+        job.status = 'done'
+        job.phase = ''
+        job.phases_done = job.phases_done + ['save']
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'phase', 'phases_done', 'finished_at'])
+    print(f"✅ Tâche #{job.id} terminée : section '{section}' de '{game.titre}' régénérée")
+
+
+def _regenerate_section(job: GenerationJob, ai_service):
+    section = job.params['section']
+    game, count = _load_regeneration_target(job)
+    partial = _PartialWriter(job)
+    
+    _start_phase(job, section)
+    value = ai_service.regenerate_section(game, section, count=count, on_partial=partial)
+    partial.flush()
+    _finish_phase(job, section)
+    _save_regeneration(job, game, section, value)
+
+
+async def _regenerate_section_async(job: GenerationJob, ai_service):
+    section = job.params['section']
+    game, count = await sync_to_async(_load_regeneration_target)(job)
+    partial = _PartialWriter(job)
+
+    async def on_partial(phase, text):
+        if partial.update(phase, text):
+            await sync_to_async(partial.flush)()
+
+    await sync_to_async(_start_phase)(job, section)
+    value = await ai_service.regenerate_section_async(game, section, count=count, on_partial=on_partial)
+    await sync_to_async(partial.flush)()
+    await sync_to_async(_finish_phase)(job, section)
+    await sync_to_async(_save_regeneration)(job, game, section, value)
+
+
+def _fail_job(job: GenerationJob, error: Exception):
+    traceback.print_exc()
+    job.status = 'failed'
+    job.error = str(error)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    # La génération n'a pas abouti : elle ne compte pas dans le quota du jour
+    release_reservation(job)
+    print(f"❌ Tâche #{job.id} échouée : {error}")
+
+
+def run_job(job: GenerationJob) -> GenerationJob:
+    """Exécute le pipeline complet de génération pour une tâche réservée"""
+    ai_service = get_ai_service()
+
+    with attribute_calls(job.user_id, job.id, job.game_id), _Heartbeat(job):
+        try:
+            if job.kind == 'regenerate':
+                _regenerate_section(job, ai_service)
+                return job
+
+            params = _prepare_params(job, ai_service)
+
+            # Titre et univers, puis scénario, personnages, lieux et image en parallèle
+            # (ou tout le texte en une complétion en mode 'bundle')
+            partial = _PartialWriter(job)
+
+            def on_phase(phase, state):
+                if state == 'done':
+                    partial.flush()
+                _track_phase(job, phase, state)
+
+            # Pas de contenu de secours : une étape en échec laisse la tâche reprenable
+            content = ai_service.generate_full_game(
+                params['genre'], params['ambiance'], params['mots_cles'],
+                on_phase=on_phase,
+                mode=params.get('mode', settings.GENERATION_MODE),
+                on_partial=partial,
+                checkpoint=job.checkpoints,
+                on_checkpoint=lambda phase, value: _save_checkpoint(job, phase, value),
+                fallback=False
+            )
+            content['image'] = job.checkpoints.get('image', content['image'])
+            _save_game(job, params, content)
+        except Exception as e:
+            _fail_job(job, e)
+
+    return job
+
+
+async def run_job_async(job: GenerationJob) -> GenerationJob:
+    """Variante asynchrone de run_job : les appels IA ne bloquent pas la boucle"""
+    ai_service = get_ai_service()
+
+    with attribute_calls(job.user_id, job.id, job.game_id):
+        async with _Heartbeat(job):
+            try:
+                if job.kind == 'regenerate':
+                    await _regenerate_section_async(job, ai_service)
+                    return job
+
+                params = await sync_to_async(_prepare_params)(job, ai_service)
+                partial = _PartialWriter(job)
+
+                def on_phase(phase, state):
+                    if state == 'done':
+                        partial.flush()
+                    _track_phase(job, phase, state)
+
+                async def on_partial(phase, text):
+                    if partial.update(phase, text):
+                        await sync_to_async(partial.flush)()
+
+                content = await ai_service.generate_full_game_async(
+                    params['genre'], params['ambiance'], params['mots_cles'],
+                    on_phase=sync_to_async(on_phase),
+                    mode=params.get('mode', settings.GENERATION_MODE),
+                    on_partial=on_partial,
+                    checkpoint=job.checkpoints,
+                    on_checkpoint=sync_to_async(lambda phase, value: _save_checkpoint(job, phase, value)),
+                    fallback=False
+                )
+                content['image'] = job.checkpoints.get('image', content['image'])
+                await sync_to_async(_save_game)(job, params, content)
+            except Exception as e:
+                await sync_to_async(_fail_job)(job, e)
+
+    return job
+
+
+# Fréquence (secondes) de la recherche des tâches abandonnées par un worker arrêté
+STALE_CHECK_INTERVAL = 60
+
+
+def worker_loop(worker_name: Optional[str] = None, poll_interval: float = 1.0, once: bool = False):
+    """
+    Boucle principale d'un worker : réserve et exécute les tâches une par une.
+    Avec once=True, le worker s'arrête dès que la file est vide.
+    """
+    worker_name = worker_name or default_worker_name()
+    print(f"👷 Worker {worker_name} démarré")
+    last_stale_check = 0.0
+
+    while True:
+        close_old_connections()
+        if time.monotonic() - last_stale_check >= STALE_CHECK_INTERVAL:
+            requeue_stale_jobs()
+            last_stale_check = time.monotonic()
+        job = claim_next_job(worker_name)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        print(f"⚙️ {worker_name} traite la tâche #{job.id} ({job.kind})")
+        run_job(job)
+
+    print(f"👋 Worker {worker_name} arrêté")
+
+
+async def async_worker_loop(worker_name: Optional[str] = None, concurrency: int = 20,
+                            poll_interval: float = 1.0, once: bool = False):
+    """
+    Boucle d'un worker asynchrone : jusqu'à `concurrency` générations
+    en cours simultanément dans un seul processus.
+    """
+    worker_name = worker_name or default_worker_name()
+    print(f"👷 Worker async {worker_name} démarré ({concurrency} générations simultanées)")
+
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+    last_stale_check = 0.0
+
+    def task_done(task):
+        tasks.discard(task)
+        slots.release()
+
+    while True:
+        await slots.acquire()
+        await sync_to_async(close_old_connections)()
+        if time.monotonic() - last_stale_check >= STALE_CHECK_INTERVAL:
+            await sync_to_async(requeue_stale_jobs)()
+            last_stale_check = time.monotonic()
+        job = await sync_to_async(claim_next_job)(worker_name)
+        if job is None:
+            slots.release()
+            if once and not tasks:
+                break
+            await asyncio.sleep(poll_interval)
+            continue
+
+        print(f"⚙️ {worker_name} traite la tâche #{job.id} ({job.kind})")
+        task = asyncio.create_task(run_job_async(job))
+        tasks.add(task)
+        task.add_done_callback(task_done)
+
+    print(f"👋 Worker {worker_name} arrêté")
@@ -0,0 +1,62 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from games.ai_service import GENERATION_MODES, get_ai_service
+from games.usage import record_usage
+
+
+class Command(BaseCommand):
+    help = "Compare les modes de génération (enchaîné / complétion unique) : latence et jetons consommés"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help="Générations par mode")
+        parser.add_argument('--modes', nargs='+', default=[key for key, label in GENERATION_MODES],
+                            choices=[key for key, label in GENERATION_MODES])
+        parser.add_argument('--genre', default='rpg')
+        parser.add_argument('--ambiance', default='epique')
+        parser.add_argument('--mots-cles', default='dragons, magie, royaume perdu')
+        parser.add_argument('--with-image', action='store_true', help="Inclure l'image de couverture (identique dans les deux modes)")
+        parser.add_argument('--use-cache', action='store_true',
+                            help="Garder le cache de complétion (par défaut désactivé pour mesurer de vrais appels)")
+
+    def handle(self, *args, **options):
+        ai_service = get_ai_service()
+        if not ai_service.client:
+            self.stdout.write(self.style.WARNING("Mode démo : aucun appel réel, les mesures ne sont pas significatives"))
+        if not options['use_cache']:
+            ai_service.completion_cache.enabled = False
+
+        summary = {}
+        for mode in options['modes']:
+            runs = []
+            for run in range(options['runs']):
+                with record_usage() as usage:
+                    started = time.monotonic()
+                    result = ai_service.generate_full_game(
+                        options['genre'], options['ambiance'], options['mots_cles'],
+                        mode=mode, with_image=options['with_image']
+                    )
+                    elapsed = time.monotonic() - started
+                runs.append({'latency': elapsed, 'fallbacks': len(result['errors']), **usage.as_dict()})
+                self.stdout.write(
+                    f"{mode} #{run + 1} : {elapsed:.1f}s, {usage.calls} appels, "
+                    f"{usage.prompt_tokens} + {usage.completion_tokens} jetons"
+                )
+            summary[mode] = runs
+
+        self.stdout.write("")
+        self.stdout.write(f"{'Mode':<10}{'Latence moy.':>14}{'Latence max':>13}{'Appels':>8}"
+                          f"{'Jetons prompt':>15}{'Jetons sortie':>15}{'Total':>8}{'Erreurs':>9}")
+        for mode, runs in summary.items():
+            self.stdout.write(
+                f"{mode:<10}"
+                f"{statistics.mean(r['latency'] for r in runs):>13.1f}s"
+                f"{max(r['latency'] for r in runs):>12.1f}s"
+                f"{statistics.mean(r['calls'] for r in runs):>8.1f}"
+                f"{statistics.mean(r['prompt_tokens'] for r in runs):>15.0f}"
+                f"{statistics.mean(r['completion_tokens'] for r in runs):>15.0f}"
+                f"{statistics.mean(r['total_tokens'] for r in runs):>8.0f}"
+                f"{statistics.mean(r['fallbacks'] for r in runs):>9.1f}"
+            )
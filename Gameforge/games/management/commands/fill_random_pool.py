@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from games.pool import fill_pool, is_off_peak, pool_config
+
+
+class Command(BaseCommand):
+    help = "Complète la réserve de jeux aléatoires pré-générés (aux heures creuses, voir RANDOM_GAME_POOL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, help="Taille visée de la réserve (par défaut RANDOM_GAME_POOL['SIZE'])")
+        parser.add_argument('--force', action='store_true', help="Remplir même en dehors des heures creuses")
+        parser.add_argument('--loop', action='store_true', help="Rester actif et remplir à chaque période creuse")
+        parser.add_argument('--interval', type=float, default=600, help="Délai (s) entre deux vérifications avec --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            if options['force'] or is_off_peak():
+                added = fill_pool(options['size'])
+                self.stdout.write(f"{added} jeu(x) ajouté(s) à la réserve")
+            else:
+                start, end = pool_config()['OFF_PEAK_HOURS']
+                self.stdout.write(f"En dehors des heures creuses ({start}h - {end}h), rien à faire")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
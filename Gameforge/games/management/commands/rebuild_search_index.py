@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from games.search import is_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte des jeux (SQLite FTS5, voir games/search.py)"
+
+    def handle(self, *args, **options):
+        if not is_available():
+            self.stdout.write("Index plein texte indisponible sur cette base : recherche par filtres icontains")
+            return
+        count = rebuild_index()
+        self.stdout.write(f"{count} jeu(x) indexé(s)")
@@ -0,0 +1,59 @@
+import asyncio
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from games.jobs import async_worker_loop, default_worker_name, worker_loop
+
+
+def _run_worker(index, poll_interval, once, concurrency=1):
+    # Chaque processus doit ouvrir ses propres connexions à la base
+    connections.close_all()
+    worker_name = f"{default_worker_name()}#{index}"
+    if concurrency > 1:
+        asyncio.run(async_worker_loop(worker_name, concurrency=concurrency, poll_interval=poll_interval, once=once))
+    else:
+        worker_loop(worker_name, poll_interval=poll_interval, once=once)
+
+
+class Command(BaseCommand):
+    help = "Lance un pool de workers qui exécutent les générations de jeux en file d'attente"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Nombre de processus workers")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Délai (s) entre deux vérifications de la file")
+        parser.add_argument('--once', action='store_true', help="Vider la file puis s'arrêter")
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help="Générations simultanées par processus (au-delà de 1, le worker utilise asyncio)"
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        poll_interval = options['poll_interval']
+        once = options['once']
+        concurrency = max(1, options['concurrency'])
+
+        if workers == 1:
+            _run_worker(0, poll_interval, once, concurrency)
+            return
+
+        self.stdout.write(f"Démarrage de {workers} workers de génération...")
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=_run_worker, args=(i, poll_interval, once, concurrency))
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+        self.stdout.write(self.style.SUCCESS("Workers arrêtés"))
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0003_remove_generationlimit_max_daily_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_of_birth', models.DateField(blank=True, null=True, verbose_name='Date de naissance')),
+                ('default_visibility', models.CharField(choices=[('public', 'Public'), ('private', 'Privé')], default='public', max_length=10, verbose_name='Visibilité par défaut')),
+                ('email_notifications', models.BooleanField(default=True, verbose_name='Notifications par email')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Profil',
+                'verbose_name_plural': 'Profils',
+            },
+        ),
+        migrations.CreateModel(
+            name='GenerationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('custom', 'Personnalisée'), ('random', 'Aléatoire')], default='custom', max_length=20)),
+                ('params', models.JSONField(blank=True, default=dict, help_text='Paramètres du formulaire de création')),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('running', 'En cours'), ('done', 'Terminée'), ('failed', 'Échouée')], default='pending', max_length=20)),
+                ('phase', models.CharField(blank=True, choices=[('title', 'Titre'), ('universe', 'Univers'), ('scenario', 'Scénario'), ('characters', 'Personnages'), ('locations', 'Lieux'), ('image', 'Image de couverture'), ('save', 'Sauvegarde')], max_length=20)),
+                ('phases_done', models.JSONField(blank=True, default=list)),
+                ('error', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('date_creation', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('game', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='generation_jobs', to='games.game')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='generation_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date_creation'],
+                'indexes': [models.Index(fields=['status', 'date_creation'], name='games_gener_status_86f999_idx')],
+            },
+        ),
+    ]
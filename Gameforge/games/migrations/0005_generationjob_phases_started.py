@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0004_generationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='phases_started',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
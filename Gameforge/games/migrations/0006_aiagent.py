@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0005_generationjob_phases_started'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=100)),
+                ('model', models.CharField(max_length=100)),
+                ('agent_id', models.CharField(max_length=100)),
+                ('date_creation', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'unique_together': {('nom', 'model')},
+            },
+        ),
+    ]
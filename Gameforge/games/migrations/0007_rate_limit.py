@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0006_aiagent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.FloatField(help_text='Horodatage Unix du dernier remplissage')),
+                ('in_flight', models.IntegerField(default=0)),
+                ('version', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RateLimitLease',
+            fields=[
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('key', models.CharField(db_index=True, max_length=100)),
+                ('expires_at', models.FloatField()),
+            ],
+        ),
+    ]
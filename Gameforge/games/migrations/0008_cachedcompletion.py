@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0007_rate_limit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('response', models.TextField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('last_used', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0008_cachedcompletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InFlightCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('owner', models.CharField(max_length=32)),
+                ('expires_at', models.FloatField(help_text="Horodatage Unix d'expiration du verrou")),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0009_inflightcompletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='partial_output',
+            field=models.JSONField(blank=True, default=dict, help_text='Texte reçu en streaming, par étape'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0010_generationjob_partial_output'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='checkpoints',
+            field=models.JSONField(blank=True, default=dict, help_text='Résultat des étapes réussies, pour la reprise'),
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0011_generationjob_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='generationjob',
+            name='kind',
+            field=models.CharField(choices=[('custom', 'Personnalisée'), ('random', 'Aléatoire'), ('regenerate', 'Régénération')], default='custom', max_length=20),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0012_generationjob_kind_regenerate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Jeton du formulaire : un renvoi retrouve la même tâche', max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='generationjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key', ''), _negated=True), fields=('user', 'idempotency_key'), name='unique_generation_idempotency_key'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0013_generationjob_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='quota_date',
+            field=models.DateField(blank=True, help_text='Jour de la génération réservée', null=True),
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='quota_state',
+            field=models.CharField(blank=True, choices=[('', 'Hors quota'), ('reserved', 'Réservée'), ('committed', 'Consommée'), ('released', 'Rendue')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='generationlimit',
+            name='daily_regeneration_count',
+            field=models.IntegerField(default=10),
+        ),
+        migrations.AddField(
+            model_name='generationlimit',
+            name='regenerations_reset',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='generationlimit',
+            name='regenerations_today',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0014_generationjob_quota_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CircuitBreakerState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('state', models.CharField(choices=[('closed', 'Fermé'), ('open', 'Ouvert'), ('half_open', 'Semi-ouvert')], default='closed', max_length=20)),
+                ('calls', models.IntegerField(default=0)),
+                ('failures', models.IntegerField(default=0)),
+                ('window_start', models.FloatField(help_text="Horodatage Unix du début de la fenêtre d'observation")),
+                ('retry_at', models.FloatField(default=0, help_text='Horodatage Unix de la prochaine sonde (circuit ouvert)')),
+                ('version', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0015_circuit_breaker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderRouteStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('route', models.CharField(max_length=100)),
+                ('phase', models.CharField(blank=True, max_length=30)),
+                ('samples', models.JSONField(default=list, help_text='[durée en secondes, succès] des derniers appels')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('version', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('route', 'phase'), name='unique_provider_route_phase')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0016_provider_route_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompletionLengthStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phase', models.CharField(max_length=30, unique=True)),
+                ('samples', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('version', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
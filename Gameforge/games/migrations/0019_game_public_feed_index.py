@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0018_api_call_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['est_public', '-date_creation', '-id'], name='games_game_public_feed'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # Table FTS5 propre à SQLite : les autres bases utilisent la recherche icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from games.search import create_index_sql, rebuild_index
+
+    for sql in create_index_sql():
+        schema_editor.execute(sql)
+    rebuild_index()
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from games.search import SEARCH_TABLE
+
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0019_game_public_feed_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
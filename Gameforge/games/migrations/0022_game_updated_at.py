@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:27
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def init_updated_at(apps, schema_editor):
+    # Jeux existants : non modifiés depuis leur création
+    Game = apps.get_model('games', 'Game')
+    Game.objects.update(updated_at=F('date_creation'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0021_game_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(init_updated_at, migrations.RunPython.noop),
+    ]
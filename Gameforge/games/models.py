@@ -1,3 +1,4 @@
+from asgiref.sync import sync_to_async
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -39,11 +40,20 @@ class Game(models.Model):
     # Compteurs
     likes_count = models.IntegerField(default=0)
     
+    # Version du contenu affiché, incrémentée à chaque modification (cache des fragments, voir fragments.py)
+    version = models.PositiveIntegerField(default=0)
+    # Dernière modification du jeu, de son contenu ou de ses likes (Last-Modified, voir http_cache.py)
+    updated_at = models.DateTimeField(default=timezone.now)
+    
     def __str__(self):
         return self.titre
     
     class Meta:
         ordering = ['-date_creation']
+        indexes = [
+            # Fil de la page d'accueil, paginé sur (date_creation, id) (voir feed.py)
+            models.Index(fields=['est_public', '-date_creation', '-id'], name='games_game_public_feed'),
+        ]
 
 
 class Universe(models.Model):
@@ -206,7 +216,13 @@ class GenerationLimit(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     generations_today = models.IntegerField(default=0)
     daily_count = models.IntegerField(default=5)  # Limite par défaut à 5
+    # Jetons consommés par jour (appels à l'API, voir APICall) ; vide : pas de limite en jetons
+    daily_token_limit = models.PositiveIntegerField(null=True, blank=True)
     last_reset = models.DateField(auto_now_add=True)
+    # Régénérations de section par jour : compteur distinct des générations (voir quota.py)
+    regenerations_today = models.IntegerField(default=0)
+    daily_regeneration_count = models.IntegerField(default=10)
+    regenerations_reset = models.DateField(null=True, blank=True)
 
     def save(self, *args, **kwargs):
         # S'assurer que daily_count n'est jamais 0
@@ -214,14 +230,28 @@ class GenerationLimit(models.Model):
             self.daily_count = 5
         super().save(*args, **kwargs)
 
+    def used_today(self):
+        """Générations consommées ou réservées aujourd'hui (la remise à zéro se déduit de last_reset)"""
+        return self.generations_today if self.last_reset >= timezone.now().date() else 0
+
+    def tokens_used_today(self):
+        """Jetons consommés aujourd'hui par les appels à l'API des générations de l'utilisateur"""
+        return APICall.objects.filter(user_id=self.user_id, created_at__date=timezone.now().date()).aggregate(
+            total=models.Sum(models.F('prompt_tokens') + models.F('completion_tokens'))
+        )['total'] or 0
+
+    def remaining(self):
+        if self.daily_token_limit is not None and self.tokens_used_today() >= self.daily_token_limit:
+            return 0
+        return max(0, self.daily_count - self.used_today())
+
+    async def aremaining(self):
+        # Le total des jetons du jour est un agrégat synchrone : hors de la boucle asyncio
+        return await sync_to_async(self.remaining)()
+
     def can_generate(self):
-        # Réinitialiser le compteur si c'est un nouveau jour
-        if timezone.now().date() > self.last_reset:
-            self.generations_today = 0
-            self.last_reset = timezone.now().date()
-            self.save()
-        
-        return self.generations_today < self.daily_count
+        # Lecture seule : le compteur n'est remis à zéro qu'à la réservation suivante (voir quota.py)
+        return self.remaining() > 0
 
     def increment(self):
         self.generations_today = models.F('generations_today') + 1
@@ -235,3 +265,243 @@ class GenerationLimit(models.Model):
 
     def __str__(self):
         return f"Limite de {self.user.username}: {self.generations_today}/{self.daily_count}"
+
+
+class AIAgent(models.Model):
+    """Agents Mistral créés côté API, conservés pour être réutilisés entre les redémarrages"""
+    nom = models.CharField(max_length=100)
+    model = models.CharField(max_length=100)
+    agent_id = models.CharField(max_length=100)
+    date_creation = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('nom', 'model')
+
+    def __str__(self):
+        return f"{self.nom} ({self.model}) : {self.agent_id}"
+
+
+class GenerationJob(models.Model):
+    """Tâche de génération de jeu, mise en file par les vues et traitée par les workers"""
+    KIND_CHOICES = [
+        ('custom', 'Personnalisée'),
+        ('random', 'Aléatoire'),
+        ('regenerate', 'Régénération'),
+    ]
+
+    QUOTA_CHOICES = [
+        ('', 'Hors quota'),
+        ('reserved', 'Réservée'),
+        ('committed', 'Consommée'),
+        ('released', 'Rendue'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('done', 'Terminée'),
+        ('failed', 'Échouée'),
+    ]
+
+    # Étapes du pipeline, dans l'ordre d'exécution
+    PHASE_CHOICES = [
+        ('title', 'Titre'),
+        ('universe', 'Univers'),
+        ('scenario', 'Scénario'),
+        ('characters', 'Personnages'),
+        ('locations', 'Lieux'),
+        ('image', 'Image de couverture'),
+        ('save', 'Sauvegarde'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='generation_jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='custom')
+    params = models.JSONField(default=dict, blank=True, help_text="Paramètres du formulaire de création")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    phase = models.CharField(max_length=20, choices=PHASE_CHOICES, blank=True)
+    phases_started = models.JSONField(default=list, blank=True)
+    phases_done = models.JSONField(default=list, blank=True)
+    partial_output = models.JSONField(default=dict, blank=True, help_text="Texte reçu en streaming, par étape")
+    checkpoints = models.JSONField(default=dict, blank=True, help_text="Résultat des étapes réussies, pour la reprise")
+    error = models.TextField(blank=True)
+    game = models.ForeignKey(Game, on_delete=models.SET_NULL, null=True, blank=True, related_name='generation_jobs')
+    worker = models.CharField(max_length=100, blank=True)
+    quota_state = models.CharField(max_length=20, choices=QUOTA_CHOICES, blank=True)
+    quota_date = models.DateField(null=True, blank=True, help_text="Jour de la génération réservée")
+    idempotency_key = models.CharField(max_length=64, blank=True,
+                                       help_text="Jeton du formulaire : un renvoi retrouve la même tâche")
+
+    date_creation = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Dernier signe de vie du worker pendant l'exécution (tâches abandonnées, voir jobs.py)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['date_creation']
+        indexes = [
+            models.Index(fields=['status', 'date_creation']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'idempotency_key'],
+                condition=~models.Q(idempotency_key=''),
+                name='unique_generation_idempotency_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Génération #{self.pk} ({self.get_status_display()}) - {self.user.username}"
+
+    @property
+    def is_active(self):
+        return self.status in ('pending', 'running')
+
+    @property
+    def is_resumable(self):
+        """Une tâche échouée peut être relancée : seules les étapes manquantes sont refaites"""
+        return self.status == 'failed'
+
+    def phase_choices(self):
+        """Étapes de cette tâche : une régénération ne compte que sa section et la sauvegarde"""
+        if self.kind == 'regenerate':
+            keys = [self.params.get('section'), 'save']
+            return [(key, label) for key, label in self.PHASE_CHOICES if key in keys]
+        return self.PHASE_CHOICES
+
+    @property
+    def progress(self):
+        """Pourcentage d'avancement basé sur les étapes terminées"""
+        return int(100 * len(self.phases_done) / len(self.phase_choices()))
+
+    def phases_status(self):
+        """Liste des étapes avec leur état, pour l'affichage et l'API"""
+        phases = []
+        for key, label in self.phase_choices():
+            if key in self.phases_done:
+                state = 'done'
+            elif key in self.phases_started and self.status == 'running':
+                state = 'running'
+            else:
+                state = 'pending'
+            phases.append({'key': key, 'label': label, 'state': state,
+                           'partial': self.partial_output.get(key, '')})
+        return phases
+
+
+class RateLimitBucket(models.Model):
+    """Seau à jetons partagé pour limiter le débit des appels à l'API (voir rate_limit.py)"""
+    key = models.CharField(max_length=100, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField(help_text="Horodatage Unix du dernier remplissage")
+    in_flight = models.IntegerField(default=0)
+    version = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.1f} jetons, {self.in_flight} en cours"
+
+
+class RateLimitLease(models.Model):
+    """Appel en cours réservé auprès d'un RateLimitBucket"""
+    id = models.CharField(max_length=32, primary_key=True)
+    key = models.CharField(max_length=100, db_index=True)
+    expires_at = models.FloatField()
+
+    def __str__(self):
+        return f"{self.key} ({self.id})"
+
+
+class CircuitBreakerState(models.Model):
+    """État partagé du disjoncteur des appels à l'API (voir circuit_breaker.py)"""
+    STATE_CHOICES = [
+        ('closed', 'Fermé'),
+        ('open', 'Ouvert'),
+        ('half_open', 'Semi-ouvert'),
+    ]
+
+    key = models.CharField(max_length=100, unique=True)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='closed')
+    calls = models.IntegerField(default=0)
+    failures = models.IntegerField(default=0)
+    window_start = models.FloatField(help_text="Horodatage Unix du début de la fenêtre d'observation")
+    retry_at = models.FloatField(default=0, help_text="Horodatage Unix de la prochaine sonde (circuit ouvert)")
+    version = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key}: {self.get_state_display()} ({self.failures}/{self.calls} échecs)"
+
+
+class ProviderRouteStats(models.Model):
+    """Derniers appels d'une route fournisseur:modèle pour une étape (voir providers.py)"""
+    route = models.CharField(max_length=100)
+    phase = models.CharField(max_length=30, blank=True)
+    samples = models.JSONField(default=list, help_text="[durée en secondes, succès] des derniers appels")
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['route', 'phase'], name='unique_provider_route_phase'),
+        ]
+
+    def __str__(self):
+        return f"{self.route} ({self.phase or 'hors étape'}) : {len(self.samples)} appels"
+
+
+class CompletionLengthStats(models.Model):
+    """Longueur (jetons par élément) des dernières réponses d'une étape (voir budget.py)"""
+    phase = models.CharField(max_length=30, unique=True)
+    samples = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.phase} : {len(self.samples)} réponses"
+
+
+class CachedCompletion(models.Model):
+    """Réponse de l'API de complétion mise en cache (voir completion_cache.py)"""
+    key = models.CharField(max_length=64, unique=True)
+    response = models.TextField()
+    expires_at = models.DateTimeField(db_index=True)
+    last_used = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key[:12]}… (expire le {self.expires_at:%d/%m/%Y})"
+
+
+class InFlightCompletion(models.Model):
+    """Verrou d'un appel à l'API en cours pour un prompt (voir single_flight.py)"""
+    key = models.CharField(max_length=64, unique=True)
+    owner = models.CharField(max_length=32)
+    expires_at = models.FloatField(help_text="Horodatage Unix d'expiration du verrou")
+
+    def __str__(self):
+        return f"{self.key[:12]}… ({self.owner})"
+
+
+class APICall(models.Model):
+    """Un appel de complétion à l'API : jetons, durée et tentatives, rattaché à la génération"""
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='api_calls')
+    job = models.ForeignKey(GenerationJob, on_delete=models.SET_NULL, null=True, blank=True, related_name='api_calls')
+    game = models.ForeignKey(Game, on_delete=models.SET_NULL, null=True, blank=True, related_name='api_calls')
+    phase = models.CharField(max_length=30, blank=True)
+    model = models.CharField(max_length=100)  # route fournisseur:modèle
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    duration = models.FloatField(default=0)  # secondes, tentatives comprises
+    attempts = models.PositiveSmallIntegerField(default=1)
+    success = models.BooleanField(default=True)
+    # Requête doublée (voir hedging.py) : réponse écartée mais facturée, comptée dans le quota en jetons
+    hedge = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at'], name='games_apicall_user_day')]
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def __str__(self):
+        return f"{self.model} ({self.phase or '-'}) : {self.total_tokens} jetons"
@@ -0,0 +1,144 @@
+"""
+Enregistrement des jeux générés
+Un jeu et tout son contenu (univers, scénario, personnages, lieux, visuel)
+sont écrits dans une seule transaction : une erreur en cours de route
+n'en laisse aucune trace. Personnages et lieux sont insérés en une requête.
+L'insertion groupée n'émet pas de signaux : l'index de recherche et la
+version du jeu (cache des fragments) sont mis à jour explicitement (voir
+search.py et fragments.py).
+"""
+
+from django.db import transaction
+
+from .models import Game, Universe, Scenario, Character, Location, ConceptArt
+from .fragments import bump_version
+from .http_cache import unique_media_name
+from .search import schedule_reindex
+
+
+def _universe_fields(universe_data: dict) -> dict:
+    return {
+        'description': universe_data['description'],
+        'style_graphique': universe_data['style_graphique'],
+        'type_monde': universe_data['type_monde'],
+    }
+
+
+def _scenario_fields(scenario_data: dict) -> dict:
+    return {
+        'acte_1': scenario_data['acte_1'],
+        'acte_2': scenario_data['acte_2'],
+        'acte_3': scenario_data['acte_3'],
+        'twist': scenario_data['twist'],
+    }
+
+
+def _create_characters(game: Game, characters: list):
+    Character.objects.bulk_create([
+        Character(
+            game=game,
+            nom=char_data['nom'],
+            classe=char_data.get('classe', 'guerrier'),
+            role=char_data.get('role', 'allie'),
+            background=char_data['background'],
+            gameplay_description=char_data.get('gameplay_description', '')
+        )
+        for char_data in characters
+    ])
+    schedule_reindex(game.id)
+    bump_version(game.id)
+
+
+def _create_locations(game: Game, locations: list):
+    Location.objects.bulk_create([
+        Location(game=game, nom=loc_data['nom'], description=loc_data['description'])
+        for loc_data in locations
+    ])
+    schedule_reindex(game.id)
+    bump_version(game.id)
+
+
+def _create_cover(game: Game, image_result: dict, stored_files: list):
+    concept_art = ConceptArt(game=game, description=image_result['description'], type_art="cover")
+    if image_result.get('image_data'):
+        # Fichier écrit avant l'insertion : une seule requête pour le visuel
+        concept_art.image.save(unique_media_name(f"{game.id}_cover.png"), image_result['image_data'], save=False)
+        stored_files.append((concept_art.image.storage, concept_art.image.name))
+    elif image_result.get('image_name'):
+        # Image déjà enregistrée lors d'un point de reprise
+        concept_art.image.name = image_result['image_name']
+    concept_art.save()
+
+
+def _delete_files(files: list):
+    for storage, name in files:
+        storage.delete(name)
+
+
+def save_generated_game(user, params: dict, content: dict) -> Game:
+    """
+    Enregistre un jeu à partir des paramètres du formulaire et du contenu
+    retourné par AIService.generate_full_game
+    """
+    image_result = content.get('image')
+    stored_files = []
+
+    try:
+        with transaction.atomic():
+            game = Game.objects.create(
+                titre=content['titre'],
+                genre=params['genre'],
+                ambiance=params['ambiance'],
+                mots_cles=params['mots_cles'],
+                references=params.get('references', ''),
+                createur=user,
+                est_public=params.get('est_public', True)
+            )
+            Universe.objects.create(game=game, **_universe_fields(content['universe']))
+            Scenario.objects.create(game=game, **_scenario_fields(content['scenario']))
+            _create_characters(game, content['characters'])
+            _create_locations(game, content['locations'])
+            if image_result:
+                _create_cover(game, image_result, stored_files)
+    except Exception:
+        # Transaction annulée : le fichier image n'est plus référencé
+        _delete_files(stored_files)
+        raise
+
+    return game
+
+
+def replace_section(game: Game, section: str, value):
+    """
+    Remplace une section d'un jeu par son contenu régénéré (format de
+    AIService.regenerate_section) ; les autres sections ne sont pas modifiées
+    """
+    stored_files = []
+
+    try:
+        with transaction.atomic():
+            if section == 'universe':
+                Universe.objects.update_or_create(game=game, defaults=_universe_fields(value))
+            elif section == 'scenario':
+                Scenario.objects.update_or_create(game=game, defaults=_scenario_fields(value))
+            elif section == 'characters':
+                game.characters.all().delete()
+                _create_characters(game, value)
+            elif section == 'locations':
+                game.locations.all().delete()
+                _create_locations(game, value)
+            elif section == 'image':
+                if not (value.get('image_data') or value.get('image_name')):
+                    # Sans nouveau fichier, la couverture existante est conservée
+                    raise ValueError("Image régénérée sans fichier")
+                old_covers = list(game.concept_arts.filter(type_art="cover"))
+                _create_cover(game, value, stored_files)
+                ConceptArt.objects.filter(id__in=[cover.id for cover in old_covers]).delete()
+                # Les anciens fichiers ne sont supprimés qu'une fois le remplacement validé
+                old_files = [(cover.image.storage, cover.image.name) for cover in old_covers if cover.image]
+                transaction.on_commit(lambda: _delete_files(old_files))
+            else:
+                raise ValueError(f"Section inconnue : {section}")
+    except Exception:
+        _delete_files(stored_files)
+        raise
@@ -0,0 +1,128 @@
+"""
+Réserve de jeux aléatoires pré-générés
+La commande fill_random_pool génère à l'avance, aux heures creuses, des jeux
+aléatoires complets rattachés à un utilisateur technique. Un clic sur
+« Génération aléatoire » attribue alors l'un d'eux au joueur, sans attendre l'IA.
+"""
+
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .ai_service import GenerationPhaseError, get_ai_service
+from .fragments import bump_version
+from .models import Game, GenerationJob
+from .persistence import save_generated_game
+from .quota import reserve_generation
+from .usage import attribute_calls
+
+
+DEFAULT_RANDOM_GAME_POOL = {
+    'SIZE': 10,                    # jeux prêts à distribuer (0 : réserve désactivée)
+    'USERNAME': 'gameforge-pool',  # propriétaire des jeux en réserve
+    'OFF_PEAK_HOURS': (1, 7),      # remplissage de [début, fin[ heures, heure locale
+}
+
+
+def pool_config() -> dict:
+    return {**DEFAULT_RANDOM_GAME_POOL, **getattr(settings, 'RANDOM_GAME_POOL', {})}
+
+
+def pool_user() -> User:
+    """Utilisateur technique propriétaire des jeux en réserve (créé au besoin)"""
+    user, created = User.objects.get_or_create(username=pool_config()['USERNAME'], defaults={'is_active': False})
+    if created:
+        user.set_unusable_password()
+        user.save(update_fields=['password'])
+    return user
+
+
+def available_games():
+    return Game.objects.filter(createur__username=pool_config()['USERNAME'])
+
+
+def is_off_peak(now=None) -> bool:
+    start, end = pool_config()['OFF_PEAK_HOURS']
+    hour = timezone.localtime(now).hour
+    # Plage éventuellement à cheval sur minuit (ex: 22h - 6h)
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+def queue_is_idle() -> bool:
+    """Aucune génération de joueur en attente : le débit de l'API est libre"""
+    return not GenerationJob.objects.filter(status='pending').exists()
+
+
+def claim_pool_game(user) -> Optional[Game]:
+    """
+    Attribue à `user` le plus ancien jeu en réserve, ou None si la réserve est vide.
+    La mise à jour conditionnelle sur le propriétaire garantit qu'un jeu n'est
+    attribué qu'une fois, même avec des clics simultanés. Le jeu consomme une
+    génération du jour ; sans génération disponible, rien n'est attribué.
+    """
+    candidates = available_games().order_by('date_creation').values_list('id', flat=True)[:10]
+    for game_id in candidates:
+        with transaction.atomic():
+            claimed = Game.objects.filter(id=game_id, createur__username=pool_config()['USERNAME']).update(
+                createur=user,
+                est_public=True,
+                date_creation=timezone.now(),
+            )
+            if claimed:
+                if reserve_generation(user) is None:
+                    transaction.set_rollback(True)
+                    return None
+                # update() n'envoie pas de signal : nouvelle version pour la carte et la page (créateur, date)
+                bump_version(game_id)
+                print(f"🎲 Jeu en réserve #{game_id} attribué à {user.username}")
+                return Game.objects.get(id=game_id)
+    return None
+
+
+def generate_pool_game(owner: User) -> Optional[Game]:
+    """Génère un jeu aléatoire complet pour la réserve (privé jusqu'à son attribution)"""
+    ai_service = get_ai_service()
+    # Appels à l'API comptés pour l'utilisateur technique de la réserve
+    with attribute_calls(owner.id):
+        random_params = ai_service.generate_random_game_params()
+        params = {
+            'genre': random_params['genre'],
+            'ambiance': random_params['ambiance'],
+            'mots_cles': random_params['keywords'],
+            'references': '',
+            'est_public': False,
+        }
+        try:
+            # Pas de contenu de secours dans la réserve : un jeu incomplet n'est pas conservé
+            content = ai_service.generate_full_game(
+                params['genre'], params['ambiance'], params['mots_cles'],
+                mode=settings.GENERATION_MODE, fallback=False
+            )
+        except GenerationPhaseError as e:
+            print(f"⚠️ Jeu de réserve abandonné : {e}")
+            return None
+    return save_generated_game(owner, params, content)
+
+
+def fill_pool(size: Optional[int] = None, respect_queue: bool = True) -> int:
+    """
+    Complète la réserve jusqu'à `size` jeux, un jeu à la fois.
+    Avec respect_queue, le remplissage s'interrompt dès qu'un joueur attend une génération.
+    Retourne le nombre de jeux ajoutés.
+    """
+    size = pool_config()['SIZE'] if size is None else size
+    owner = pool_user()
+    added = 0
+    while available_games().count() < size:
+        if respect_queue and not queue_is_idle():
+            print("⏸️ Générations de joueurs en attente, remplissage de la réserve suspendu")
+            break
+        game = generate_pool_game(owner)
+        if game is None:
+            break
+        added += 1
+        print(f"📦 Jeu '{game.titre}' ajouté à la réserve ({available_games().count()}/{size})")
+    return added
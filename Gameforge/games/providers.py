@@ -0,0 +1,462 @@
+"""
+Fournisseurs de complétions de texte et routage par étape
+Chaque fournisseur (Mistral, contenu local de démo, ...) répond à une requête
+de chat pour un modèle donné. Une route est un couple fournisseur:modèle ;
+TEXT_ROUTING liste les routes candidates de chaque étape de la génération
+(titre, univers, ...). Le routeur envoie chaque appel à la candidate qui a le
+meilleur p95 de latence et le moins d'erreurs sur ses derniers appels, et
+laisse de côté celles dont le disjoncteur est ouvert. Les mesures sont
+stockées en base pour être partagées par tous les processus.
+"""
+
+import asyncio
+import hashlib
+import inspect
+import json
+import random
+import re
+import weakref
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from mistralai import Mistral
+
+from .hedging import percentile
+from .models import Character, ProviderRouteStats, Universe
+
+
+DEFAULT_TEXT_ROUTING = {
+    'DEFAULT': ['mistral:mistral-small-latest'],  # routes des étapes sans configuration propre
+    'PHASES': {},          # étape -> routes candidates, par ordre de préférence
+    'WINDOW': 50,          # derniers appels retenus par route et par étape
+    'MIN_SAMPLES': 5,      # appels mesurés avant de comparer une route aux autres
+    'EXPLORE': 0.1,        # part des appels envoyée aux autres routes pour les mesurer
+    'ERROR_PENALTY': 4,    # score = p95 x (1 + ERROR_PENALTY x taux d'erreur)
+}
+
+
+class Route(namedtuple('Route', ['provider', 'model'])):
+    """Couple fournisseur / modèle, noté 'fournisseur:modèle'"""
+
+    @classmethod
+    def parse(cls, value: str) -> 'Route':
+        provider, _, model = value.partition(':')
+        return cls(provider, model or 'default')
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+async def emit_partial(on_partial: Optional[Callable], text: str):
+    """Transmet le texte reçu à on_partial (fonction ou coroutine)"""
+    if on_partial:
+        outcome = on_partial(text)
+        if inspect.isawaitable(outcome):
+            await outcome
+
+
+class TextProvider:
+    """
+    Interface d'un fournisseur : complete() reçoit le modèle et la requête
+    (messages et paramètres de complétion) et retourne (texte, usage).
+    on_partial(texte) active le streaming. `remote` : appels réseau soumis au
+    limiteur de débit, au disjoncteur et aux requêtes doublées.
+    """
+    name = ''
+    remote = True
+
+    def is_available(self) -> bool:
+        return True
+
+    def complete(self, model: str, request: Dict, on_partial: Optional[Callable[[str], None]] = None) -> tuple:
+        raise NotImplementedError
+
+    async def complete_async(self, model: str, request: Dict, on_partial: Optional[Callable] = None) -> tuple:
+        # Par défaut, l'appel synchrone dans un thread (le streaming est transmis en fin d'appel)
+        text, usage = await sync_to_async(self.complete)(model, request)
+        await emit_partial(on_partial, text)
+        return text, usage
+
+
+class MistralProvider(TextProvider):
+    name = 'mistral'
+
+    def __init__(self, api_key: Optional[str]):
+        self.api_key = api_key
+        self.client = None
+        # Clients asynchrones, un par boucle asyncio (voir async_client)
+        self._async_clients = weakref.WeakKeyDictionary()
+        if api_key and len(api_key) > 10:
+            try:
+                self.client = Mistral(api_key=api_key)
+                print(f"✅ Client Mistral initialisé avec la clé : {api_key[:8]}...")
+            except Exception as e:
+                print(f"❌ Erreur initialisation client Mistral: {e}")
+                self.client = None
+
+    def is_available(self) -> bool:
+        return self.client is not None
+
+    def async_client(self) -> Optional[Mistral]:
+        """
+        Client Mistral pour la boucle asyncio courante.
+        Le client HTTP asynchrone est lié à sa boucle : on en garde un par boucle.
+        """
+        if not self.client:
+            return None
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = Mistral(api_key=self.api_key)
+            self._async_clients[loop] = client
+        return client
+
+    def complete(self, model: str, request: Dict, on_partial: Optional[Callable[[str], None]] = None) -> tuple:
+        if not on_partial:
+            chat_response = self.client.chat.complete(model=model, **request)
+            return chat_response.choices[0].message.content, getattr(chat_response, 'usage', None)
+
+        text, usage = '', None
+        for event in self.client.chat.stream(model=model, **request):
+            chunk = event.data
+            usage = chunk.usage or usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if isinstance(delta, str) and delta:
+                text += delta
+                on_partial(text)
+        return text, usage
+
+    async def complete_async(self, model: str, request: Dict, on_partial: Optional[Callable] = None) -> tuple:
+        client = self.async_client()
+        if not on_partial:
+            chat_response = await client.chat.complete_async(model=model, **request)
+            return chat_response.choices[0].message.content, getattr(chat_response, 'usage', None)
+
+        text, usage = '', None
+        async for event in await client.chat.stream_async(model=model, **request):
+            chunk = event.data
+            usage = chunk.usage or usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if isinstance(delta, str) and delta:
+                text += delta
+                await emit_partial(on_partial, text)
+        return text, usage
+
+
+class LocalProvider(TextProvider):
+    """Contenu de démo déterministe, sans appel réseau : le même prompt donne le même texte"""
+    name = 'local'
+    remote = False
+
+    def generate(self, prompt: str) -> str:
+        """
+        Génère du contenu de démo sans API - AMÉLIORÉ pour être plus varié
+        """
+        # Créer un seed unique basé sur le prompt
+        seed = hashlib.md5(prompt.encode()).hexdigest()
+        hash_val = int(seed, 16)
+
+        if "titre" in prompt.lower():
+            prefixes = [
+                "Les Chroniques de", "La Légende de", "L'Aventure de", "Les Secrets de",
+                "Le Royaume de", "Les Gardiens de", "L'Éveil de", "La Quête de",
+                "Les Ombres de", "Le Destin de", "Les Héros de", "L'Odyssée de"
+            ]
+            suffixes = [
+                "l'Ombre", "la Lumière", "l'Éternité", "Azura", "Nexus",
+                "Eldoria", "Véridian", "l'Aube", "Midnight", "Atheron",
+                "Zephyria", "Obsidian", "Celestia", "Avalon", "Arcadia"
+            ]
+            prefix = prefixes[hash_val % len(prefixes)]
+            suffix = suffixes[(hash_val // 13) % len(suffixes)]
+            return f"{prefix} {suffix}"
+
+        elif "personnage" in prompt.lower() or "NOM:" in prompt:
+            # Mock de personnages avec format structuré et variation
+            names = ["Aelric", "Zara", "Theron", "Lyssa", "Kael", "Nyx", "Orin", "Selene"]
+            roles = ["héros", "antagoniste", "allié", "mentor"]
+            classes = ["guerrier", "mage", "archer", "voleur", "paladin", "druide"]
+
+            # Détecter l'ambiance dans le prompt
+            ambiance_detected = "default"
+            if "sombre" in prompt.lower():
+                ambiance_detected = "sombre"
+            elif "joyeux" in prompt.lower():
+                ambiance_detected = "joyeux"
+            elif "mysterieux" in prompt.lower():
+                ambiance_detected = "mysterieux"
+
+            backgrounds = {
+                'sombre': "Hanté par un passé tragique, ce personnage cherche la rédemption dans les ombres. Son cœur porte les cicatrices de pertes indicibles.",
+                'joyeux': "Optimiste et plein d'énergie, ce personnage apporte joie et espoir partout où il passe. Son rire est contagieux.",
+                'mysterieux': "Les origines de ce personnage restent énigmatiques. Entouré de secrets, sa véritable nature reste inconnue.",
+                'default': "Un personnage expérimenté dont les compétences sont reconnues. Déterminé à accomplir sa destinée."
+            }
+
+            name = names[hash_val % len(names)]
+            role = roles[(hash_val // 7) % len(roles)]
+            classe = classes[(hash_val // 11) % len(classes)]
+            background = backgrounds.get(ambiance_detected, backgrounds['default'])
+
+            return f"""NOM: {name}
+ROLE: {role}
+CLASSE: {classe}
+PERSONNALITE: Courageux, loyal, mystérieux
+BACKGROUND: {background}
+APPARENCE: Allure noble avec une aura de puissance
+COMPETENCES: Maîtrise du combat et des stratégies
+GAMEPLAY: Personnage équilibré avec des capacités variées
+
+---"""
+
+        elif "lieu" in prompt.lower() or "TYPE:" in prompt:
+            # Mock de lieux avec format structuré et variation
+            places = ["Tour", "Cité", "Forêt", "Temple", "Montagne", "Ruines", "Grotte", "Château"]
+            adjectives = ["Sombre", "Ancienne", "Mystérieuse", "Sacrée", "Oubliée", "Éternelle", "Maudite", "Céleste"]
+
+            # Détecter l'ambiance dans le prompt
+            ambiance_detected = "default"
+            if "sombre" in prompt.lower() or "dark" in prompt.lower():
+                ambiance_detected = "sombre"
+            elif "joyeux" in prompt.lower() or "happy" in prompt.lower():
+                ambiance_detected = "joyeux"
+            elif "mysterieux" in prompt.lower() or "mysterious" in prompt.lower():
+                ambiance_detected = "mysterieux"
+
+            descriptions = {
+                'sombre': "Un lieu désolé où règne une atmosphère oppressante. Les ombres semblent vivantes et peu osent s'y aventurer.",
+                'joyeux': "Un lieu vibrant de vie et de couleurs éclatantes. L'atmosphère y est chaleureuse et accueillante.",
+                'mysterieux': "Un lieu énigmatique dont les secrets restent bien gardés. Des phénomènes étranges y défient toute explication.",
+                'default': "Un lieu légendaire rempli de mystères et de dangers anciens."
+            }
+
+            place = places[hash_val % len(places)]
+            adj = adjectives[(hash_val // 7) % len(adjectives)]
+            description = descriptions.get(ambiance_detected, descriptions['default'])
+
+            return f"""NOM: {place} {adj}
+TYPE: donjon
+DESCRIPTION: {description}
+IMPORTANCE: Point clé de la quête principale
+DANGERS: Créatures hostiles et pièges mortels
+TRESORS: Artefacts puissants et connaissances perdues
+
+---"""
+
+        elif "scénario" in prompt.lower() or "acte" in prompt.lower():
+            return """Le héros découvre son destin dans un monde au bord du chaos.
+
+Les forces obscures se rassemblent et le héros doit former une alliance improbable pour les affronter.
+
+Dans une bataille épique finale, le héros révèle sa véritable nature et sauve le monde.
+
+Un ancien secret révèle que le véritable ennemi était caché depuis le début."""
+
+        return "Contenu généré en mode démo (API Mistral indisponible - rate limit atteint)"
+
+    def _pick(self, seed: str, options: List):
+        """Choix déterministe dans `options` selon `seed`"""
+        return options[int(hashlib.md5(seed.encode()).hexdigest(), 16) % len(options)]
+
+    def _count(self, prompt: str, noun: str, default: int) -> int:
+        """Nombre d'éléments demandé par le prompt ("Crée 3 personnages", "les 4 lieux")"""
+        match = re.search(rf"(\d+) {noun}", prompt)
+        return int(match.group(1)) if match else default
+
+    def _universe(self, prompt: str, title: str) -> Dict[str, str]:
+        places = ["des cités suspendues", "des ruines englouties", "des forêts de cristal", "des déserts de cendre",
+                  "des archipels flottants", "des mégapoles sans sommeil"]
+        threats = ["une ancienne prophétie", "une guerre oubliée", "une corruption qui s'étend",
+                   "le silence des dieux", "une machine millénaire"]
+        return {
+            'description': (
+                f"Le monde de {title} s'étend entre {self._pick(prompt + 'lieux', places)} "
+                f"et {self._pick(prompt + 'lieux2', places)}. Ses peuples vivent dans l'ombre de "
+                f"{self._pick(prompt + 'menace', threats)}, et chaque choix du joueur en change l'équilibre."
+            ),
+            'style_graphique': self._pick(prompt + 'style', [key for key, label in Universe.STYLE_CHOICES]),
+            'type_monde': self._pick(prompt + 'type', [key for key, label in Universe.TYPE_CHOICES]),
+        }
+
+    def _scenario(self, prompt: str, title: str) -> Dict[str, str]:
+        return {
+            'acte_1': f"Un inconnu arrive aux portes de {title} avec un message que personne ne veut entendre.",
+            'acte_2': self._pick(prompt + 'acte_2', [
+                "Les alliances se font et se défont tandis que la menace gagne chaque région.",
+                "La quête mène le groupe au cœur des terres interdites, où chaque victoire a un prix.",
+            ]),
+            'acte_3': "Au sommet de la crise, les héros doivent choisir ce qu'ils sont prêts à sacrifier.",
+            'twist': self._pick(prompt + 'twist', [
+                "Le mentor du héros est à l'origine de la catastrophe.",
+                "L'ennemi cherchait depuis le début à sauver le monde.",
+                "Le héros est la dernière pièce de la prophétie qu'il combat.",
+            ]),
+        }
+
+    def _characters(self, prompt: str, count: int) -> List[Dict[str, str]]:
+        name_parts = ['Ae', 'Kal', 'Thy', 'Zar', 'Lyn', 'Mor', 'Syl', 'Rae', 'Dor', 'Vel']
+        endings = ['ric', 'wen', 'dros', 'lia', 'than', 'mir', 'ys', 'gorn']
+        roles = [key for key, label in Character.ROLE_CHOICES]
+        classes = [key for key, label in Character.CLASSE_CHOICES]
+        characters = []
+        for index in range(count):
+            seed = f"{prompt}_{index}"
+            classe = self._pick(seed + 'classe', classes)
+            characters.append({
+                'nom': self._pick(seed + 'nom', name_parts) + self._pick(seed + 'fin', endings),
+                'role': roles[index] if index < len(roles) else self._pick(seed + 'role', roles),
+                'classe': classe,
+                'background': f"Ce {classe} a quitté les siens pour une dette qu'il ne peut plus ignorer.",
+                'gameplay_description': f"Style {classe} : {self._pick(seed + 'jeu', ['combat rapproché', 'attaques à distance', 'contrôle du terrain', 'soutien du groupe'])}.",
+            })
+        return characters
+
+    def _locations(self, prompt: str, count: int) -> List[Dict[str, str]]:
+        kinds = ['Citadelle', 'Marais', 'Bibliothèque', 'Port', 'Sanctuaire', 'Forge', 'Observatoire', 'Catacombes']
+        qualities = ['des Brumes', "d'Argent", 'Oubliée', 'des Échos', 'Brisée', 'du Crépuscule']
+        return [
+            {
+                'nom': f"{self._pick(f'{prompt}_{index}type', kinds)} {self._pick(f'{prompt}_{index}nom', qualities)}",
+                'description': "Un lieu chargé d'histoire où les héros trouvent autant d'indices que de dangers.",
+            }
+            for index in range(count)
+        ]
+
+    def generate_json(self, prompt: str) -> Dict[str, Any]:
+        """
+        Réponse JSON de démo de la forme demandée par le prompt : univers, scénario,
+        personnages, lieux, ou tout le jeu en une fois (mode 'bundle')
+        """
+        quoted = re.search(r'"([^"]+)"', prompt)
+        data = {}
+        if '"titre"' in prompt:
+            data['titre'] = self.generate(prompt)
+        title = data.get('titre') or (quoted.group(1) if quoted else "ce monde")
+        if '"univers"' in prompt:
+            data['univers'] = self._universe(prompt, title)
+            data['scenario'] = self._scenario(prompt, title)
+        elif '"style_graphique"' in prompt:
+            data.update(self._universe(prompt, title))
+        elif '"acte_1"' in prompt:
+            data.update(self._scenario(prompt, title))
+        if '"personnages"' in prompt:
+            data['personnages'] = self._characters(prompt, self._count(prompt, 'personnages', 3))
+        if '"lieux"' in prompt:
+            data['lieux'] = self._locations(prompt, self._count(prompt, 'lieux', 4))
+        return data
+
+    def _text(self, request: Dict) -> str:
+        prompt = request['messages'][-1]['content']
+        if request.get('response_format', {}).get('type') == 'json_object':
+            return json.dumps(self.generate_json(prompt), ensure_ascii=False)
+        return self.generate(prompt)
+
+    def complete(self, model: str, request: Dict, on_partial: Optional[Callable[[str], None]] = None) -> tuple:
+        text = self._text(request)
+        if on_partial:
+            on_partial(text)
+        return text, None
+
+    async def complete_async(self, model: str, request: Dict, on_partial: Optional[Callable] = None) -> tuple:
+        text = self._text(request)
+        await emit_partial(on_partial, text)
+        return text, None
+
+
+def summarize(samples: List) -> Dict[str, Any]:
+    """Appels, taux d'erreur et latences (p50, p95 des appels réussis) d'une liste de mesures"""
+    durations = [duration for duration, success in samples if success]
+    errors = sum(1 for duration, success in samples if not success)
+    p50, p95 = percentile(durations, 50), percentile(durations, 95)
+    return {
+        'calls': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 3) if samples else 0.0,
+        'p50': round(p50, 3) if p50 is not None else None,
+        'p95': round(p95, 3) if p95 is not None else None,
+    }
+
+
+class ProviderRouter:
+    def __init__(self, providers: Dict[str, TextProvider], circuit_breaker=None, config: Optional[dict] = None):
+        config = {**DEFAULT_TEXT_ROUTING, **(config or getattr(settings, 'TEXT_ROUTING', {}))}
+        self.providers = providers
+        self.circuit_breaker = circuit_breaker
+        self.default_routes = [Route.parse(value) for value in config['DEFAULT']]
+        self.phase_routes = {
+            phase: [Route.parse(value) for value in routes] for phase, routes in config['PHASES'].items()
+        }
+        self.window = int(config['WINDOW'])
+        self.min_samples = int(config['MIN_SAMPLES'])
+        self.explore = float(config['EXPLORE'])
+        self.error_penalty = float(config['ERROR_PENALTY'])
+
+    def candidates(self, phase: Optional[str]) -> List[Route]:
+        """Routes configurées pour l'étape dont le fournisseur est utilisable"""
+        routes = self.phase_routes.get(phase or '', self.default_routes)
+        return [route for route in routes if route.provider in self.providers and self.providers[route.provider].is_available()]
+
+    def _score(self, samples: List) -> float:
+        stats = summarize(samples)
+        if stats['p95'] is None:
+            return float('inf')
+        return stats['p95'] * (1 + self.error_penalty * stats['error_rate'])
+
+    def choose(self, phase: Optional[str], exclude: Iterable[str] = ()) -> Optional[Route]:
+        """
+        Route de l'appel suivant pour `phase` (None : aucun fournisseur disponible).
+        `exclude` : clés des routes déjà essayées pour cet appel.
+        """
+        candidates = [route for route in self.candidates(phase) if route.key not in exclude]
+        if len(candidates) <= 1:
+            return candidates[0] if candidates else None
+
+        if self.circuit_breaker:
+            blocked = self.circuit_breaker.open_models([route.model for route in candidates])
+            candidates = [route for route in candidates if route.model not in blocked] or candidates[:1]
+        samples = dict(ProviderRouteStats.objects.filter(
+            phase=phase or '', route__in=[route.key for route in candidates]
+        ).values_list('route', 'samples'))
+
+        # Routes encore peu mesurées : servies en priorité pour pouvoir être comparées
+        unmeasured = [route for route in candidates if len(samples.get(route.key, [])) < self.min_samples]
+        if unmeasured:
+            return min(unmeasured, key=lambda route: len(samples.get(route.key, [])))
+        ranked = sorted(candidates, key=lambda route: self._score(samples[route.key]))
+        # Une petite part des appels tient à jour les mesures des autres routes
+        if random.random() < self.explore:
+            return random.choice(ranked[1:])
+        return ranked[0]
+
+    def record(self, route: Route, phase: Optional[str], duration: float, success: bool):
+        """Ajoute un appel aux mesures de la route pour l'étape (fenêtre glissante)"""
+        for _ in range(5):
+            try:
+                stats, created = ProviderRouteStats.objects.get_or_create(route=route.key, phase=phase or '')
+            except IntegrityError:
+                continue
+            samples = (stats.samples + [[round(duration, 3), success]])[-self.window:]
+            updated = ProviderRouteStats.objects.filter(id=stats.id, version=stats.version).update(
+                samples=samples, updated_at=timezone.now(), version=F('version') + 1
+            )
+            if updated:
+                return
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Mesures glissantes de chaque route, par étape"""
+        return [
+            {'phase': stats.phase, 'route': stats.route, **summarize(stats.samples), 'updated_at': stats.updated_at}
+            for stats in ProviderRouteStats.objects.order_by('phase', 'route')
+        ]
+
+    async def choose_async(self, phase: Optional[str], exclude: Iterable[str] = ()) -> Optional[Route]:
+        return await sync_to_async(self.choose)(phase, exclude)
+
+    async def record_async(self, route: Route, phase: Optional[str], duration: float, success: bool):
+        await sync_to_async(self.record)(route, phase, duration, success)
@@ -0,0 +1,115 @@
+"""
+Quota quotidien de générations, par réservation
+Une place est réservée à l'envoi de la demande par une seule requête UPDATE
+conditionnelle (remise à zéro du jour comprise), puis confirmée quand le jeu
+est enregistré ou rendue si la génération échoue. Aucune lecture préalable ni
+verrou applicatif : le résultat reste juste avec de nombreux workers et
+requêtes simultanées.
+Avec GenerationLimit.daily_token_limit, la même requête refuse aussi la
+réservation une fois ce nombre de jetons consommé dans la journée (APICall).
+Les régénérations de section ont leur propre compteur quotidien
+(daily_regeneration_count), réservé et rendu de la même façon.
+"""
+
+from datetime import date
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import APICall, GenerationJob, GenerationLimit
+
+
+class QuotaExceeded(Exception):
+    """Plus aucune génération disponible aujourd'hui"""
+
+    def __init__(self, limit: Optional[GenerationLimit] = None):
+        self.daily_count = limit.daily_count if limit else None
+        super().__init__("Limite de générations quotidienne atteinte")
+
+
+# Compteurs réservables : (compteur du jour, limite quotidienne, jour du compteur)
+COUNTERS = {
+    'generation': ('generations_today', 'daily_count', 'last_reset'),
+    'regeneration': ('regenerations_today', 'daily_regeneration_count', 'regenerations_reset'),
+}
+
+
+def counter_for(kind: str) -> str:
+    """Compteur consommé par une tâche : les régénérations de section ont le leur"""
+    return 'regeneration' if kind == 'regenerate' else 'generation'
+
+
+def _today() -> date:
+    return timezone.now().date()
+
+
+def _tokens_today(today: date) -> Subquery:
+    """Jetons consommés aujourd'hui par l'utilisateur de la limite (sous-requête)"""
+    return Subquery(
+        APICall.objects.filter(user=OuterRef('user'), created_at__date=today)
+        .values('user')
+        .annotate(total=Sum(F('prompt_tokens') + F('completion_tokens')))
+        .values('total')
+    )
+
+
+def reserve_generation(user, counter: str = 'generation') -> Optional[date]:
+    """
+    Réserve une génération (ou une régénération, counter='regeneration') pour
+    aujourd'hui. Retourne la date de la réservation (à conserver pour la
+    rendre), ou None si la limite est atteinte.
+    """
+    count, daily_limit, reset = COUNTERS[counter]
+    today = _today()
+    # Compteur d'un jour précédent (ou jamais utilisé) : remis à zéro dans la même requête
+    stale = Q(**{f'{reset}__lt': today}) | Q(**{f'{reset}__isnull': True})
+    while True:
+        reserved = GenerationLimit.objects.filter(
+            stale | Q(**{f'{count}__lt': F(daily_limit)}),
+            Q(daily_token_limit__isnull=True) | Q(daily_token_limit__gt=Coalesce(_tokens_today(today), 0)),
+            user=user,
+        ).update(**{
+            count: Case(When(stale, then=Value(1)), default=F(count) + 1),
+            reset: today,
+        })
+        if reserved:
+            return today
+        # Pas de ligne pour cet utilisateur : on la crée puis on réessaie, sinon la limite est atteinte
+        limit, created = GenerationLimit.objects.get_or_create(user=user)
+        if not created:
+            return None
+
+
+def give_back_generation(user, reserved_on: date, counter: str = 'generation'):
+    """Rend une génération réservée (sans effet si le compteur a été remis à zéro depuis)"""
+    count, daily_limit, reset = COUNTERS[counter]
+    GenerationLimit.objects.filter(**{'user': user, reset: reserved_on, f'{count}__gt': 0}).update(
+        **{count: F(count) - 1}
+    )
+
+
+def commit_reservation(job: GenerationJob):
+    """La génération de la tâche a abouti : sa réservation est définitivement consommée"""
+    GenerationJob.objects.filter(id=job.id, quota_state='reserved').update(quota_state='committed')
+    job.quota_state = 'committed' if job.quota_state == 'reserved' else job.quota_state
+
+
+def release_reservation(job: GenerationJob):
+    """La tâche a échoué : sa réservation est rendue (une seule fois, même appelée plusieurs fois)"""
+    with transaction.atomic():
+        released = GenerationJob.objects.filter(id=job.id, quota_state='reserved').update(quota_state='released')
+        if released:
+            give_back_generation(job.user_id, job.quota_date, counter_for(job.kind))
+            job.quota_state = 'released'
+
+
+async def reserve_generation_async(user, counter: str = 'generation') -> Optional[date]:
+    return await sync_to_async(reserve_generation)(user, counter)
+
+
+async def give_back_generation_async(user, reserved_on: date, counter: str = 'generation'):
+    await sync_to_async(give_back_generation)(user, reserved_on, counter)
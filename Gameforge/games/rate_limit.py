@@ -0,0 +1,175 @@
+"""
+Limiteur de débit partagé pour les appels à l'API Mistral
+Seau à jetons (token bucket) et plafond de requêtes simultanées, stockés en
+base pour être partagés par tous les processus (vues et workers).
+"""
+
+import asyncio
+import hashlib
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import RateLimitBucket, RateLimitLease
+
+
+DEFAULT_RATE_LIMIT = {
+    'RATE': 1.0,             # requêtes par seconde (remplissage du seau)
+    'BURST': 5,              # taille du seau
+    'MAX_IN_FLIGHT': 8,      # requêtes simultanées, tous processus confondus
+    'LEASE_TIMEOUT': 300,    # secondes avant de considérer une requête comme perdue
+    'ACQUIRE_TIMEOUT': 120,  # attente maximum pour obtenir un créneau
+}
+
+
+class RateLimitTimeout(Exception):
+    """Aucun créneau d'appel obtenu dans le délai imparti"""
+
+
+class RateLimiter:
+    def __init__(self, api_key: Optional[str], config: Optional[dict] = None):
+        config = {**DEFAULT_RATE_LIMIT, **(config or getattr(settings, 'MISTRAL_RATE_LIMIT', {}))}
+        self.rate = float(config['RATE'])
+        self.burst = float(config['BURST'])
+        self.max_in_flight = int(config['MAX_IN_FLIGHT'])
+        self.lease_timeout = float(config['LEASE_TIMEOUT'])
+        self.acquire_timeout = float(config['ACQUIRE_TIMEOUT'])
+        # Seule une empreinte de la clé est stockée en base
+        self.key_prefix = hashlib.sha256((api_key or 'demo').encode()).hexdigest()[:16]
+
+    def bucket_key(self, model: str) -> str:
+        return f"{self.key_prefix}:{model}"
+
+    def _try_acquire(self, key: str) -> tuple:
+        """
+        Une tentative de réservation.
+        Retourne (id du bail, 0) en cas de succès, sinon (None, secondes à attendre).
+        La mise à jour est conditionnée par la version lue (verrouillage optimiste),
+        ce qui reste correct sur SQLite où select_for_update n'existe pas.
+        """
+        now = time.time()
+        try:
+            bucket, created = RateLimitBucket.objects.get_or_create(
+                key=key, defaults={'tokens': self.burst, 'updated_at': now}
+            )
+        except IntegrityError:
+            return None, 0
+
+        if bucket.in_flight >= self.max_in_flight:
+            # Libérer les baux de requêtes perdues (processus arrêté en plein appel)
+            expired, _ = RateLimitLease.objects.filter(key=key, expires_at__lt=now).delete()
+            if expired:
+                RateLimitBucket.objects.filter(key=key).update(
+                    in_flight=Greatest(F('in_flight') - expired, 0),
+                    version=F('version') + 1,
+                )
+                return None, 0
+            return None, 0.5
+
+        tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+        if tokens < 1:
+            return None, (1 - tokens) / self.rate
+
+        updated = RateLimitBucket.objects.filter(key=key, version=bucket.version).update(
+            tokens=tokens - 1,
+            updated_at=now,
+            in_flight=F('in_flight') + 1,
+            version=F('version') + 1,
+        )
+        if not updated:
+            # Un autre processus a modifié le seau entre-temps : on réessaie
+            return None, 0
+
+        lease_id = uuid.uuid4().hex
+        RateLimitLease.objects.create(id=lease_id, key=key, expires_at=now + self.lease_timeout)
+        return lease_id, 0
+
+    def _release(self, key: str, lease_id: str):
+        deleted, _ = RateLimitLease.objects.filter(id=lease_id).delete()
+        if deleted:
+            RateLimitBucket.objects.filter(key=key).update(
+                in_flight=Greatest(F('in_flight') - 1, 0),
+                version=F('version') + 1,
+            )
+
+    def penalize(self, model: str, delay: float):
+        """
+        Vide le seau après un 429 : tous les processus attendent `delay`
+        secondes avant le prochain appel, au lieu de réessayer en rafale.
+        """
+        RateLimitBucket.objects.filter(key=self.bucket_key(model)).update(
+            tokens=-self.rate * delay,
+            updated_at=time.time(),
+            version=F('version') + 1,
+        )
+
+    def _jittered(self, wait: float) -> float:
+        # Petit décalage aléatoire pour désynchroniser les workers
+        return wait + random.uniform(0, min(0.5, wait * 0.2 + 0.05))
+
+    @contextmanager
+    def slot(self, model: str):
+        """Réserve un créneau d'appel pour `model` (bloquant)"""
+        key = self.bucket_key(model)
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            lease_id, wait = self._try_acquire(key)
+            if lease_id:
+                break
+            if time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"Aucun créneau disponible pour {model} après {self.acquire_timeout}s")
+            time.sleep(self._jittered(wait))
+        try:
+            yield
+        finally:
+            self._release(key, lease_id)
+
+    @asynccontextmanager
+    async def slot_async(self, model: str):
+        """Variante asynchrone de slot()"""
+        key = self.bucket_key(model)
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            lease_id, wait = await sync_to_async(self._try_acquire)(key)
+            if lease_id:
+                break
+            if time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"Aucun créneau disponible pour {model} après {self.acquire_timeout}s")
+            await asyncio.sleep(self._jittered(wait))
+        try:
+            yield
+        finally:
+            await sync_to_async(self._release)(key, lease_id)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Délai demandé par l'en-tête Retry-After d'une réponse 429, s'il existe"""
+    response = getattr(error, 'raw_response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after')
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base_delay: float, error: Optional[Exception] = None) -> float:
+    """
+    Attente avant une nouvelle tentative : backoff exponentiel avec jitter
+    complet, jamais inférieur au Retry-After renvoyé par l'API.
+    """
+    delay = random.uniform(base_delay / 2, base_delay * (2 ** attempt))
+    retry_after = retry_after_seconds(error) if error else None
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, 1))
+    return round(delay, 2)
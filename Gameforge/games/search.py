@@ -0,0 +1,160 @@
+"""
+Recherche plein texte des jeux
+Index SQLite FTS5 (table games_game_search, une ligne par jeu) sur le titre,
+le genre, les mots-clés, la description de l'univers et les noms des
+personnages et des lieux. Les accents sont ignorés (« heros » trouve
+« Héros ») et chaque mot de la recherche est un préfixe (recherche à la
+frappe). Les résultats sont classés par pertinence (bm25, le titre pesant le
+plus lourd).
+L'index est tenu à jour par les signaux des modèles, une fois la transaction
+validée ; rebuild_search_index le reconstruit entièrement. Sur une autre base
+que SQLite, la recherche se rabat sur des filtres icontains (voir feed.py).
+"""
+
+import re
+import threading
+from typing import List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Character, Game, Location, Universe
+
+
+SEARCH_TABLE = 'games_game_search'
+
+# Poids bm25 des colonnes, dans l'ordre de la table
+RANK_WEIGHTS = {'titre': 10.0, 'genre': 2.0, 'mots_cles': 5.0, 'univers': 1.0, 'noms': 3.0}
+
+
+def create_index_sql() -> List[str]:
+    """Création de la table FTS5 et de son classement (utilisé par la migration)"""
+    columns = ', '.join(RANK_WEIGHTS)
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS.values())
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+        f"{columns}, tokenize='unicode61 remove_diacritics 2')",
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('rank', 'bm25({weights})')",
+    ]
+
+
+def is_available() -> bool:
+    """Index plein texte utilisable (base SQLite)"""
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query: str) -> Optional[str]:
+    """Expression MATCH FTS5 : tous les mots de la recherche, chacun en préfixe (None : aucun mot)"""
+    words = re.findall(r'\w+', query.lower())
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _document(game: Game) -> Tuple:
+    """Textes indexés d'un jeu, dans l'ordre des colonnes"""
+    universe = Universe.objects.filter(game_id=game.id).values_list('description', flat=True).first()
+    names = list(Character.objects.filter(game_id=game.id).values_list('nom', flat=True))
+    names += list(Location.objects.filter(game_id=game.id).values_list('nom', flat=True))
+    return (
+        game.titre,
+        f"{game.genre} {game.get_genre_display()}",
+        game.mots_cles,
+        universe or '',
+        ' '.join(names),
+    )
+
+
+def index_game(game_id: int):
+    """(Ré)indexe un jeu ; le retire de l'index s'il n'existe plus"""
+    if not is_available():
+        return
+    game = Game.objects.filter(id=game_id).only('titre', 'genre', 'mots_cles').first()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [game_id])
+        if game is not None:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE}(rowid, {', '.join(RANK_WEIGHTS)}) VALUES (%s, %s, %s, %s, %s, %s)",
+                [game_id, *_document(game)]
+            )
+
+
+def rebuild_index() -> int:
+    """Reconstruit tout l'index ; retourne le nombre de jeux indexés"""
+    if not is_available():
+        return 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        count = 0
+        for game in Game.objects.only('titre', 'genre', 'mots_cles').iterator(chunk_size=500):
+            index_game(game.id)
+            count += 1
+    return count
+
+
+def search_page(query: str, after: Optional[Tuple[float, int]] = None, limit: int = 25) -> List[Tuple[int, float]]:
+    """
+    Jeux publics correspondant à la recherche, du plus pertinent au moins
+    pertinent : [(id, rang)], à partir de la position `after` (rang, id)
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    sql = (
+        f"SELECT s.rowid, s.rank FROM {SEARCH_TABLE} s JOIN games_game g ON g.id = s.rowid "
+        f"WHERE {SEARCH_TABLE} MATCH %s AND g.est_public"
+    )
+    params = [expression]
+    if after is not None:
+        sql += " AND (s.rank > %s OR (s.rank = %s AND s.rowid > %s))"
+        params += [after[0], after[0], after[1]]
+    sql += " ORDER BY s.rank, s.rowid LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+# Jeux à réindexer à la validation de la transaction en cours (un seul passage par jeu)
+_pending = threading.local()
+
+
+def _flush_pending():
+    game_ids, _pending.ids = getattr(_pending, 'ids', set()), set()
+    for game_id in game_ids:
+        index_game(game_id)
+
+
+def schedule_reindex(game_id: int):
+    """Réindexe le jeu après la transaction en cours (immédiatement hors transaction)"""
+    if not is_available():
+        return
+    if not connection.in_atomic_block:
+        index_game(game_id)
+        return
+    if not hasattr(_pending, 'ids'):
+        _pending.ids = set()
+    first = not _pending.ids
+    _pending.ids.add(game_id)
+    # Un seul passage par transaction, quel que soit le nombre d'objets modifiés ; un
+    # passage déjà exécuté (ids vidés) ou annulé avec son savepoint est reprogrammé
+    if first or not any(func is _flush_pending for sids, func, robust in connection.run_on_commit):
+        transaction.on_commit(_flush_pending)
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def _game_changed(sender, instance, **kwargs):
+    schedule_reindex(instance.id)
+
+
+@receiver(post_save, sender=Universe)
+@receiver(post_save, sender=Character)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Universe)
+@receiver(post_delete, sender=Character)
+@receiver(post_delete, sender=Location)
+def _game_content_changed(sender, instance, **kwargs):
+    schedule_reindex(instance.game_id)
@@ -0,0 +1,190 @@
+"""
+Regroupement des appels identiques en cours (single-flight)
+Quand plusieurs demandes portent sur le même prompt pendant qu'un appel est
+déjà en cours, une seule requête part vers l'API et les autres attendent
+son résultat. Fonctionne entre threads, entre tâches asyncio, et en option
+entre processus grâce à une table de verrous (les processus en attente
+lisent ensuite la réponse dans le cache de complétion).
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+import weakref
+from typing import Callable, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import InFlightCompletion
+
+
+DEFAULT_SINGLE_FLIGHT = {
+    'CROSS_PROCESS': False,  # verrou en base partagé par tous les processus
+    'LOCK_TIMEOUT': 180,     # secondes avant de considérer un verrou comme abandonné
+    'POLL_INTERVAL': 0.5,    # intervalle de lecture du cache pour les processus en attente
+}
+
+
+class _Call:
+    """Appel en cours dans ce processus, partagé par les threads en attente"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.fallback = False
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, cache, config: Optional[dict] = None):
+        config = {**DEFAULT_SINGLE_FLIGHT, **(config or getattr(settings, 'COMPLETION_SINGLE_FLIGHT', {}))}
+        self.cache = cache
+        self.cross_process = config['CROSS_PROCESS']
+        self.lock_timeout = float(config['LOCK_TIMEOUT'])
+        self.poll_interval = float(config['POLL_INTERVAL'])
+        self._calls = {}
+        self._lock = threading.Lock()
+        # Appels en cours par boucle asyncio (un Future n'est utilisable que dans sa boucle)
+        self._async_calls = weakref.WeakKeyDictionary()
+
+    # --- Verrou entre processus ---
+
+    def _try_lock(self, key: str) -> Optional[str]:
+        """Prend le verrou en base pour `key`, retourne son propriétaire ou None"""
+        now = time.time()
+        # Verrou d'un processus arrêté en plein appel
+        InFlightCompletion.objects.filter(key=key, expires_at__lt=now).delete()
+        owner = uuid.uuid4().hex
+        try:
+            # Point de sauvegarde : l'échec ne casse pas une transaction en cours
+            with transaction.atomic():
+                InFlightCompletion.objects.create(key=key, owner=owner, expires_at=now + self.lock_timeout)
+        except IntegrityError:
+            return None
+        return owner
+
+    def _unlock(self, key: str, owner: str):
+        InFlightCompletion.objects.filter(key=key, owner=owner).delete()
+
+    def _is_locked(self, key: str) -> bool:
+        return InFlightCompletion.objects.filter(key=key, expires_at__gte=time.time()).exists()
+
+    def _run_leader(self, key: str, fn: Callable) -> tuple:
+        if not self.cross_process:
+            return fn()
+
+        while True:
+            owner = self._try_lock(key)
+            if owner:
+                try:
+                    return fn()
+                finally:
+                    self._unlock(key, owner)
+
+            # Un autre processus fait déjà l'appel : attendre sa réponse dans le cache
+            print("⏳ Prompt identique en cours dans un autre processus, attente du résultat...")
+            while self._is_locked(key):
+                time.sleep(self.poll_interval)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached, False
+            # Pas de réponse en cache (échec ou cache désactivé) : on reprend la main
+
+    async def _run_leader_async(self, key: str, fn: Callable) -> tuple:
+        if not self.cross_process:
+            return await fn()
+
+        while True:
+            owner = await sync_to_async(self._try_lock)(key)
+            if owner:
+                try:
+                    return await fn()
+                finally:
+                    await sync_to_async(self._unlock)(key, owner)
+
+            print("⏳ Prompt identique en cours dans un autre processus, attente du résultat...")
+            while await sync_to_async(self._is_locked)(key):
+                await asyncio.sleep(self.poll_interval)
+            cached = await self.cache.get_async(key)
+            if cached is not None:
+                return cached, False
+
+    # --- Points d'entrée ---
+
+    def do(self, key: str, fn: Callable, fallback_allowed: bool = True):
+        """
+        Exécute fn() une seule fois pour tous les appelants simultanés de `key`.
+        fn retourne (résultat, contenu de secours ?) : un contenu de secours n'est pas
+        partagé avec les appelants qui le refusent (fallback_allowed=False), ils refont l'appel.
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                break
+
+            print("🔗 Prompt identique déjà en cours, réutilisation du résultat")
+            call.done.wait()
+            if call.error:
+                raise call.error
+            if call.fallback and not fallback_allowed:
+                print("🔁 Résultat partagé de secours refusé, nouvel appel")
+                continue
+            return call.result
+
+        try:
+            call.result, call.fallback = self._run_leader(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: str, fn: Callable, fallback_allowed: bool = True):
+        """Variante asynchrone de do() : fn est une fonction retournant une coroutine"""
+        calls = self._async_calls.setdefault(asyncio.get_running_loop(), {})
+        while True:
+            future = calls.get(key)
+            if future is None:
+                break
+
+            print("🔗 Prompt identique déjà en cours, réutilisation du résultat")
+            try:
+                # shield : l'annulation d'un appelant n'interrompt pas l'appel partagé
+                result, fallback = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Appelant à l'origine de l'appel annulé (pas celui-ci) : un appelant en attente le reprend
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    print("🔁 Appel partagé annulé, nouvel appel")
+                    continue
+                raise
+            if fallback and not fallback_allowed:
+                print("🔁 Résultat partagé de secours refusé, nouvel appel")
+                continue
+            return result
+
+        future = asyncio.get_running_loop().create_future()
+        calls[key] = future
+        try:
+            result, fallback = await self._run_leader_async(key, fn)
+            future.set_result((result, fallback))
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Évite l'avertissement "exception never retrieved" sans appelant en attente
+            future.exception()
+            raise
+        finally:
+            del calls[key]
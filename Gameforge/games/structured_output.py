@@ -0,0 +1,148 @@
+"""
+Décodage validé des réponses JSON de l'API
+Les appels en mode JSON (response_format json_object) décrivent la forme
+attendue avec un sous-ensemble de JSON Schema : type, properties, required,
+items, minItems, maxItems, enum. Les valeurs d'enum sont comparées sans
+tenir compte de la casse ni des accents et ramenées à la valeur canonique.
+Un champ facultatif invalide est ignoré plutôt que de rejeter toute la réponse.
+"""
+
+import json
+import re
+import unicodedata
+from typing import Any, Dict, List, Tuple
+
+
+class SchemaError(ValueError):
+    """Réponse absente, JSON invalide ou non conforme au schéma"""
+
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+}
+
+
+def _normalize(value: str) -> str:
+    value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode()
+    return re.sub(r'[\s_-]+', '_', value.strip().lower())
+
+
+def validate(data: Any, schema: Dict, path: str = '$') -> Any:
+    """Vérifie `data` contre `schema` et retourne la valeur nettoyée"""
+    expected = schema.get('type')
+    if expected and (not isinstance(data, _TYPES[expected]) or
+                     (expected in ('integer', 'number') and isinstance(data, bool))):
+        raise SchemaError(f"{path} : {expected} attendu, {type(data).__name__} reçu")
+
+    if 'enum' in schema:
+        choices = {_normalize(choice): choice for choice in schema['enum']}
+        key = _normalize(data) if isinstance(data, str) else data
+        if key not in choices:
+            raise SchemaError(f"{path} : valeur {data!r} hors de {schema['enum']}")
+        return choices[key]
+
+    if expected == 'string':
+        data = data.strip()
+        if not data:
+            raise SchemaError(f"{path} : chaîne vide")
+        return data
+
+    if expected == 'object':
+        properties = schema.get('properties', {})
+        missing = [name for name in schema.get('required', []) if data.get(name) in (None, '')]
+        if missing:
+            raise SchemaError(f"{path} : champs manquants {missing}")
+        required = set(schema.get('required', []))
+        result = {}
+        # Les champs inconnus sont ignorés, les champs facultatifs vides ou invalides aussi
+        for name, sub_schema in properties.items():
+            if data.get(name) in (None, ''):
+                continue
+            try:
+                result[name] = validate(data[name], sub_schema, f"{path}.{name}")
+            except SchemaError:
+                if name in required:
+                    raise
+        return result
+
+    if expected == 'array':
+        if len(data) < schema.get('minItems', 0):
+            raise SchemaError(f"{path} : au moins {schema['minItems']} éléments attendus, {len(data)} reçus")
+        data = data[:schema.get('maxItems', len(data))]
+        items = schema.get('items')
+        return [validate(item, items, f"{path}[{i}]") for i, item in enumerate(data)] if items else data
+
+    return data
+
+
+def decode(text: str, schema: Dict) -> Any:
+    """Décode une réponse JSON et la valide (lève SchemaError en cas d'échec)"""
+    if not text:
+        raise SchemaError("réponse vide")
+    # Certains modèles entourent quand même le JSON d'un bloc ```json
+    text = re.sub(r'^```(?:json)?\s*|\s*```$', '', text.strip())
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise SchemaError(f"JSON invalide : {e}") from e
+    return validate(data, schema)
+
+
+def partial_strings(text: str) -> List[Tuple[tuple, str]]:
+    """
+    Chaînes déjà reçues d'un JSON en cours de génération (streaming), avec leur
+    chemin de clés : [(('univers', 'description'), "Un monde..."), ...].
+    Le texte peut s'arrêter n'importe où, y compris au milieu d'une chaîne.
+    """
+    results = []
+    stack = []          # conteneurs ouverts : [clé courante] pour un objet, [index] pour un tableau
+    kinds = []
+    expecting_key = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == '"':
+            # Lecture de la chaîne jusqu'au guillemet fermant (ou la fin du texte)
+            j = i + 1
+            while j < len(text) and text[j] != '"':
+                j += 2 if text[j] == '\\' else 1
+            raw = text[i + 1:min(j, len(text))]
+            if j > len(text):
+                # Coupée juste après une barre oblique inverse
+                raw = raw[:-1]
+            if j >= len(text):
+                # Coupée au milieu d'un échappement \uXXXX
+                raw = re.sub(r'(?<!\\)((?:\\\\)*)\\u[0-9a-fA-F]{0,3}$', r'\1', raw)
+            try:
+                value = json.loads(f'"{raw}"')
+            except json.JSONDecodeError:
+                value = raw
+            if kinds and kinds[-1] == 'object' and expecting_key:
+                stack[-1] = value
+                expecting_key = False
+            else:
+                results.append((tuple(stack), value))
+            i = j + 1
+            continue
+        if char == '{':
+            kinds.append('object')
+            stack.append(None)
+            expecting_key = True
+        elif char == '[':
+            kinds.append('array')
+            stack.append(0)
+        elif char in '}]' and kinds:
+            kinds.pop()
+            stack.pop()
+        elif char == ',' and kinds:
+            if kinds[-1] == 'object':
+                expecting_key = True
+            else:
+                stack[-1] += 1
+        i += 1
+    return results
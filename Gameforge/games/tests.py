@@ -1,3 +1,1336 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import DatabaseError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .ai_service import (
+    AIService, CHARACTERS_SCHEMA, LOCATIONS_SCHEMA, SCENARIO_SCHEMA, UNIVERSE_SCHEMA, WORLD_BUNDLE_SCHEMA,
+    GenerationPhaseError, _partial_sink, get_ai_service,
+)
+from .budget import TokenBudget, truncate_tokens
+from .circuit_breaker import CircuitBreaker
+from .completion_cache import CompletionCache
+from .feed import encode_cursor, feed_page
+from .fragments import game_fragments
+from .hedging import Hedger
+from .http_cache import serve_media
+from .jobs import _Heartbeat, claim_next_job, enqueue_generation, requeue_stale_jobs, run_job
+from .models import (
+    AIAgent, APICall, Game, Universe, Scenario, Character, Location, ConceptArt, Favorite, GenerationJob,
+    GenerationLimit, RateLimitBucket, CachedCompletion, InFlightCompletion,
+)
+from .persistence import replace_section, save_generated_game
+from .pool import claim_pool_game, pool_user
+from .providers import LocalProvider, Route
+from .rate_limit import RateLimiter, backoff_delay
+from .single_flight import SingleFlight
+from .quota import QuotaExceeded, release_reservation, reserve_generation
+from .structured_output import SchemaError, decode as decode_json, partial_strings, validate
+from .usage import attribute_calls
+
+
+def game_content(**overrides):
+    """Contenu tel que retourné par AIService.generate_full_game"""
+    content = {
+        'titre': 'Azura',
+        'universe': {'description': 'Un archipel flottant', 'style_graphique': 'realiste', 'type_monde': 'ouvert'},
+        'scenario': {'acte_1': 'Début', 'acte_2': 'Milieu', 'acte_3': 'Fin', 'twist': 'Surprise'},
+        'characters': [{'nom': 'Lyra', 'background': 'Une pilote'}, {'nom': 'Oren', 'background': 'Un mage'}],
+        'locations': [{'nom': 'Port Céleste', 'description': 'Un port dans les nuages'}],
+        'image': None,
+        'errors': {},
+    }
+    content.update(overrides)
+    return content
+
+
+class QueueTest(TestCase):
+    """File des générations : demande en double, réservation concurrente et statuts d'une tâche"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('joueur', password='motdepasse')
+        self.params = {'genre': 'rpg', 'ambiance': 'epique', 'mots_cles': 'dragons'}
+
+    def test_enqueue_reuses_active_duplicate(self):
+        job = enqueue_generation(self.user, 'custom', self.params)
+        self.assertEqual(enqueue_generation(self.user, 'custom', dict(self.params)).id, job.id)
+        other = enqueue_generation(self.user, 'custom', {**self.params, 'mots_cles': 'pirates'})
+        self.assertNotEqual(other.id, job.id)
+        # Tâche terminée : une nouvelle demande identique relance une génération
+        GenerationJob.objects.filter(id=job.id).update(status='done')
+        self.assertNotEqual(enqueue_generation(self.user, 'custom', self.params).id, job.id)
+
+    def test_claim_skips_job_taken_by_another_worker(self):
+        first = GenerationJob.objects.create(user=self.user, kind='custom', params=self.params)
+        second = GenerationJob.objects.create(user=self.user, kind='custom', params=self.params)
+        now = timezone.now()
+
+        def other_worker_claims_first():
+            # Un autre worker prend la première tâche entre la lecture des candidates et la réservation
+            if not other_worker_claims_first.done:
+                other_worker_claims_first.done = True
+                GenerationJob.objects.filter(id=first.id).update(status='running', worker='autre')
+            return now
+        other_worker_claims_first.done = False
+
+        with mock.patch('games.jobs.timezone.now', side_effect=other_worker_claims_first):
+            claimed = claim_next_job('w1')
+        self.assertEqual(claimed.id, second.id)
+        self.assertEqual(claimed.worker, 'w1')
+        self.assertEqual(GenerationJob.objects.get(id=first.id).worker, 'autre')
+        self.assertIsNone(claim_next_job('w2'))
+
+    async def test_async_heartbeat_stops_on_exit(self):
+        job = await GenerationJob.objects.acreate(user=self.user, kind='custom', params=self.params,
+                                                  status='running')
+        heartbeat = _Heartbeat(job, interval=0.01)
+        async with heartbeat:
+            await asyncio.sleep(0.05)
+        self.assertTrue(heartbeat._task.done())
+        await job.arefresh_from_db()
+        self.assertIsNotNone(job.heartbeat_at)
+
+    def test_run_job_done(self):
+        job = GenerationJob.objects.create(user=self.user, kind='custom', params=self.params, status='running')
+        with mock.patch.object(AIService, 'generate_full_game', return_value=game_content()):
+            run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.phase, '')
+        self.assertIn('save', job.phases_done)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(job.game.titre, 'Azura')
+
+    def test_run_job_failed_releases_quota(self):
+        job = enqueue_generation(self.user, 'custom', self.params, reserve_quota=True)
+        GenerationJob.objects.filter(id=job.id).update(status='running')
+        job.refresh_from_db()
+        with mock.patch.object(AIService, 'generate_full_game', side_effect=GenerationPhaseError({'title': 'panne'})):
+            run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('panne', job.error)
+        self.assertEqual(job.quota_state, 'released')
+        self.assertIsNone(job.game)
+        self.assertEqual(GenerationLimit.objects.get(user=self.user).generations_today, 0)
+
+
+class ParallelPhasesTest(TestCase):
+    """Étapes de generate_full_game : ordre des dépendances, échec d'une étape et délai dépassé"""
+
+    def setUp(self):
+        self.service = AIService()
+        self.content = game_content(image={'description': 'Une île', 'image_data': None, 'image_url': None})
+        self.events = []
+        # Les quatre étapes indépendantes ne passent la barrière qu'ensemble : elles tournent en parallèle
+        self.barrier = threading.Barrier(4, timeout=5)
+
+    def phase(self, name, value):
+        def run(*args):
+            if name not in ('title', 'universe'):
+                self.barrier.wait()
+            return value
+        return run
+
+    def generate(self, overrides=None, **kwargs):
+        content = self.content
+        methods = {
+            'generate_game_title': self.phase('title', content['titre']),
+            'generate_universe': self.phase('universe', content['universe']),
+            'generate_scenario': self.phase('scenario', content['scenario']),
+            'generate_characters': self.phase('characters', content['characters']),
+            'generate_locations': self.phase('locations', content['locations']),
+            'generate_and_save_image': self.phase('image', content['image']),
+            **(overrides or {}),
+        }
+        with mock.patch.multiple(self.service, **methods):
+            return self.service.generate_full_game(
+                'rpg', 'epique', 'dragons', on_phase=lambda phase, state: self.events.append((phase, state)),
+                **kwargs
+            )
+
+    def test_dependencies_run_first_then_fan_out(self):
+        result = self.generate()
+
+        self.assertEqual(self.events[:4], [('title', 'start'), ('title', 'done'),
+                                           ('universe', 'start'), ('universe', 'done')])
+        self.assertEqual({phase for phase, state in self.events[4:8]}, {'scenario', 'characters', 'locations', 'image'})
+        self.assertTrue(all(state == 'start' for phase, state in self.events[4:8]))
+        self.assertEqual(result['errors'], {})
+        self.assertEqual(result['characters'], self.content['characters'])
+
+    def test_failed_phase_keeps_the_others(self):
+        def broken(*args):
+            self.barrier.wait()
+            raise RuntimeError('panne')
+
+        saved = {}
+        with self.assertRaises(GenerationPhaseError) as raised:
+            self.generate({'generate_characters': broken}, fallback=False,
+                          on_checkpoint=lambda phase, value: saved.setdefault(phase, value))
+        self.assertEqual(list(raised.exception.errors), ['characters'])
+        self.assertEqual(set(saved), {'title', 'universe', 'scenario', 'locations', 'image'})
+
+        # Avec contenu de secours, l'étape en échec est remplacée et signalée
+        self.barrier.reset()
+        result = self.generate({'generate_characters': broken})
+        self.assertEqual(result['errors'], {'characters': 'panne'})
+        self.assertTrue(result['characters'])
+
+    def test_timed_out_phase_stops_streaming(self):
+        release, finished = threading.Event(), threading.Event()
+
+        def slow(*args):
+            self.barrier.wait()
+            release.wait(5)
+            # Texte reçu après l'abandon de l'étape : il n'atteint plus la tâche
+            _partial_sink.get()('Port tardif')
+            finished.set()
+            return self.content['locations']
+
+        partial = []
+        result = self.generate({'generate_locations': slow}, timeouts={'locations': 0.2},
+                               on_partial=lambda phase, text: partial.append((phase, text)))
+        release.set()
+        self.assertTrue(finished.wait(5))
+        self.assertIn('Délai', result['errors']['locations'])
+        self.assertEqual(partial, [])
+        self.assertIn(('locations', 'done'), self.events)
+
+
+class SharedServiceTest(TestCase):
+    """Un seul AIService par processus ; l'agent d'images est conservé en base"""
+
+    def test_get_ai_service_is_shared_across_threads(self):
+        services = []
+        with mock.patch('games.ai_service._service_instance', None):
+            threads = [threading.Thread(target=lambda: services.append(get_ai_service())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertIs(get_ai_service(), services[0])
+        self.assertEqual(len({id(service) for service in services}), 1)
+
+    def test_image_agent_is_created_once_and_persisted(self):
+        client = mock.Mock()
+        client.beta.agents.create.return_value = mock.Mock(id='ag_123')
+        service = AIService()
+        service.client = client
+        self.assertEqual(service.image_agent_id, 'ag_123')
+        self.assertEqual(service.image_agent_id, 'ag_123')
+        self.assertEqual(client.beta.agents.create.call_count, 1)
+        self.assertEqual(AIAgent.objects.get().agent_id, 'ag_123')
+
+        # Nouveau processus : l'agent enregistré est repris, sans appel à l'API
+        restarted = AIService()
+        restarted.client = mock.Mock()
+        self.assertEqual(restarted.image_agent_id, 'ag_123')
+        restarted.client.beta.agents.create.assert_not_called()
+
+    def test_agent_creation_failure_is_not_retried_at_once(self):
+        client = mock.Mock()
+        client.beta.agents.create.side_effect = RuntimeError('non activé')
+        service = AIService()
+        service.client = client
+        self.assertIsNone(service.image_agent_id)
+        self.assertIsNone(service.image_agent_id)
+        self.assertEqual(client.beta.agents.create.call_count, 1)
+        self.assertFalse(AIAgent.objects.exists())
+
+
+class AsyncParityTest(TestCase):
+    """generate_full_game_async produit le même jeu que generate_full_game, avec les mêmes échecs"""
+
+    def setUp(self):
+        self.service = AIService()
+        content = game_content()
+        # Réponses brutes de l'API, par max_tokens demandé (un par étape)
+        self.responses = {
+            50: content['titre'],
+            400: json.dumps(content['universe']),
+            600: json.dumps(content['scenario']),
+            800: json.dumps({'personnages': content['characters']}),
+            700: json.dumps({'lieux': content['locations']}),
+        }
+
+    def patched(self):
+        responses = self.responses
+
+        def call_api(prompt, max_tokens=500, **kwargs):
+            return responses[max_tokens]
+
+        async def call_api_async(prompt, max_tokens=500, **kwargs):
+            return responses[max_tokens]
+
+        route = Route('mistral', 'mistral-small-latest')
+        return mock.patch.multiple(
+            self.service, _call_api=call_api, _call_api_async=call_api_async,
+            router=mock.Mock(choose=mock.Mock(return_value=route), choose_async=mock.AsyncMock(return_value=route)),
+        )
+
+    def generate_both(self, **kwargs):
+        kwargs = {'num_characters': 2, 'num_locations': 1, 'with_image': False, **kwargs}
+        with self.patched():
+            sync = self.service.generate_full_game('rpg', 'epique', 'dragons', **kwargs)
+            result = async_to_sync(self.service.generate_full_game_async)('rpg', 'epique', 'dragons', **kwargs)
+        return sync, result
+
+    def test_same_game(self):
+        sync, result = self.generate_both()
+        for key in ('titre', 'universe', 'scenario', 'characters', 'locations', 'errors'):
+            self.assertEqual(sync[key], result[key], key)
+        self.assertEqual(result['titre'], 'Azura')
+        self.assertEqual([character['nom'] for character in result['characters']], ['Lyra', 'Oren'])
+
+    def test_same_failure_without_fallback(self):
+        self.responses[800] = json.dumps({'personnages': []})
+        with self.patched():
+            with self.assertRaises(GenerationPhaseError) as sync_error:
+                self.service.generate_full_game('rpg', 'epique', 'dragons', with_image=False, fallback=False)
+            with self.assertRaises(GenerationPhaseError) as async_error:
+                async_to_sync(self.service.generate_full_game_async)('rpg', 'epique', 'dragons', with_image=False,
+                                                                     fallback=False)
+        self.assertEqual(list(sync_error.exception.errors), ['characters'])
+        self.assertEqual(list(async_error.exception.errors), ['characters'])
+
+
+class WorldBundleTest(TestCase):
+    """Mode 'bundle' : une seule complétion, ou le mode enchaîné si elle est inutilisable"""
+
+    def setUp(self):
+        self.service = AIService()
+        content = game_content()
+        bundle = {'titre': 'Azura', 'univers': content['universe'], 'scenario': content['scenario'],
+                  'personnages': content['characters'], 'lieux': content['locations']}
+        self.responses = {
+            2500: json.dumps(bundle),
+            50: 'Chained',
+            400: json.dumps(content['universe']),
+            600: json.dumps(content['scenario']),
+            800: json.dumps({'personnages': content['characters']}),
+            700: json.dumps({'lieux': content['locations']}),
+        }
+        self.calls = []
+
+    def generate(self, run_async=False):
+        def call_api(prompt, max_tokens=500, **kwargs):
+            self.calls.append(max_tokens)
+            return self.responses[max_tokens]
+
+        async def call_api_async(prompt, max_tokens=500, **kwargs):
+            return call_api(prompt, max_tokens)
+
+        route = Route('mistral', 'mistral-small-latest')
+        router = mock.Mock(choose=mock.Mock(return_value=route), choose_async=mock.AsyncMock(return_value=route))
+        kwargs = {'num_characters': 2, 'num_locations': 1, 'with_image': False, 'mode': 'bundle', 'fallback': False}
+        with mock.patch.multiple(self.service, _call_api=call_api, _call_api_async=call_api_async, router=router):
+            if run_async:
+                return async_to_sync(self.service.generate_full_game_async)('rpg', 'epique', 'dragons', **kwargs)
+            return self.service.generate_full_game('rpg', 'epique', 'dragons', **kwargs)
+
+    def test_single_completion(self):
+        for run_async in (False, True):
+            self.calls.clear()
+            result = self.generate(run_async)
+            self.assertEqual(self.calls, [2500])
+            self.assertEqual(result['titre'], 'Azura')
+            self.assertEqual(len(result['characters']), 2)
+
+    def test_invalid_json_falls_back_to_chained(self):
+        self.responses[2500] = '{"titre": "Azura", "univers": {"description": "Un archi'
+        for run_async in (False, True):
+            self.calls.clear()
+            result = self.generate(run_async)
+            self.assertEqual(self.calls[0], 2500)
+            self.assertEqual(sorted(self.calls[1:]), [50, 400, 600, 700, 800])
+            self.assertEqual(result['titre'], 'Chained')
+            self.assertIn('bundle', result['errors'])
+            self.assertEqual(result['locations'][0]['nom'], 'Port Céleste')
+
+
+class RateLimiterTest(TestCase):
+    """Seau à jetons et plafond de requêtes simultanées partagés en base"""
+
+    def limiter(self, **config):
+        return RateLimiter('cle', {'RATE': 2, 'BURST': 3, 'MAX_IN_FLIGHT': 10, 'LEASE_TIMEOUT': 60, **config})
+
+    def acquire(self, limiter, now):
+        with mock.patch('games.rate_limit.time.time', return_value=now):
+            return limiter._try_acquire(limiter.bucket_key('mistral-small-latest'))
+
+    def test_burst_then_refill(self):
+        limiter = self.limiter()
+        for _ in range(3):
+            lease_id, wait = self.acquire(limiter, 1000)
+            self.assertTrue(lease_id)
+        # Seau vide : un jeton revient en 1/RATE secondes
+        self.assertEqual(self.acquire(limiter, 1000), (None, 0.5))
+        self.assertTrue(self.acquire(limiter, 1000.5)[0])
+        # Le remplissage ne dépasse jamais BURST
+        for _ in range(3):
+            self.assertTrue(self.acquire(limiter, 2000)[0])
+        self.assertIsNone(self.acquire(limiter, 2000)[0])
+
+    def test_in_flight_cap_and_expired_leases(self):
+        limiter = self.limiter(BURST=10, MAX_IN_FLIGHT=2)
+        key = limiter.bucket_key('mistral-small-latest')
+        first, _ = self.acquire(limiter, 1000)
+        self.acquire(limiter, 1000)
+        self.assertEqual(self.acquire(limiter, 1001), (None, 0.5))
+        limiter._release(key, first)
+        self.assertTrue(self.acquire(limiter, 1001)[0])
+        self.assertEqual(RateLimitBucket.objects.get(key=key).in_flight, 2)
+        # Baux expirés (processus arrêté en plein appel) : libérés par le prochain demandeur
+        self.assertEqual(self.acquire(limiter, 1100), (None, 0))
+        self.assertEqual(RateLimitBucket.objects.get(key=key).in_flight, 0)
+        self.assertTrue(self.acquire(limiter, 1100)[0])
+
+    def test_penalize_empties_bucket(self):
+        limiter = self.limiter()
+        self.acquire(limiter, 1000)
+        with mock.patch('games.rate_limit.time.time', return_value=1000):
+            limiter.penalize('mistral-small-latest', 4)
+        # -RATE × 4 jetons : un jeton disponible après 4,5 s
+        self.assertEqual(self.acquire(limiter, 1000), (None, 4.5))
+        self.assertIsNone(self.acquire(limiter, 1004)[0])
+        self.assertTrue(self.acquire(limiter, 1004.5)[0])
+
+    def test_backoff_honours_retry_after(self):
+        error = Exception('429 Too Many Requests')
+        error.raw_response = mock.Mock(headers={'retry-after': '30'})
+        for attempt in range(3):
+            self.assertGreaterEqual(backoff_delay(attempt, 1.0, error), 30)
+            self.assertLessEqual(backoff_delay(attempt, 1.0, error), 31)
+        # En-tête illisible : backoff exponentiel seul
+        error.raw_response.headers = {'retry-after': 'bientôt'}
+        self.assertLessEqual(backoff_delay(0, 1.0, error), 1.0)
+        self.assertLessEqual(backoff_delay(2, 1.0), 4.0)
+
+
+class CompletionBookkeepingTest(TestCase):
+    """Une réponse reçue est retournée même si son suivi (cache, statistiques) échoue"""
+
+    def test_stats_failure_keeps_response(self):
+        service = AIService()
+        route = Route('mistral', 'mistral-small-latest')
+        send = mock.Mock(return_value=('Réponse payée', None))
+        failing_set = mock.Mock(side_effect=DatabaseError('database is locked'))
+        with mock.patch.multiple(service, _send_completion=send), \
+                mock.patch.object(service.completion_cache, 'set', failing_set):
+            result = service._request_completion(route, 'Un titre', 50, cache_key='titre')
+        self.assertEqual(result, 'Réponse payée')
+        # Pas de nouvelle tentative : l'appel a abouti
+        self.assertEqual(send.call_count, 1)
+        failing_set.assert_called_once()
+        self.assertTrue(APICall.objects.get().success)
+
+    def test_stats_failure_keeps_response_async(self):
+        service = AIService()
+        route = Route('mistral', 'mistral-small-latest')
+        send = mock.AsyncMock(return_value=('Réponse payée', None))
+        with mock.patch.multiple(service, _send_completion_async=send), \
+                mock.patch.object(service.router, 'record_async', side_effect=DatabaseError('database is locked')):
+            result = async_to_sync(service._request_completion_async)(route, 'Un titre', 50)
+        self.assertEqual(result, 'Réponse payée')
+        self.assertEqual(send.await_count, 1)
+
+
+class CompletionCacheTest(TestCase):
+    """Cache des complétions : niveaux mémoire et base, expiration et purge"""
+
+    def cache(self, **config):
+        return CompletionCache({'TTL': 60, 'TIERS': ['memory', 'database'], 'MEMORY_MAX_ENTRIES': 10,
+                                'DB_MAX_ENTRIES': 100, 'DB_EVICT_EVERY': 1, **config})
+
+    def test_database_tier_fills_memory_tier(self):
+        self.cache().set('cle', 'Azura')
+        # Nouveau processus : mémoire vide, réponse lue en base puis remontée en mémoire
+        cache = self.cache()
+        self.assertEqual(cache.get('cle'), 'Azura')
+        self.assertEqual(cache.get('cle'), 'Azura')
+        self.assertIsNone(cache.get('autre'))
+        stats = cache.stats()
+        self.assertEqual((stats['database_hits'], stats['memory_hits'], stats['misses']), (1, 1, 1))
+
+    def test_expired_entries_are_ignored(self):
+        cache = self.cache()
+        cache.set('cle', 'Azura')
+        later = timezone.now() + timedelta(seconds=61)
+        with mock.patch('games.completion_cache.time.time', return_value=later.timestamp()), \
+                mock.patch('games.completion_cache.timezone.now', return_value=later):
+            self.assertIsNone(cache.get('cle'))
+            self.assertIsNone(self.cache().get('cle'))
+
+    def test_eviction_every_n_writes(self):
+        cache = self.cache(TIERS=['database'], DB_MAX_ENTRIES=2, DB_EVICT_EVERY=3)
+        for key in ('a', 'b'):
+            cache.set(key, key)
+        with CaptureQueriesContext(connection) as queries:
+            cache.set('c', 'c')
+        # Troisième écriture : purge des entrées les moins récemment utilisées
+        self.assertTrue(any('COUNT' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(sorted(CachedCompletion.objects.values_list('key', flat=True)), ['b', 'c'])
+        with CaptureQueriesContext(connection) as queries:
+            cache.set('d', 'd')
+        self.assertFalse(any('COUNT' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(CachedCompletion.objects.count(), 3)
+
+    def test_regenerate_section_bypasses_cache(self):
+        service = AIService()
+        user = User.objects.create_user('createur', password='motdepasse')
+        game = Game.objects.create(titre='Azura', genre='rpg', ambiance='epique', mots_cles='dragons', createur=user)
+        universe = json.dumps(game_content()['universe'])
+        send = mock.Mock(return_value=(universe, None))
+        route = Route('mistral', 'mistral-small-latest')
+        router = mock.Mock(choose=mock.Mock(return_value=route))
+        with mock.patch.multiple(service, _send_completion=send, router=router):
+            for _ in range(2):
+                service.generate_universe('Azura', 'rpg', 'epique', 'dragons')
+            self.assertEqual(send.call_count, 1)
+            # Même prompt : la régénération demande une nouvelle réponse
+            service.regenerate_section(game, 'universe')
+            self.assertEqual(send.call_count, 2)
+
+
+class SingleFlightTest(TestCase):
+    """Appels identiques regroupés : annulation, contenu de secours et verrou entre processus"""
+
+    def setUp(self):
+        self.cache = CompletionCache({'TIERS': ['memory']})
+        self.flight = SingleFlight(self.cache, {'CROSS_PROCESS': False})
+
+    def shared_call(self, leader_result, follower_fallback_allowed=True, cancel_leader=False):
+        """Un appel en cours et un appelant identique en attente ; retourne (résultat de l'appelant, appels)"""
+        calls = []
+
+        async def scenario():
+            started, release = asyncio.Event(), asyncio.Event()
+
+            async def leader_fn():
+                calls.append('meneur')
+                started.set()
+                await release.wait()
+                return leader_result
+
+            async def follower_fn():
+                calls.append('suiveur')
+                return 'Réponse réelle', False
+
+            leader = asyncio.create_task(self.flight.do_async('cle', leader_fn))
+            await started.wait()
+            follower = asyncio.create_task(
+                self.flight.do_async('cle', follower_fn, fallback_allowed=follower_fallback_allowed)
+            )
+            await asyncio.sleep(0)
+            if cancel_leader:
+                leader.cancel()
+            release.set()
+            return await follower
+
+        return async_to_sync(scenario)(), calls
+
+    def test_result_is_shared(self):
+        self.assertEqual(self.shared_call(('Azura', False)), ('Azura', ['meneur']))
+
+    def test_follower_takes_over_cancelled_leader(self):
+        self.assertEqual(self.shared_call(('Azura', False), cancel_leader=True),
+                         ('Réponse réelle', ['meneur', 'suiveur']))
+
+    def test_fallback_not_shared_with_strict_callers(self):
+        self.assertEqual(self.shared_call(('Contenu démo', True)), ('Contenu démo', ['meneur']))
+        self.assertEqual(self.shared_call(('Contenu démo', True), follower_fallback_allowed=False),
+                         ('Réponse réelle', ['meneur', 'suiveur']))
+
+    def test_fallback_not_shared_with_strict_threads(self):
+        started, release = threading.Event(), threading.Event()
+        results = {}
+
+        def leader_fn():
+            started.set()
+            release.wait()
+            return 'Contenu démo', True
+
+        def run(name, fallback_allowed):
+            results[name] = self.flight.do('cle', lambda: ('Réponse réelle', False), fallback_allowed)
+
+        leader = threading.Thread(target=lambda: results.update(meneur=self.flight.do('cle', leader_fn)))
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=run, args=(name, allowed))
+                     for name, allowed in (('tolerant', True), ('strict', False))]
+        for thread in followers:
+            thread.start()
+        # Laisse les suiveurs rejoindre l'appel en cours
+        time.sleep(0.1)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join()
+        self.assertEqual(results, {'meneur': 'Contenu démo', 'tolerant': 'Contenu démo', 'strict': 'Réponse réelle'})
+
+    def test_cross_process_lock(self):
+        flight = SingleFlight(self.cache, {'CROSS_PROCESS': True, 'POLL_INTERVAL': 0})
+        fn = mock.Mock(return_value=('Réponse locale', False))
+        InFlightCompletion.objects.create(key='cle', owner='autre', expires_at=time.time() + 60)
+
+        def other_process_finishes(seconds):
+            self.cache.set('cle', 'Réponse partagée')
+            InFlightCompletion.objects.filter(owner='autre').delete()
+
+        # Appel identique dans un autre processus : sa réponse est lue dans le cache
+        with mock.patch('games.single_flight.time.sleep', side_effect=other_process_finishes):
+            self.assertEqual(flight.do('cle', fn), 'Réponse partagée')
+        fn.assert_not_called()
+
+        # Verrou expiré (processus arrêté) : repris, puis libéré après l'appel
+        InFlightCompletion.objects.create(key='autre-cle', owner='autre', expires_at=time.time() - 1)
+        self.assertEqual(flight.do('autre-cle', fn), 'Réponse locale')
+        fn.assert_called_once()
+        self.assertFalse(InFlightCompletion.objects.exists())
+
+
+class StructuredOutputTest(TestCase):
+    """Validation des réponses JSON et lecture des chaînes d'un JSON incomplet"""
+
+    schema = {
+        'type': 'object',
+        'properties': {
+            'nom': {'type': 'string'},
+            'type_monde': {'type': 'string', 'enum': ['ouvert', 'semi_ouvert', 'lineaire']},
+            'age': {'type': 'integer'},
+            'lieux': {'type': 'array', 'items': {'type': 'string'}, 'minItems': 1, 'maxItems': 2},
+        },
+        'required': ['nom', 'type_monde'],
+    }
+
+    def test_validate_cleans_values(self):
+        data = {'nom': '  Azura ', 'type_monde': 'Semi-Ouvert', 'age': 'vieux', 'lieux': ['Port', 'Cité', 'Île'],
+                'inconnu': 1}
+        # Enum ramenée à sa valeur canonique, champ facultatif invalide et champ inconnu ignorés
+        self.assertEqual(validate(data, self.schema),
+                         {'nom': 'Azura', 'type_monde': 'semi_ouvert', 'lieux': ['Port', 'Cité']})
+
+    def test_validate_rejects_invalid_required_fields(self):
+        invalid = [
+            {'type_monde': 'ouvert'},
+            {'nom': ' ', 'type_monde': 'ouvert'},
+            {'nom': 'Azura', 'type_monde': 'souterrain'},
+            {'nom': 'Azura', 'type_monde': 3},
+        ]
+        for data in invalid:
+            with self.subTest(data=data), self.assertRaises(SchemaError):
+                validate(data, self.schema)
+        with self.assertRaisesMessage(SchemaError, '$.lieux : au moins 1 éléments attendus'):
+            validate({'lieux': []}, {'type': 'object', 'properties': self.schema['properties'], 'required': ['lieux']})
+        with self.assertRaisesMessage(SchemaError, 'integer attendu, bool reçu'):
+            validate(True, {'type': 'integer'})
+
+    def test_decode(self):
+        self.assertEqual(decode_json('```json\n{"nom": "Azura", "type_monde": "lineaire"}\n```', self.schema),
+                         {'nom': 'Azura', 'type_monde': 'lineaire'})
+        for text in ('', '{"nom": "Azura", "type_monde": "li', '["Azura"]'):
+            with self.subTest(text=text), self.assertRaises(SchemaError):
+                decode_json(text, self.schema)
+
+    def test_partial_strings_of_truncated_json(self):
+        text = '{"titre": "Azura", "personnages": [{"nom": "Lyra", "role": "pilote"}, {"nom": "Or'
+        self.assertEqual(partial_strings(text), [
+            (('titre',), 'Azura'),
+            (('personnages', 0, 'nom'), 'Lyra'),
+            (('personnages', 0, 'role'), 'pilote'),
+            (('personnages', 1, 'nom'), 'Or'),
+        ])
+        # Coupé au milieu d'une clé ou d'un échappement
+        self.assertEqual(partial_strings('{"univers": {"descr'), [])
+        self.assertEqual(partial_strings('{"description": "Ligne \\"citée\\" puis\\'),
+                         [(('description',), 'Ligne "citée" puis')])
+        self.assertEqual(partial_strings('{"nom": "Cit\\u00e9 d\\u00e'), [(('nom',), 'Cité d')])
+
+
+class JobStreamTest(TestCase):
+    """Le flux SSE n'est servi qu'en ASGI ; en WSGI le client passe à l'API de statut"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('suivi', password='motdepasse')
+        cls.job = GenerationJob.objects.create(user=cls.user, kind='custom', status='done', params={})
+        cls.url = reverse('games:job_stream', args=[cls.job.id])
+
+    def test_wsgi_asks_client_to_poll(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response.content.decode(), "event: poll\ndata: {}\n\n")
+
+    async def test_asgi_streams_events(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn('"status": "done"', content)
+        self.assertTrue(content.endswith("event: end\ndata: {}\n\n"))
+
+
+class PersistenceTest(TestCase):
+    """Un jeu est enregistré en entier ou pas du tout ; les fichiers suivent la transaction"""
+
+    params = {'genre': 'rpg', 'ambiance': 'epique', 'mots_cles': 'dragons'}
+
+    def setUp(self):
+        self.user = User.objects.create_user('createur', password='motdepasse')
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = Path(media_root.name)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def image(self, data=b'png'):
+        return {'description': 'Couverture', 'image_data': ContentFile(data), 'image_url': None}
+
+    def test_failure_mid_save_rolls_back_game(self):
+        content = game_content(locations=[{'nom': 'Port Céleste'}])
+        with self.assertRaises(KeyError):
+            save_generated_game(self.user, self.params, content)
+        self.assertFalse(Game.objects.exists())
+        self.assertFalse(Universe.objects.exists())
+        self.assertFalse(Character.objects.exists())
+
+    def test_failed_cover_removes_its_file(self):
+        stored = []
+
+        def failing_save(art, *args, **kwargs):
+            stored.append(art.image.name)
+            raise DatabaseError('database is locked')
+
+        with mock.patch.object(ConceptArt, 'save', failing_save), self.assertRaises(DatabaseError):
+            save_generated_game(self.user, self.params, game_content(image=self.image()))
+        self.assertFalse(Game.objects.exists())
+        self.assertEqual(len(stored), 1)
+        self.assertFalse(ConceptArt.image.field.storage.exists(stored[0]))
+
+    def test_old_cover_deleted_on_commit(self):
+        game = save_generated_game(self.user, self.params, game_content(image=self.image(b'ancienne')))
+        old = ConceptArt.objects.get(game=game).image
+        with self.captureOnCommitCallbacks() as callbacks:
+            replace_section(game, 'image', self.image(b'nouvelle'))
+        # Ancien fichier conservé tant que la transaction n'est pas validée
+        self.assertTrue(old.storage.exists(old.name))
+        new = ConceptArt.objects.get(game=game).image
+        self.assertNotEqual(new.name, old.name)
+        for callback in callbacks:
+            callback()
+        self.assertFalse(old.storage.exists(old.name))
+        self.assertTrue(new.storage.exists(new.name))
+
+    def test_failed_replacement_keeps_old_cover(self):
+        game = save_generated_game(self.user, self.params, game_content(image=self.image(b'ancienne')))
+        old = ConceptArt.objects.get(game=game)
+        with self.captureOnCommitCallbacks() as callbacks, \
+                mock.patch('games.persistence.ConceptArt.objects.filter', side_effect=DatabaseError('locked')), \
+                self.assertRaises(DatabaseError):
+            replace_section(game, 'image', self.image(b'nouvelle'))
+        self.assertEqual(callbacks, [])
+        self.assertEqual(list(ConceptArt.objects.filter(game=game)), [old])
+        # Nouveau fichier supprimé, ancien conservé
+        self.assertEqual([path.read_bytes() for path in self.media_root.rglob('*') if path.is_file()], [b'ancienne'])
+
+
+class StaleJobTest(TestCase):
+    """Seules les tâches sans signe de vie de leur worker sont remises en file"""
+
+    def test_requeue_judges_the_heartbeat(self):
+        user = User.objects.create_user('patient', password='motdepasse')
+        now = timezone.now()
+        long_ago = now - timedelta(hours=1)
+        alive = GenerationJob.objects.create(user=user, status='running', started_at=long_ago, heartbeat_at=now)
+        silent = GenerationJob.objects.create(user=user, status='running', started_at=long_ago,
+                                              heartbeat_at=long_ago, checkpoints={'title': 'Azura'})
+        never_beat = GenerationJob.objects.create(user=user, status='running', started_at=long_ago)
+
+        self.assertEqual(requeue_stale_jobs(stale_after=900), 2)
+        alive.refresh_from_db()
+        silent.refresh_from_db()
+        never_beat.refresh_from_db()
+        self.assertEqual(alive.status, 'running')
+        self.assertEqual((silent.status, silent.phases_done), ('pending', ['title']))
+        self.assertEqual(never_beat.status, 'pending')
+
+
+class ImageRegenerationTest(TestCase):
+    """Une régénération d'image sans fichier ne détruit pas la couverture existante"""
+
+    def test_failed_image_keeps_cover(self):
+        user = User.objects.create_user('createur', password='motdepasse')
+        game = Game.objects.create(titre='La Légende Illustrée', genre='rpg', ambiance='epique', createur=user)
+        Universe.objects.create(game=game, description='Un monde', style_graphique='realiste', type_monde='ouvert')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            cover = ConceptArt(game=game, type_art='cover', description='Couverture')
+            cover.image.save('cover.png', ContentFile(b'png'))
+            job = GenerationJob.objects.create(user=user, kind='regenerate', game=game,
+                                               params={'game_id': game.id, 'section': 'image'})
+            no_image = {'description': 'Description seule', 'image_data': None, 'image_url': None}
+            with mock.patch.object(AIService, 'generate_and_save_image', return_value=no_image):
+                run_job(job)
+
+            self.assertEqual(job.status, 'failed')
+            kept = ConceptArt.objects.get(game=game)
+            self.assertEqual(kept.id, cover.id)
+            self.assertTrue(kept.image.storage.exists(kept.image.name))
+
+
+class QuotaTest(TestCase):
+    """Réservation du quota quotidien : limite, remise à zéro, restitution et jeton d'idempotence"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('quota', password='motdepasse')
+        self.params = {'genre': 'rpg', 'ambiance': 'sombre', 'mots_cles': 'dragons'}
+
+    def used(self):
+        return GenerationLimit.objects.get(user=self.user).generations_today
+
+    def test_reserve_up_to_the_limit(self):
+        GenerationLimit.objects.create(user=self.user, daily_count=2)
+        self.assertIsNotNone(reserve_generation(self.user))
+        self.assertIsNotNone(reserve_generation(self.user))
+        self.assertIsNone(reserve_generation(self.user))
+        self.assertEqual(self.used(), 2)
+
+    def test_first_reservation_creates_the_limit(self):
+        self.assertEqual(reserve_generation(self.user), timezone.now().date())
+        self.assertEqual(self.used(), 1)
+
+    def test_previous_day_counter_is_reset(self):
+        yesterday = timezone.now().date() - timedelta(days=1)
+        GenerationLimit.objects.create(user=self.user, daily_count=1, generations_today=1)
+        # last_reset est rempli à la création (auto_now_add)
+        GenerationLimit.objects.filter(user=self.user).update(last_reset=yesterday)
+        self.assertIsNotNone(reserve_generation(self.user))
+        self.assertEqual(self.used(), 1)
+
+
+    def test_failed_job_gives_reservation_back_once(self):
+        GenerationLimit.objects.create(user=self.user, daily_count=1)
+        job = enqueue_generation(self.user, 'custom', self.params, reserve_quota=True)
+        self.assertEqual(self.used(), 1)
+        release_reservation(job)
+        release_reservation(job)
+        job.refresh_from_db()
+        self.assertEqual(job.quota_state, 'released')
+        self.assertEqual(self.used(), 0)
+
+    def test_idempotent_retry_is_not_charged_twice(self):
+        GenerationLimit.objects.create(user=self.user, daily_count=1)
+        job = enqueue_generation(self.user, 'custom', self.params, idempotency_key='jeton', reserve_quota=True)
+        # Limite atteinte, mais le renvoi du même jeton retrouve la tâche sans rien réserver
+        retry = enqueue_generation(self.user, 'custom', self.params, idempotency_key='jeton', reserve_quota=True)
+        self.assertEqual(retry.id, job.id)
+        self.assertEqual(self.used(), 1)
+        with self.assertRaises(QuotaExceeded):
+            enqueue_generation(self.user, 'custom', {**self.params, 'genre': 'horror'}, reserve_quota=True)
+
+
+class RegenerationLimitTest(TestCase):
+    """Les régénérations de section sont limitées par jour"""
+
+    def test_daily_regeneration_cap(self):
+        user = User.objects.create_user('createur', password='motdepasse')
+        GenerationLimit.objects.create(user=user, daily_regeneration_count=1)
+        game = Game.objects.create(titre='La Légende Revue', genre='rpg', ambiance='epique', createur=user)
+        self.client.force_login(user)
+
+        response = self.client.post(reverse('games:regenerate_section', args=[game.id, 'scenario']))
+        job = GenerationJob.objects.get(kind='regenerate')
+        self.assertRedirects(response, reverse('games:job_status', args=[job.id]), fetch_redirect_response=False)
+        self.assertEqual(job.quota_state, 'reserved')
+
+        response = self.client.post(reverse('games:regenerate_section', args=[game.id, 'locations']))
+        self.assertRedirects(response, reverse('games:game_detail', args=[game.id]), fetch_redirect_response=False)
+        self.assertEqual(GenerationJob.objects.filter(kind='regenerate').count(), 1)
+        # Les générations de jeux ne sont pas touchées
+        self.assertEqual(GenerationLimit.objects.get(user=user).generations_today, 0)
+
+
+class SlowCallTest(TestCase):
+    """Un appel long n'est lent qu'au regard des jetons demandés"""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker('test', {'MIN_CALLS': 1, 'SLOW_CALL': 30, 'SLOW_CALL_TOKENS': 1000})
+
+    def test_threshold_scales_with_max_tokens(self):
+        self.assertEqual(self.breaker.slow_threshold(), 30)
+        self.assertEqual(self.breaker.slow_threshold(500), 30)
+        self.assertEqual(self.breaker.slow_threshold(4000), 120)
+
+    def test_long_bundle_call_is_not_a_failure(self):
+        self.breaker.record('model', True, 90, max_tokens=4000)
+        self.assertFalse(self.breaker.is_open('model'))
+
+    def test_slow_call_is_a_failure(self):
+        self.breaker.record('model', True, 45, max_tokens=500)
+        self.assertTrue(self.breaker.is_open('model'))
+
+
+class LocalProviderTest(TestCase):
+    """Le fournisseur local répond aux étapes JSON dans la forme attendue"""
+
+    def setUp(self):
+        self.service = AIService()
+        self.local = LocalProvider()
+
+    def complete(self, prompt):
+        request = {'messages': [{'role': 'user', 'content': prompt}], 'response_format': {'type': 'json_object'}}
+        return self.local.complete('demo', request)[0]
+
+    def test_phases_match_schemas(self):
+        service = self.service
+        cases = [
+            (service._universe_prompt("Azura", 'rpg', 'sombre', 'magie'), UNIVERSE_SCHEMA),
+            (service._scenario_prompt("Azura", "Un monde", 'rpg'), SCENARIO_SCHEMA),
+            (service._characters_prompt("Azura", 'rpg', 2, 'sombre'), CHARACTERS_SCHEMA),
+            (service._locations_prompt("Azura", "Un monde", 5), LOCATIONS_SCHEMA),
+            (service._world_bundle_prompt('rpg', 'sombre', 'magie', 3, 4), WORLD_BUNDLE_SCHEMA),
+        ]
+        for prompt, schema in cases:
+            decode_json(self.complete(prompt), schema)
+        self.assertEqual(len(json.loads(self.complete(cases[2][0]))['personnages']), 2)
+        self.assertEqual(len(json.loads(self.complete(cases[3][0]))['lieux']), 5)
+
+    def test_same_prompt_same_content(self):
+        prompt = self.service._characters_prompt("Azura", 'rpg', 3)
+        self.assertEqual(self.complete(prompt), self.complete(prompt))
+
+    def test_text_content_by_phase(self):
+        # Contenu de secours des appels texte (mode démo, échec de l'API)
+        character = self.local.generate("Crée un personnage sombre pour Azura")
+        self.assertTrue(character.startswith('NOM: '))
+        self.assertIn("Hanté par un passé tragique", character)
+        self.assertIn('TYPE: donjon', self.local.generate("Décris un lieu mysterieux"))
+        self.assertIn("Un ancien secret", self.local.generate("Écris le scénario en trois actes"))
+        self.assertEqual(self.local.generate("Crée un personnage"), self.local.generate("Crée un personnage"))
+
+
+class TokenBudgetTest(TestCase):
+    """max_tokens déduit des longueurs observées (p99 × 1,25), borné autour de la valeur par défaut"""
+
+    def budget(self, lengths, phase='characters', **config):
+        budget = TokenBudget({'MIN_SAMPLES': 3, 'REFRESH': 60, **config})
+        for length in lengths:
+            budget.record(phase, length, 10000)
+        return budget
+
+    def test_default_until_enough_samples(self):
+        self.assertEqual(self.budget([100, 100]).max_tokens('characters', 200), 200)
+        self.assertEqual(self.budget([100], ENABLED=False).max_tokens('characters', 200), 200)
+
+    def test_p99_with_headroom_and_bounds(self):
+        budget = self.budget([100] * 3)
+        self.assertEqual(budget.max_tokens('characters', 200), 125)
+        self.assertEqual(budget.max_tokens('characters', 200, items=2), 250)
+        # Jamais sous la moitié ni au-delà du double de la valeur par défaut
+        self.assertEqual(self.budget([10] * 3, phase='locations').max_tokens('locations', 200), 100)
+        self.assertEqual(self.budget([1000] * 3, phase='scenario').max_tokens('scenario', 200), 400)
+
+    def test_truncated_response_refreshes_budget(self):
+        budget = self.budget([100] * 3)
+        self.assertEqual(budget.max_tokens('characters', 200), 125)
+        budget.record('characters', 100, 10000)
+        # Longueur en cache pendant REFRESH secondes...
+        self.assertEqual(budget.max_tokens('characters', 200), 125)
+        # ...sauf après une réponse coupée à max_tokens
+        self.assertTrue(budget.record('characters', 150, 125))
+        self.assertEqual(budget.max_tokens('characters', 200), 188)
+
+    def test_truncate_tokens(self):
+        text = ('Un monde flottant où les cités dérivent. '
+                'Des peuples libres y survivent entre les tempêtes et les ruines anciennes')
+        self.assertEqual(truncate_tokens(text, 100), text)
+        # Coupé en fin de phrase quand elle est assez proche, sinon en fin de mot
+        self.assertEqual(truncate_tokens(text, 14), 'Un monde flottant où les cités dérivent.')
+        self.assertEqual(truncate_tokens(text, 8), 'Un monde flottant où les cités…')
+        self.assertEqual(truncate_tokens(None, 8), '')
+
+
+class TokenLimitViewTest(TestCase):
+    """Les vues asynchrones de création respectent la limite quotidienne en jetons"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('joueur', password='motdepasse')
+        GenerationLimit.objects.create(user=cls.user, daily_token_limit=1000)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_under_token_limit(self):
+        APICall.objects.create(user=self.user, phase='title', model='demo', prompt_tokens=100, completion_tokens=50)
+        response = self.client.get(reverse('games:create_game'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['remaining_generations'], 5)
+
+    def test_token_limit_reached(self):
+        APICall.objects.create(user=self.user, phase='title', model='demo', prompt_tokens=800, completion_tokens=300)
+        self.assertRedirects(self.client.get(reverse('games:create_game')), reverse('games:dashboard'))
+        self.assertRedirects(self.client.get(reverse('games:create_random_game')), reverse('games:dashboard'))
+
+    def test_token_limit_refuses_reservation(self):
+        APICall.objects.create(user=self.user, phase='title', model='demo', prompt_tokens=800, completion_tokens=300)
+        self.assertIsNone(reserve_generation(self.user))
+
+
+class HedgerTest(TestCase):
+    """Requête doublée quand l'appel tarde, délai compté depuis son début effectif"""
+
+    def hedger(self, **config):
+        hedger = Hedger({'ENABLED': True, 'MIN_SAMPLES': 1, 'MIN_DELAY': 0.2, **config})
+        self.addCleanup(hedger._executor.shutdown)
+        hedger.latencies.add('modele', 0.05)
+        hedger.latencies.add('modele:ttft', 0.05)
+        return hedger
+
+    @override_settings(MISTRAL_RATE_LIMIT={'MAX_IN_FLIGHT': 3})
+    def test_pool_sized_from_rate_limit(self):
+        self.assertEqual(Hedger({})._executor._max_workers, 6)
+        self.assertEqual(Hedger({'MAX_WORKERS': 2})._executor._max_workers, 2)
+
+    def test_slow_call_is_duplicated(self):
+        # Appels lents bloqués jusqu'à la fin du test : deux threads par requête doublée
+        hedger = self.hedger(MAX_WORKERS=4)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        calls, on_duplicate = [], mock.Mock()
+
+        def complete():
+            calls.append(len(calls))
+            if len(calls) == 1:
+                release.wait()
+                return 'lente'
+            return 'doublée'
+
+        self.assertEqual(hedger.run('modele', complete, on_duplicate), 'doublée')
+        on_duplicate.assert_called_once()
+
+        calls.clear()
+        forwarded = []
+
+        def stream(forward):
+            complete_text = complete()
+            forward(complete_text)
+            return complete_text
+
+        result, _ = hedger.run_stream('modele', stream, forwarded.append)
+        self.assertEqual((result, forwarded), ('doublée', ['doublée']))
+
+    def test_queue_time_does_not_trigger_duplicate(self):
+        hedger = self.hedger(MAX_WORKERS=1)
+        on_duplicate = mock.Mock()
+        for run in (lambda: hedger.run('modele', lambda: 'ok', on_duplicate),
+                    lambda: hedger.run_stream('modele', lambda forward: forward('ok') or 'ok', lambda text: None,
+                                              on_duplicate)):
+            # Seul thread du pool occupé plus longtemps que le délai de doublement
+            hedger._executor.submit(time.sleep, 0.4)
+            run()
+        on_duplicate.assert_not_called()
+
+
+class HedgedCallUsageTest(TestCase):
+    """La requête doublée est facturée : enregistrée à part et comptée dans le quota en jetons"""
+
+    def test_duplicate_request_is_recorded(self):
+        service = AIService()
+        user = User.objects.create_user('hedge', password='secret')
+
+        def hedged(key, fn, on_duplicate=None):
+            on_duplicate()
+            return fn()
+
+        with mock.patch.object(service, '_send_completion', return_value=("Azura", None)), \
+                mock.patch.object(service.hedger, 'run', side_effect=hedged), \
+                mock.patch.object(service.circuit_breaker, 'allow', return_value=True), \
+                attribute_calls(user_id=user.id):
+            service._request_completion(Route.parse('mistral:mistral-small-latest'), "Titre ?", 50)
+
+        winner = APICall.objects.get(user=user, hedge=False)
+        duplicate = APICall.objects.get(user=user, hedge=True)
+        self.assertEqual(duplicate.total_tokens, winner.total_tokens)
+        limit = GenerationLimit.objects.create(user=user)
+        self.assertEqual(limit.tokens_used_today(), 2 * winner.total_tokens)
+
+
+class HomeVaryTest(TestCase):
+    """L'accueil répond en HTML ou en JSON selon Accept : la réponse varie sur cet en-tête"""
+
+    def test_vary_accept(self):
+        for accept in ('text/html', 'application/json'):
+            response = self.client.get(reverse('games:home'), HTTP_ACCEPT=accept)
+            self.assertIn('Accept', response['Vary'])
+
+
+class FeedTest(TestCase):
+    """Fil paginé par curseur : pages continues et curseur invalide"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('auteur', password='motdepasse')
+        now = timezone.now()
+        # Deux jeux à la même date : départagés par l'id
+        for index, created in enumerate([now, now, now - timedelta(hours=1), now - timedelta(hours=2), now]):
+            Game.objects.create(titre=f'Jeu {index}', genre='rpg', ambiance='epique', createur=user,
+                                date_creation=created)
+        Game.objects.create(titre='Jeu privé', genre='rpg', ambiance='epique', createur=user, est_public=False)
+        cls.expected = list(Game.objects.filter(est_public=True).order_by('-date_creation', '-id')
+                            .values_list('id', flat=True))
+
+    def test_pages_are_continuous(self):
+        page = feed_page(size=2)
+        seen = [game.id for game in page['games']]
+        while page['next_cursor']:
+            page = feed_page(cursor=page['next_cursor'], size=2)
+            seen += [game.id for game in page['games']]
+        self.assertEqual(seen, self.expected)
+
+    def test_invalid_cursor_returns_first_page(self):
+        first = [game.id for game in feed_page(size=2)['games']]
+        for cursor in ('pas-un-curseur!', encode_cursor(['hier', 'x']), encode_cursor([1]), encode_cursor({'a': 1})):
+            self.assertEqual([game.id for game in feed_page(cursor=cursor, size=2)['games']], first)
+
+
+class SearchTest(TestCase):
+    """Recherche plein texte : correspondance, classement, jeux privés et mise à jour de l'index"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('chercheur', password='motdepasse')
+
+    def make_game(self, titre, **fields):
+        # L'index est mis à jour à la validation de la transaction
+        with self.captureOnCommitCallbacks(execute=True):
+            return Game.objects.create(titre=titre, genre='rpg', ambiance='epique', createur=self.user, **fields)
+
+    def titles(self, query, cursor=None, size=24):
+        return [game.titre for game in feed_page(query, cursor, size)['games']]
+
+    def test_accent_insensitive_prefix_match(self):
+        self.make_game('La Légende des Héros')
+        self.make_game('Station Orbitale')
+        self.assertEqual(self.titles('heros'), ['La Légende des Héros'])
+        self.assertEqual(self.titles('lége her'), ['La Légende des Héros'])
+        self.assertEqual(self.titles('introuvable'), [])
+
+    def test_title_ranks_before_keywords(self):
+        self.make_game('Les Terres Lointaines', mots_cles='dragon, magie')
+        self.make_game('Le Dragon de Cendre')
+        self.assertEqual(self.titles('dragon'), ['Le Dragon de Cendre', 'Les Terres Lointaines'])
+
+    def test_private_games_are_excluded(self):
+        self.make_game('Dragon Secret', est_public=False)
+        self.assertEqual(self.titles('dragon'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        game = self.make_game('Les Brumes')
+        with self.captureOnCommitCallbacks(execute=True):
+            Character.objects.create(game=game, nom='Zéphyrin', role='heros', background='Un exilé.')
+        self.assertEqual(self.titles('zephyrin'), ['Les Brumes'])
+
+        game.titre = 'Les Cendres'
+        with self.captureOnCommitCallbacks(execute=True):
+            game.save()
+        self.assertEqual(self.titles('brumes'), [])
+        self.assertEqual(self.titles('cendres'), ['Les Cendres'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            game.delete()
+        self.assertEqual(self.titles('cendres'), [])
+
+    def test_search_cursor_walks_every_result_once(self):
+        for index in range(5):
+            self.make_game(f'Dragon {index}')
+        page = feed_page('dragon', size=2)
+        seen = [game.id for game in page['games']]
+        while page['next_cursor']:
+            page = feed_page('dragon', page['next_cursor'], size=2)
+            seen += [game.id for game in page['games']]
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+
+class GameDetailQueriesTest(TestCase):
+    """La page de détail charge tout le jeu d'avance : nombre de requêtes fixe"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('createur', password='motdepasse')
+        cls.game = Game.objects.create(titre='La Légende du Test', genre='rpg', ambiance='epique', createur=cls.user)
+        Universe.objects.create(game=cls.game, description='Un monde de test', style_graphique='realiste', type_monde='ouvert')
+        Scenario.objects.create(game=cls.game, acte_1='Début', acte_2='Milieu', acte_3='Fin', twist='Surprise')
+        for i in range(3):
+            Character.objects.create(game=cls.game, nom=f'Héros {i}', background='Un passé', gameplay_description='Combat')
+            Location.objects.create(game=cls.game, nom=f'Lieu {i}', description='Un endroit')
+        ConceptArt.objects.create(game=cls.game, type_art='cover', description='Couverture')
+        Favorite.objects.create(user=cls.user, game=cls.game)
+        cls.url = reverse('games:game_detail', args=[cls.game.id])
+
+    def setUp(self):
+        # Fragments rendus par un autre test : ils fausseraient le nombre de requêtes
+        cache.clear()
+
+    def test_anonymous_query_count(self):
+        # Jeu (créateur, univers, scénario), personnages, lieux, visuels
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Héros 2')
+        self.assertContains(response, 'Cover Art')
+        self.assertFalse(response.context['is_favorited'])
+
+    def test_authenticated_query_count(self):
+        self.client.force_login(self.user)
+        # Session et utilisateur, puis les mêmes requêtes (favori compris dans celle du jeu)
+        with self.assertNumQueries(6):
+            response = self.client.get(self.url)
+        self.assertTrue(response.context['is_favorited'])
+        self.assertContains(response, '★')
+
+    def test_query_count_does_not_grow_with_content(self):
+        for i in range(3, 10):
+            Character.objects.create(game=self.game, nom=f'Héros {i}', background='Un passé')
+            Location.objects.create(game=self.game, nom=f'Lieu {i}', description='Un endroit')
+            ConceptArt.objects.create(game=self.game, type_art='concept', description=f'Visuel {i}')
+        with self.assertNumQueries(4):
+            self.client.get(self.url)
+
+
+class GameFragmentCacheTest(TestCase):
+    """En-tête, corps et cartes des jeux en cache, invalidés par la version du jeu"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('createur', password='motdepasse')
+        cls.game = Game.objects.create(titre='La Légende du Cache', genre='rpg', ambiance='epique', createur=cls.user)
+        Character.objects.create(game=cls.game, nom='Héros', background='Un passé')
+        cls.url = reverse('games:game_detail', args=[cls.game.id])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_detail_is_a_single_query(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Héros')
+
+    def test_content_change_invalidates_fragments(self):
+        self.client.get(self.url)
+        Character.objects.create(game=self.game, nom='Nouvelle Recrue', background='Arrivée tardive')
+        self.assertContains(self.client.get(self.url), 'Nouvelle Recrue')
+        Character.objects.filter(nom='Nouvelle Recrue').delete()
+        self.assertNotContains(self.client.get(self.url), 'Nouvelle Recrue')
+
+        game = Game.objects.get(id=self.game.id)
+        game.titre = 'La Légende Renommée'
+        game.save()
+        self.assertContains(self.client.get(reverse('games:home')), 'La Légende Renommée')
+        self.assertContains(self.client.get(self.url), 'La Légende Renommée')
+
+    def test_favorite_is_rendered_outside_fragments(self):
+        other = User.objects.create_user('visiteur', password='motdepasse')
+        self.client.force_login(other)
+        self.assertContains(self.client.get(self.url), '☆ 0')
+        version = Game.objects.get(id=self.game.id).version
+
+        self.client.get(reverse('games:toggle_favorite', args=[self.game.id]))
+        response = self.client.get(self.url)
+        self.assertContains(response, '★ 1')
+        # Un like ne change pas le contenu du jeu : ses fragments restent valides
+        self.assertEqual(Game.objects.get(id=self.game.id).version, version)
+        self.assertContains(self.client.get(reverse('games:favorites')), 'La Légende du Cache')
+
+
+class PoolClaimTest(TestCase):
+    """Un jeu de la réserve attribué change de version : ses fragments en cache ne sont plus lus"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_claim_bumps_version(self):
+        player = User.objects.create_user('joueuse', password='motdepasse')
+        game = Game.objects.create(titre='Jeu en Réserve', genre='rpg', ambiance='epique', createur=pool_user(),
+                                   est_public=False)
+        stale_card = game_fragments(['card'], [game])[('card', game.id)]
+
+        claimed = claim_pool_game(player)
+        self.assertEqual(claimed.id, game.id)
+        self.assertEqual(claimed.version, game.version + 1)
+        card = game_fragments(['card'], [Game.objects.select_related('createur').get(id=game.id)])[('card', game.id)]
+        self.assertNotEqual(card, stale_card)
+        self.assertIn('joueuse', card)
+
+
+class GameHttpCacheTest(TestCase):
+    """Requêtes conditionnelles sur les pages publiques et cache long des visuels"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('createur', password='motdepasse')
+        cls.game = Game.objects.create(titre='La Légende du Proxy', genre='rpg', ambiance='epique', createur=cls.user)
+        cls.url = reverse('games:game_detail', args=[cls.game.id])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_public_page_validators(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertIn('public', response['Cache-Control'])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_update_validators(self):
+        etag = self.client.get(self.url)['ETag']
+        Character.objects.create(game=self.game, nom='Héros', background='Un passé')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Héros')
+
+        etag = response['ETag']
+        visitor = User.objects.create_user('visiteur', password='motdepasse')
+        self.client.force_login(visitor)
+        self.client.get(reverse('games:toggle_favorite', args=[self.game.id]))
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_personal_page_is_private(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_generated_media_is_immutable(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            art = ConceptArt(game=self.game, type_art='cover', description='Couverture')
+            art.image.save('cover.png', ContentFile(b'png'), save=False)
+            response = serve_media(RequestFactory().get(art.image.url), art.image.name)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('immutable', response['Cache-Control'])
+            response.close()
+            # Hors DEBUG, les médias sont servis par le serveur frontal
+            self.assertEqual(self.client.get(art.image.url).status_code, 404)
@@ -15,6 +15,16 @@ urlpatterns = [
     path('game/create/', views.create_game, name='create_game'),
     path('game/random/', views.create_random_game, name='create_random_game'),
     path('game/<int:game_id>/delete/', views.delete_game, name='delete_game'),
+    path('game/<int:game_id>/regenerate/<str:section>/', views.regenerate_section, name='regenerate_section'),
+    
+    # Suivi des générations en file d'attente
+    path('generation/<int:job_id>/', views.job_status, name='job_status'),
+    path('generation/<int:job_id>/status/', views.job_status_api, name='job_status_api'),
+    path('generation/<int:job_id>/stream/', views.job_stream, name='job_stream'),
+    path('generation/<int:job_id>/resume/', views.resume_job, name='resume_job'),
+    
+    # Mesures des fournisseurs de texte (équipe)
+    path('staff/providers/', views.provider_stats, name='provider_stats'),
     
     # Favoris
     path('game/<int:game_id>/favorite/', views.toggle_favorite, name='toggle_favorite'),
@@ -0,0 +1,107 @@
+"""
+Comptage des appels et des jetons consommés auprès de l'API
+record_usage() ouvre une période de mesure pour le contexte courant
+(requête, tâche, benchmark) ; chaque réponse de l'API y ajoute son usage.
+Le contexte est propagé aux tâches asyncio et, explicitement, aux threads
+lancés par l'orchestrateur (contextvars.copy_context).
+Chaque appel est aussi enregistré en base (APICall), rattaché à l'utilisateur,
+à la tâche et au jeu déclarés par attribute_calls() : coût par génération,
+totaux quotidiens et quota en jetons (GenerationLimit.daily_token_limit).
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from asgiref.sync import sync_to_async
+
+from .models import APICall
+
+
+class UsageRecorder:
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage):
+        with self._lock:
+            self.calls += 1
+            if usage is not None:
+                self.prompt_tokens += getattr(usage, 'prompt_tokens', 0) or 0
+                self.completion_tokens += getattr(usage, 'completion_tokens', 0) or 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            'calls': self.calls,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens,
+        }
+
+
+_current_recorder: ContextVar[Optional[UsageRecorder]] = ContextVar('gameforge_usage_recorder', default=None)
+
+
+@contextmanager
+def record_usage():
+    """Mesure les appels à l'API effectués dans le bloc"""
+    recorder = UsageRecorder()
+    token = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(token)
+
+
+def add_usage(usage):
+    """Ajoute l'usage d'une réponse de l'API à la mesure en cours, s'il y en a une"""
+    recorder = _current_recorder.get()
+    if recorder is not None:
+        recorder.add(usage)
+
+
+# Utilisateur, tâche et jeu auxquels sont rattachés les appels en cours
+_call_owner: ContextVar[Dict[str, Optional[int]]] = ContextVar('gameforge_call_owner', default={})
+
+
+@contextmanager
+def attribute_calls(user_id: Optional[int] = None, job_id: Optional[int] = None, game_id: Optional[int] = None):
+    """Rattache les appels à l'API effectués dans le bloc à un utilisateur, une tâche et un jeu"""
+    token = _call_owner.set({'user_id': user_id, 'job_id': job_id, 'game_id': game_id})
+    try:
+        yield
+    finally:
+        _call_owner.reset(token)
+
+
+def log_api_call(model: str, phase: Optional[str], prompt_tokens: int, completion_tokens: int,
+                 duration: float, attempts: int, success: bool, hedge: bool = False):
+    """Enregistre un appel de complétion dans APICall (hedge : requête doublée, voir hedging.py)"""
+    try:
+        APICall.objects.create(
+            model=model,
+            phase=phase or '',
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            duration=round(duration, 3),
+            attempts=attempts,
+            success=success,
+            hedge=hedge,
+            **_call_owner.get(),
+        )
+    except Exception as e:
+        # La mesure ne doit jamais faire échouer la génération
+        print(f"⚠️ Appel API non enregistré : {e}")
+
+
+async def log_api_call_async(model: str, phase: Optional[str], prompt_tokens: int, completion_tokens: int,
+                             duration: float, attempts: int, success: bool, hedge: bool = False):
+    await sync_to_async(log_api_call)(model, phase, prompt_tokens, completion_tokens, duration, attempts, success,
+                                      hedge)
@@ -1,33 +1,75 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Q
-from .models import Game, Universe, Scenario, Character, Location, ConceptArt, Favorite, GenerationLimit
+from django.db.models import Exists, F, OuterRef, Prefetch, Value, prefetch_related_objects
+from .models import Game, ConceptArt, Favorite, GenerationLimit, GenerationJob
 from .forms import GameCreationForm
-from .ai_service import AIService
+from .jobs import (
+    enqueue_generation, enqueue_generation_async, find_idempotent_job_async, resume_generation,
+)
+from .ai_service import REGENERABLE_SECTIONS, get_ai_service
+from .feed import feed_page
+from .fragments import game_fragments
+from .http_cache import not_modified_response, patch_game_response
+from .pool import claim_pool_game
+from .quota import QuotaExceeded
 from django.contrib.auth import update_session_auth_hash
 from .models import Profile
-from django.http import HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from asgiref.sync import sync_to_async
 import tempfile, os
+import asyncio, json
 
 def home(request):
-    """Page d'accueil avec tous les jeux publics"""
-    games = Game.objects.filter(est_public=True)
-    
-    # Recherche
+    """Page d'accueil : fil des jeux publics, page par page (JSON pour le défilement infini)"""
     query = request.GET.get('q')
-    if query:
-        games = games.filter(
-            Q(titre__icontains=query) | 
-            Q(genre__icontains=query) |
-            Q(mots_cles__icontains=query)
-        )
+    page = feed_page(query, request.GET.get('cursor'))
+    _attach_cards(page['games'])
     
-    return render(request, 'games/home.html', {'games': games, 'query': query})
+    if 'application/json' in request.headers.get('Accept', ''):
+        response = JsonResponse({
+            'games': [_game_card(game) for game in page['games']],
+            'html': render_to_string('games/_game_cards.html', {'games': page['games']}, request=request),
+            'next_cursor': page['next_cursor'],
+        })
+    else:
+        response = render(request, 'games/home.html', {
+            'games': page['games'],
+            'next_cursor': page['next_cursor'],
+            'query': query,
+        })
+    # Même URL, JSON ou HTML : un cache ne doit pas servir l'un à la place de l'autre
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def _attach_cards(games):
+    """Carte HTML de chaque jeu (game.card), lue dans le cache des fragments"""
+    cards = game_fragments(['card'], games)
+    for game in games:
+        game.card = cards[('card', game.id)]
+
+
+def _game_card(game):
+    """Champs d'une carte de jeu du fil"""
+    return {
+        'id': game.id,
+        'titre': game.titre,
+        'genre': game.get_genre_display(),
+        'ambiance': game.get_ambiance_display(),
+        'createur': game.createur.username,
+        'date_creation': game.date_creation.isoformat(),
+        'likes_count': game.likes_count,
+        'url': reverse('games:game_detail', args=[game.id]),
+    }
 
 
 def register(request):
@@ -74,140 +116,241 @@ def user_logout(request):
 def dashboard(request):
     """Tableau de bord personnel"""
     my_games = Game.objects.filter(createur=request.user)
-    return render(request, 'games/dashboard.html', {'my_games': my_games})
+    active_jobs = GenerationJob.objects.filter(user=request.user, status__in=['pending', 'running'])
+    return render(request, 'games/dashboard.html', {'my_games': my_games, 'active_jobs': active_jobs})
+
+def _game_detail_queryset(user):
+    """
+    Jeu de la page de détail : jeu, créateur, univers, scénario et favori en
+    une requête. Personnages, lieux et visuels ne sont chargés que si les
+    fragments du jeu ne sont pas en cache (voir _load_game_detail).
+    """
+    if user.is_authenticated:
+        is_favorited = Exists(Favorite.objects.filter(user=user, game=OuterRef('pk')))
+    else:
+        is_favorited = Value(False)
+    return Game.objects.select_related('createur', 'universe', 'scenario').annotate(is_favorited=is_favorited)
+
+
+def _load_game_detail(games):
+    """Personnages, lieux et visuels des jeux à rendre (une requête chacun)"""
+    prefetch_related_objects(
+        games,
+        'characters',
+        'locations',
+        # Visuels du plus récent au plus ancien : le premier sert de couverture
+        Prefetch('concept_arts', queryset=ConceptArt.objects.order_by('-date_creation'), to_attr='arts'),
+    )
+
 
 def game_detail(request, game_id):
     """Détails d'un jeu"""
-    game = get_object_or_404(Game, id=game_id)
+    game = get_object_or_404(_game_detail_queryset(request.user), id=game_id)
     
     # Vérifier si l'utilisateur a accès
     if not game.est_public and game.createur != request.user:
         messages.error(request, 'Ce jeu est privé.')
         return redirect('games:home')
     
-    # Vérifier si l'utilisateur a liké ce jeu
-    is_favorited = False
-    if request.user.is_authenticated:
-        is_favorited = Favorite.objects.filter(user=request.user, game=game).exists()
+    # Page publique déjà à jour chez le visiteur : 304 sans rendu
+    not_modified = not_modified_response(request, game)
+    if not_modified is not None:
+        return not_modified
     
+    # En-tête et corps en cache ; favori, likes et actions du créateur rendus à chaque visite
+    fragments = game_fragments(['detail_header', 'detail_body'], [game], prepare=_load_game_detail)
     context = {
         'game': game,
-        'is_favorited': is_favorited,
+        'header': fragments[('detail_header', game.id)],
+        'body': fragments[('detail_body', game.id)],
+        'is_favorited': game.is_favorited,
+        'regenerable_sections': REGENERABLE_SECTIONS,
     }
-    return render(request, 'games/game_detail.html', context)
+    return patch_game_response(request, render(request, 'games/game_detail.html', context), game)
+
+def _generation_started(request, job):
+    """Réponse à un formulaire de création accepté : suivi de la tâche (JSON pour un envoi fetch)"""
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({
+            'job_id': job.id,
+            'job_url': reverse('games:job_status', args=[job.id]),
+            'stream_url': reverse('games:job_stream', args=[job.id]),
+            'status_url': reverse('games:job_status_api', args=[job.id]),
+        })
+    return redirect('games:job_status', job_id=job.id)
+
 
 @login_required
-def create_game(request):
-    """Créer un nouveau jeu avec l'IA"""
-    # Vérifier les limites
-    limit, created = GenerationLimit.objects.get_or_create(user=request.user)
+async def create_game(request):
+    """Créer un nouveau jeu avec l'IA (vue asynchrone, la génération est mise en file d'attente)"""
+    user = await request.auser()
+    
+    # Formulaire déjà envoyé (double clic, renvoi du navigateur) : même génération, sans nouveau quota
+    if request.method == 'POST':
+        job = await find_idempotent_job_async(user, request.POST.get('idempotency_key', ''))
+        if job:
+            return _generation_started(request, job)
     
-    if not limit.can_generate():
+    # Vérifier les limites (lecture seule : la génération est réservée à l'envoi)
+    limit, created = await GenerationLimit.objects.aget_or_create(user=user)
+    remaining = await limit.aremaining()
+    
+    if remaining <= 0:
         messages.error(request, f'Vous avez atteint la limite de {limit.daily_count} générations par jour. Réessayez demain!')  #  Changé max_daily en daily_count
         return redirect('games:dashboard')
     
     if request.method == 'POST':
         form = GameCreationForm(request.POST)
+        # Envoi depuis la page (fetch) : la progression est affichée sur place
+        wants_json = 'application/json' in request.headers.get('Accept', '')
         if form.is_valid():
-            # Récupérer les données du formulaire
-            genre = form.cleaned_data['genre']
-            ambiance = form.cleaned_data['ambiance']
-            mots_cles = form.cleaned_data['mots_cles']
-            references = form.cleaned_data.get('references', '')
-            est_public = form.cleaned_data['est_public']
-            
-            # Initialiser le service IA
-            ai_service = AIService()
-            
             try:
-                # Générer le titre
-                keywords_list = [k.strip() for k in mots_cles.split(',') if k.strip()]
-                titre = ai_service.generate_game_title(genre, ambiance, keywords_list)
-                
-                # Créer le jeu
-                game = Game.objects.create(
-                    titre=titre,
-                    genre=genre,
-                    ambiance=ambiance,
-                    mots_cles=mots_cles,
-                    references=references,
-                    createur=request.user,
-                    est_public=est_public
-                )
-
-                # Générer l'univers
-                universe_data = ai_service.generate_universe(titre, genre, ambiance, mots_cles)
-                Universe.objects.create(
-                    game=game,
-                    description=universe_data['description'],
-                    style_graphique=universe_data['style_graphique'],
-                    type_monde=universe_data['type_monde']
-                )
-            
-                
-                # Générer le scénario
-                scenario_data = ai_service.generate_scenario(titre, universe_data['description'], genre)
-                Scenario.objects.create(
-                    game=game,
-                    acte_1=scenario_data['acte_1'],
-                    acte_2=scenario_data['acte_2'],
-                    acte_3=scenario_data['acte_3'],
-                    twist=scenario_data['twist']
-                )
-                
-                # Générer les personnages
-                characters_data = ai_service.generate_characters(titre, genre, 3, ambiance, mots_cles, universe_data['description'])
-                for char_data in characters_data:
-                    Character.objects.create(
-                        game=game,
-                        nom=char_data['nom'],
-                        classe=char_data.get('classe', 'guerrier'),
-                        role=char_data.get('role', 'allie'),
-                        background=char_data['background'],
-                        gameplay_description=char_data.get('gameplay_description', '')
-                    )
-                
-                # Générer les lieux
-                locations_data = ai_service.generate_locations(titre, universe_data['description'], 4, genre, ambiance, mots_cles)
-                for loc_data in locations_data:
-                    Location.objects.create(
-                        game=game,
-                        nom=loc_data['nom'],
-                        description=loc_data['description']
-                    )
-                image_result = ai_service.generate_and_save_image(
-                    titre, genre, ambiance, universe_data['description']
-                )
-
-                concept_art = ConceptArt.objects.create(
-                    game=game,
-                    description=image_result['description'],
-                    type_art="cover"
-                )
-
-                # Sauvegarder l'image si elle a été générée
-                if image_result.get('image_data'):
-                    concept_art.image.save(f"{game.id}_cover.png", image_result['image_data'], save=True)
-                    messages.success(request, f'Jeu "{titre}" créé avec image générée!')
-                else:
-                    messages.success(request, f'Jeu "{titre}" créé (image en mode démo)!')
-                # Incrémenter le compteur
-                limit.increment()
-                
-                messages.success(request, f'Jeu "{titre}" créé avec succès!')
-                return redirect('games:game_detail', game_id=game.id)
-                
-            except Exception as e:
-                messages.error(request, f'Erreur lors de la génération: {str(e)}')
-                return redirect('games:create_game')
+                job = await enqueue_generation_async(user, 'custom', {
+                    'genre': form.cleaned_data['genre'],
+                    'ambiance': form.cleaned_data['ambiance'],
+                    'mots_cles': form.cleaned_data['mots_cles'],
+                    'references': form.cleaned_data.get('references', ''),
+                    'est_public': form.cleaned_data['est_public'],
+                    'mode': form.cleaned_data['mode'],
+                }, idempotency_key=form.cleaned_data['idempotency_key'], reserve_quota=True)
+            except QuotaExceeded:
+                # Limite atteinte entre l'affichage et l'envoi (autre onglet, envois simultanés)
+                if wants_json:
+                    return JsonResponse({'error': f'Limite de {limit.daily_count} générations par jour atteinte'}, status=429)
+                messages.error(request, f'Vous avez atteint la limite de {limit.daily_count} générations par jour. Réessayez demain!')  #  Changé max_daily en daily_count
+                return redirect('games:dashboard')
+            if not wants_json:
+                messages.info(request, 'Génération lancée ! Suivez sa progression ci-dessous.')
+            return _generation_started(request, job)
+        if wants_json:
+            return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
     else:
         form = GameCreationForm()
     
     context = {
         'form': form,
-        'remaining_generations': limit.daily_count - limit.generations_today
+        'remaining_generations': remaining,
+        'generation_phases': [
+            {'key': key, 'label': label, 'state': 'pending', 'partial': ''}
+            for key, label in GenerationJob.PHASE_CHOICES
+        ],
+    }
+    # Le rendu accède à request.user (chargé depuis la base) : hors de la boucle asyncio
+    return await sync_to_async(render)(request, 'games/create_game.html', context)
+
+
+@login_required
+def job_status(request, job_id):
+    """Page de suivi d'une génération en file d'attente"""
+    job = get_object_or_404(GenerationJob, id=job_id, user=request.user)
+    
+    if job.status == 'done' and job.game_id:
+        return redirect('games:game_detail', game_id=job.game_id)
+    
+    return render(request, 'games/job_status.html', {
+        'job': job,
+        'resume_url': reverse('games:resume_job', args=[job.id]) if job.is_resumable else '',
+    })
+
+
+def _job_payload(job):
+    """État d'une génération (étapes, texte partiel) pour l'API et le flux SSE"""
+    data = {
+        'id': job.id,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'phase': job.phase,
+        'phases': job.phases_status(),
+        'progress': job.progress,
+        'error': job.error,
+        'game_url': None,
     }
-    return render(request, 'games/create_game.html', context)
+    if job.status == 'done' and job.game_id:
+        data['game_url'] = reverse('games:game_detail', args=[job.game_id])
+    data['resume_url'] = reverse('games:resume_job', args=[job.id]) if job.is_resumable else None
+    return data
+
+
+@login_required
+def job_status_api(request, job_id):
+    """État d'une génération au format JSON (utilisé par la page de suivi)"""
+    job = get_object_or_404(GenerationJob, id=job_id, user=request.user)
+    return JsonResponse(_job_payload(job))
+
+
+@login_required
+def resume_job(request, job_id):
+    """Relance une génération échouée à partir de ses étapes déjà réussies"""
+    job = get_object_or_404(GenerationJob, id=job_id, user=request.user)
+    
+    if request.method == 'POST' and job.is_resumable:
+        try:
+            if resume_generation(job):
+                messages.info(request, 'Génération relancée : les étapes déjà terminées sont conservées.')
+        except QuotaExceeded:
+            limit, created = GenerationLimit.objects.get_or_create(user=request.user)
+            messages.error(request, f'Vous avez atteint la limite de {limit.daily_count} générations par jour. Réessayez demain!')
+    
+    return redirect('games:job_status', job_id=job.id)
+
+
+# Intervalle de lecture de la tâche et battement de cœur du flux SSE (secondes)
+JOB_STREAM_POLL_INTERVAL = 0.25
+JOB_STREAM_HEARTBEAT = 15
+
+
+@login_required
+async def job_stream(request, job_id):
+    """
+    Progression d'une génération en Server-Sent Events : un événement à chaque
+    changement (étapes, texte reçu en streaming), puis 'end' une fois terminée.
+    Servi en WSGI, le flux serait mis en tampon et occuperait un worker jusqu'à
+    la fin : un seul événement 'poll' demande alors au client d'interroger l'API
+    de statut
+    """
+    user = await request.auser()
+    job = await aget_object_or_404(GenerationJob, id=job_id, user=user)
+    
+    if not isinstance(request, ASGIRequest):
+        response = HttpResponse("event: poll\ndata: {}\n\n", content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+    
+    async def events():
+        last_payload = None
+        idle = 0.0
+        while True:
+            await job.arefresh_from_db()
+            payload = _job_payload(job)
+            if payload != last_payload:
+                yield f"data: {json.dumps(payload)}\n\n"
+                last_payload = payload
+                idle = 0.0
+            elif idle >= JOB_STREAM_HEARTBEAT:
+                # Commentaire SSE : garde la connexion ouverte à travers les proxys
+                yield ": ping\n\n"
+                idle = 0.0
+            if not job.is_active:
+                yield "event: end\ndata: {}\n\n"
+                return
+            await asyncio.sleep(JOB_STREAM_POLL_INTERVAL)
+            idle += JOB_STREAM_POLL_INTERVAL
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@staff_member_required
+def provider_stats(request):
+    """Mesures glissantes (appels, taux d'erreur, p50/p95) de chaque route fournisseur:modèle, par étape"""
+    router = get_ai_service().router
+    phases = ['', *router.phase_routes]
+    return JsonResponse({
+        'routes': router.stats(),
+        'candidates': {phase or 'default': [route.key for route in router.candidates(phase)] for phase in phases},
+    })
 
 # views.py - Vues pour les paramètres du profil
 
@@ -319,104 +462,29 @@ def delete_account(request):
 
 
 @login_required
-def create_random_game(request):
-    """Créer un jeu complètement aléatoire"""
-    limit, created = GenerationLimit.objects.get_or_create(user=request.user)
+async def create_random_game(request):
+    """Créer un jeu complètement aléatoire (vue asynchrone, la génération est mise en file d'attente)"""
+    user = await request.auser()
+    limit, created = await GenerationLimit.objects.aget_or_create(user=user)
     
-    if not limit.can_generate():
+    if await limit.aremaining() <= 0:
         messages.error(request, f'Vous avez atteint la limite de {limit.daily_count} générations par jour. Réessayez demain!')  #  Changé max_daily en daily_count
         return redirect('games:dashboard')
     
-    ai_service = AIService()
-    
-    # Générer des paramètres aléatoires
-    params = ai_service.generate_random_game_params()
+    # Jeu pré-généré disponible : attribution immédiate
+    game = await sync_to_async(claim_pool_game)(user)
+    if game:
+        messages.success(request, f'🎲 Jeu aléatoire « {game.titre} » prêt !')
+        return redirect('games:game_detail', game_id=game.id)
     
+    # Réserve vide : les paramètres aléatoires sont tirés par le worker
     try:
-        # Générer le jeu
-        keywords_list = [k.strip() for k in params['keywords'].split(',')]
-        titre = ai_service.generate_game_title(params['genre'], params['ambiance'], keywords_list)
-        
-        game = Game.objects.create(
-            titre=titre,
-            genre=params['genre'],
-            ambiance=params['ambiance'],
-            mots_cles=params['keywords'],
-            createur=request.user,
-            est_public=True
-        )
-        
-        # Générer le contenu
-        universe_data = ai_service.generate_universe(titre, params['genre'], params['ambiance'], params['keywords'])
-        Universe.objects.create(
-            game=game,
-            description=universe_data['description'],
-            style_graphique=universe_data['style_graphique'],
-            type_monde=universe_data['type_monde']
-        )
-        
-        # Générer l'image de couverture
-        image_result = ai_service.generate_and_save_image(
-            titre,
-            params['genre'],
-            params['ambiance'],
-            universe_data['description']
-        )
-        
-        # Créer le ConceptArt
-        concept_art = ConceptArt.objects.create(
-            game=game,
-            description=image_result['description'],
-            type_art="cover"
-        )
-        
-        # Sauvegarder l'image si elle a été générée
-        if image_result.get('image_data'):
-            concept_art.image.save(f"{game.id}_cover.png", image_result['image_data'], save=True)
-            print(f"✅ Image générée pour le jeu aléatoire '{titre}'")
-        else:
-            print(f"⚠️ Image non disponible pour '{titre}', description sauvegardée")
-        
-        scenario_data = ai_service.generate_scenario(titre, universe_data['description'], params['genre'])
-        Scenario.objects.create(
-            game=game,
-            acte_1=scenario_data['acte_1'],
-            acte_2=scenario_data['acte_2'],
-            acte_3=scenario_data['acte_3'],
-            twist=scenario_data['twist']
-        )
-        
-        characters_data = ai_service.generate_characters(titre, params['genre'], 3, params['ambiance'], params['keywords'], universe_data['description'])
-        for char_data in characters_data:
-            Character.objects.create(
-                game=game,
-                nom=char_data['nom'],
-                classe=char_data.get('classe', 'guerrier'),
-                role=char_data.get('role', 'allie'),
-                background=char_data['background']
-            )
-        
-        locations_data = ai_service.generate_locations(titre, universe_data['description'], 4, params['genre'], params['ambiance'], params['keywords'])
-        for loc_data in locations_data:
-            Location.objects.create(
-                game=game,
-                nom=loc_data['nom'],
-                description=loc_data['description']
-            )
-        
-        limit.increment()
-        
-        # Message différent selon si l'image a été générée
-        if image_result.get('image_data'):
-            messages.success(request, f'🎮 Jeu aléatoire "{titre}" créé avec image générée!')
-        else:
-            messages.success(request, f'🎮 Jeu aléatoire "{titre}" créé (description d\'image sauvegardée)!')
-        
-        return redirect('games:game_detail', game_id=game.id)
-        
-    except Exception as e:
-        messages.error(request, f'Erreur: {str(e)}')
+        job = await enqueue_generation_async(user, 'random', reserve_quota=True)
+    except QuotaExceeded:
+        messages.error(request, f'Vous avez atteint la limite de {limit.daily_count} générations par jour. Réessayez demain!')  #  Changé max_daily en daily_count
         return redirect('games:dashboard')
+    messages.info(request, '🎲 Génération aléatoire lancée !')
+    return redirect('games:job_status', job_id=job.id)
 
 
 @login_required
@@ -437,6 +505,29 @@ def delete_game(request, game_id):
     return render(request, 'games/confirm_delete.html', {'game': game})
 
 
+@login_required
+def regenerate_section(request, game_id, section):
+    """Régénérer une seule section d'un jeu (auteur uniquement, limite quotidienne de régénérations)"""
+    game = get_object_or_404(Game, id=game_id)
+    
+    if game.createur != request.user:
+        messages.error(request, 'Vous ne pouvez pas modifier ce jeu.')
+        return redirect('games:game_detail', game_id=game_id)
+    
+    sections = dict(REGENERABLE_SECTIONS)
+    if request.method != 'POST' or section not in sections:
+        return redirect('games:game_detail', game_id=game_id)
+    
+    try:
+        job = enqueue_generation(request.user, 'regenerate', {'game_id': game.id, 'section': section},
+                                 game=game, reserve_quota=True)
+    except QuotaExceeded:
+        messages.error(request, 'Vous avez atteint la limite de régénérations par jour. Réessayez demain!')
+        return redirect('games:game_detail', game_id=game_id)
+    messages.info(request, f'Régénération de la section « {sections[section]} » lancée !')
+    return redirect('games:job_status', job_id=job.id)
+
+
 @login_required
 def toggle_favorite(request, game_id):
     """Ajouter/retirer un jeu des favoris"""
@@ -444,14 +535,14 @@ def toggle_favorite(request, game_id):
     
     favorite, created = Favorite.objects.get_or_create(user=request.user, game=game)
     
+    # Compteur mis à jour en base sans enregistrer le jeu : un like ne change
+    # pas sa version (les likes sont rendus hors des fragments en cache)
     if created:
-        game.likes_count += 1
-        game.save()
+        Game.objects.filter(id=game.id).update(likes_count=F('likes_count') + 1, updated_at=timezone.now())
         messages.success(request, f'"{game.titre}" ajouté aux favoris!')
     else:
         favorite.delete()
-        game.likes_count -= 1
-        game.save()
+        Game.objects.filter(id=game.id).update(likes_count=F('likes_count') - 1, updated_at=timezone.now())
         messages.info(request, f'"{game.titre}" retiré des favoris.')
     
     return redirect('games:game_detail', game_id=game_id)
@@ -460,7 +551,8 @@ def toggle_favorite(request, game_id):
 @login_required
 def favorites(request):
     """Liste des jeux favoris"""
-    favorite_games = Game.objects.filter(favorited_by__user=request.user)
+    favorite_games = list(Game.objects.filter(favorited_by__user=request.user).select_related('createur'))
+    _attach_cards(favorite_games)
     return render(request, 'games/favorites.html', {'games': favorite_games})
 
 def _render_pdf_with_weasyprint(html, base_url):